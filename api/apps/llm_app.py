@@ -139,6 +139,7 @@ async def set_api_key():
                 api_base=llm_config["api_base"],
                 max_tokens=llm_config["max_tokens"],
             )
+    TenantLLMService.invalidate_model_pool(current_user.id)
 
     return get_json_result(data=True)
 
@@ -336,6 +337,7 @@ async def add_llm():
 
     if not TenantLLMService.filter_update([TenantLLM.tenant_id == current_user.id, TenantLLM.llm_factory == factory, TenantLLM.llm_name == llm["llm_name"]], llm):
         TenantLLMService.save(**llm)
+    TenantLLMService.invalidate_model_pool(current_user.id)
 
     return get_json_result(data=True)
 
@@ -346,6 +348,7 @@ async def add_llm():
 async def delete_llm():
     req = await get_request_json()
     TenantLLMService.filter_delete([TenantLLM.tenant_id == current_user.id, TenantLLM.llm_factory == req["llm_factory"], TenantLLM.llm_name == req["llm_name"]])
+    TenantLLMService.invalidate_model_pool(current_user.id)
     return get_json_result(data=True)
 
 
@@ -357,6 +360,7 @@ async def enable_llm():
     TenantLLMService.filter_update(
         [TenantLLM.tenant_id == current_user.id, TenantLLM.llm_factory == req["llm_factory"], TenantLLM.llm_name == req["llm_name"]], {"status": str(req.get("status", "1"))}
     )
+    TenantLLMService.invalidate_model_pool(current_user.id)
     return get_json_result(data=True)
 
 
@@ -366,6 +370,7 @@ async def enable_llm():
 async def delete_factory():
     req = await get_request_json()
     TenantLLMService.filter_delete([TenantLLM.tenant_id == current_user.id, TenantLLM.llm_factory == req["llm_factory"]])
+    TenantLLMService.invalidate_model_pool(current_user.id)
     return get_json_result(data=True)
 
 
@@ -502,6 +507,7 @@ async def set_fallback_config():
                  TenantLLM.llm_name == record.llm_name],
                 {"api_key": parsed.to_json_str()}
             )
+        TenantLLMService.invalidate_model_pool(current_user.id)
 
         return get_json_result(data=True)
     except Exception as e:
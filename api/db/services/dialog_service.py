@@ -22,7 +22,6 @@ from copy import deepcopy
 from datetime import datetime
 from functools import partial
 from timeit import default_timer as timer
-from langfuse import Langfuse
 from peewee import fn
 from api.db.services.file_service import FileService
 from common.constants import LLMType, ParserType, StatusEnum
@@ -30,10 +29,9 @@ from api.db.db_models import DB, Dialog
 from api.db.services.common_service import CommonService
 from api.db.services.doc_metadata_service import DocMetadataService
 from api.db.services.knowledgebase_service import KnowledgebaseService
-from api.db.services.langfuse_service import TenantLangfuseService
 from api.db.services.llm_service import LLMBundle
 from common.metadata_utils import apply_meta_data_filter
-from api.db.services.tenant_llm_service import TenantLLMService
+from api.db.services.tenant_llm_service import TenantLLMService, get_tenant_langfuse
 from common.time_utils import current_timestamp, datetime_format
 from rag.graphrag.general.mind_map_extractor import MindMapExtractor
 from rag.advanced_rag import DeepResearcher
@@ -44,6 +42,7 @@ from rag.prompts.generator import chunks_format, citation_prompt, cross_language
 from common.token_utils import num_tokens_from_string
 from rag.utils.tavily_conn import Tavily
 from common.string_utils import remove_redundant_spaces
+from common.misc_utils import thread_pool_exec
 from common import settings
 
 
@@ -293,79 +292,105 @@ async def async_chat(dialog, messages, stream=True, **kwargs):
 
     langfuse_tracer = None
     trace_context = {}
-    langfuse_keys = TenantLangfuseService.filter_by_tenant(tenant_id=dialog.tenant_id)
-    if langfuse_keys:
-        langfuse = Langfuse(public_key=langfuse_keys.public_key, secret_key=langfuse_keys.secret_key, host=langfuse_keys.host)
-        try:
-            if langfuse.auth_check():
-                langfuse_tracer = langfuse
-                trace_id = langfuse_tracer.create_trace_id()
-                trace_context = {"trace_id": trace_id}
-        except Exception:
-            # Skip langfuse tracing if connection fails
-            pass
+    langfuse = get_tenant_langfuse(dialog.tenant_id)
+    if langfuse:
+        langfuse_tracer = langfuse
+        trace_id = langfuse_tracer.create_trace_id()
+        trace_context = {"trace_id": trace_id}
 
     check_langfuse_tracer_ts = timer()
-    kbs, embd_mdl, rerank_mdl, chat_mdl, tts_mdl = get_models(dialog)
-    toolcall_session, tools = kwargs.get("toolcall_session"), kwargs.get("tools")
-    if toolcall_session and tools:
-        chat_mdl.bind_tools(toolcall_session, tools)
-    bind_models_ts = timer()
-
-    retriever = settings.retriever
-    questions = [m["content"] for m in messages if m["role"] == "user"][-3:]
-    attachments = kwargs["doc_ids"].split(",") if "doc_ids" in kwargs else []
-    attachments_= ""
-    if "doc_ids" in messages[-1]:
-        attachments = messages[-1]["doc_ids"]
-    if "files" in messages[-1]:
-        attachments_ = "\n\n".join(FileService.get_files(messages[-1]["files"]))
-
-    prompt_config = dialog.prompt_config
-    field_map = KnowledgebaseService.get_field_map(dialog.kb_ids)
-    logging.debug(f"field_map retrieved: {field_map}")
-    # try to use sql if field mapping is good to go
-    if field_map:
-        logging.debug("Use SQL to retrieval:{}".format(questions[-1]))
-        ans = await use_sql(questions[-1], field_map, dialog.tenant_id, chat_mdl, prompt_config.get("quote", True), dialog.kb_ids)
-        # For aggregate queries (COUNT, SUM, etc.), chunks may be empty but answer is still valid
-        if ans and (ans.get("reference", {}).get("chunks") or ans.get("answer")):
-            yield ans
-            return
-        else:
-            logging.debug("SQL failed or returned no results, falling back to vector search")
+    # The pre-retrieval stage runs as a small dependency graph: steps that don't need each
+    # other's output are started together, and each one's latency lands in stage_costs.
+    stage_costs = {}
 
-    param_keys = [p["key"] for p in prompt_config.get("parameters", [])]
-    logging.debug(f"attachments={attachments}, param_keys={param_keys}, embd_mdl={embd_mdl}")
-
-    for p in prompt_config["parameters"]:
-        if p["key"] == "knowledge":
-            continue
-        if p["key"] not in kwargs and not p["optional"]:
-            raise KeyError("Miss parameter: " + p["key"])
-        if p["key"] not in kwargs:
-            prompt_config["system"] = prompt_config["system"].replace("{%s}" % p["key"], " ")
-
-    if len(questions) > 1 and prompt_config.get("refine_multiturn"):
-        questions = [await full_question(dialog.tenant_id, dialog.llm_id, messages)]
-    else:
-        questions = questions[-1:]
-
-    if prompt_config.get("cross_languages"):
-        questions = [await cross_languages(dialog.tenant_id, dialog.llm_id, questions[0], prompt_config["cross_languages"])]
+    async def timed(name, aw):
+        st = timer()
+        try:
+            return await aw
+        finally:
+            stage_costs[name] = (timer() - st) * 1000
 
+    prompt_config = dialog.prompt_config
+    field_map_task = asyncio.create_task(timed("Field map", thread_pool_exec(KnowledgebaseService.get_field_map, dialog.kb_ids)))
+    stage_tasks = [field_map_task]
+    metas_task = None
     if dialog.meta_data_filter:
-        metas = DocMetadataService.get_flatted_meta_by_kbs(dialog.kb_ids)
-        attachments = await apply_meta_data_filter(
-            dialog.meta_data_filter,
-            metas,
-            questions[-1],
-            chat_mdl,
-            attachments,
-        )
+        metas_task = asyncio.create_task(timed("Load metadata", thread_pool_exec(DocMetadataService.get_flatted_meta_by_kbs, dialog.kb_ids)))
+        stage_tasks.append(metas_task)
+    try:
+        kbs, embd_mdl, rerank_mdl, chat_mdl, tts_mdl = await thread_pool_exec(get_models, dialog)
+        field_map = await field_map_task
+        toolcall_session, tools = kwargs.get("toolcall_session"), kwargs.get("tools")
+        if toolcall_session and tools:
+            chat_mdl.bind_tools(toolcall_session, tools)
+        bind_models_ts = timer()
+
+        retriever = settings.retriever
+        questions = [m["content"] for m in messages if m["role"] == "user"][-3:]
+        attachments = kwargs["doc_ids"].split(",") if "doc_ids" in kwargs else []
+        attachments_= ""
+        if "doc_ids" in messages[-1]:
+            attachments = messages[-1]["doc_ids"]
+        if "files" in messages[-1]:
+            attachments_ = "\n\n".join(FileService.get_files(messages[-1]["files"]))
+
+        logging.debug(f"field_map retrieved: {field_map}")
+        # try to use sql if field mapping is good to go
+        if field_map:
+            logging.debug("Use SQL to retrieval:{}".format(questions[-1]))
+            ans = await use_sql(questions[-1], field_map, dialog.tenant_id, chat_mdl, prompt_config.get("quote", True), dialog.kb_ids)
+            # For aggregate queries (COUNT, SUM, etc.), chunks may be empty but answer is still valid
+            if ans and (ans.get("reference", {}).get("chunks") or ans.get("answer")):
+                if metas_task:
+                    metas_task.cancel()
+                yield ans
+                return
+            else:
+                logging.debug("SQL failed or returned no results, falling back to vector search")
+
+        param_keys = [p["key"] for p in prompt_config.get("parameters", [])]
+        logging.debug(f"attachments={attachments}, param_keys={param_keys}, embd_mdl={embd_mdl}")
 
-    if prompt_config.get("keyword", False):
-        questions[-1] += await keyword_extraction(chat_mdl, questions[-1])
+        for p in prompt_config["parameters"]:
+            if p["key"] == "knowledge":
+                continue
+            if p["key"] not in kwargs and not p["optional"]:
+                raise KeyError("Miss parameter: " + p["key"])
+            if p["key"] not in kwargs:
+                prompt_config["system"] = prompt_config["system"].replace("{%s}" % p["key"], " ")
+
+        # Metadata keeps loading while the question is refined.
+        if len(questions) > 1 and prompt_config.get("refine_multiturn"):
+            questions = [await timed("Multi-turn refinement", full_question(dialog.tenant_id, dialog.llm_id, messages))]
+        else:
+            questions = questions[-1:]
+
+        if prompt_config.get("cross_languages"):
+            questions = [await timed("Cross languages", cross_languages(dialog.tenant_id, dialog.llm_id, questions[0], prompt_config["cross_languages"]))]
+
+        # Both the metadata filter and keyword extraction only need the refined question.
+        keywords_task = None
+        if prompt_config.get("keyword", False):
+            keywords_task = asyncio.create_task(timed("Keyword extraction", keyword_extraction(chat_mdl, questions[-1])))
+            stage_tasks.append(keywords_task)
+        if metas_task:
+            metas = await metas_task
+            attachments = await timed("Metadata filter", apply_meta_data_filter(
+                dialog.meta_data_filter,
+                metas,
+                questions[-1],
+                chat_mdl,
+                attachments,
+            ))
+        if keywords_task:
+            questions[-1] += await keywords_task
+    finally:
+        # Whichever way the stage is left (early answer, missing parameter, a failing step), the
+        # steps still running are cancelled and every task's outcome is collected.
+        for t in stage_tasks:
+            if not t.done():
+                t.cancel()
+        await asyncio.gather(*stage_tasks, return_exceptions=True)
 
     refine_question_ts = timer()
 
@@ -413,9 +438,11 @@ async def async_chat(dialog, messages, stream=True, **kwargs):
             await task
 
         else:
-            if embd_mdl:
+            question = " ".join(questions)
+
+            async def chunk_retrieval():
                 kbinfos = await retriever.retrieval(
-                    " ".join(questions),
+                    question,
                     embd_mdl,
                     tenant_ids,
                     dialog.kb_ids,
@@ -427,23 +454,40 @@ async def async_chat(dialog, messages, stream=True, **kwargs):
                     top=dialog.top_k,
                     aggs=True,
                     rerank_mdl=rerank_mdl,
-                    rank_feature=label_question(" ".join(questions), kbs),
+                    rank_feature=label_question(question, kbs),
                 )
                 if prompt_config.get("toc_enhance"):
-                    cks = await retriever.retrieval_by_toc(" ".join(questions), kbinfos["chunks"], tenant_ids, chat_mdl, dialog.top_n)
+                    cks = await retriever.retrieval_by_toc(question, kbinfos["chunks"], tenant_ids, chat_mdl, dialog.top_n)
                     if cks:
                         kbinfos["chunks"] = cks
-                kbinfos["chunks"] = retriever.retrieval_by_children(kbinfos["chunks"], tenant_ids)
+                kbinfos["chunks"] = await thread_pool_exec(retriever.retrieval_by_children, kbinfos["chunks"], tenant_ids)
+                return kbinfos
+
+            # Chunk retrieval, web search and KG retrieval are independent of each other.
+            retrievals = {}
+            if embd_mdl:
+                retrievals["chunks"] = timed("Chunk retrieval", chunk_retrieval())
             if prompt_config.get("tavily_api_key"):
-                tav = Tavily(prompt_config["tavily_api_key"])
-                tav_res = tav.retrieve_chunks(" ".join(questions))
-                kbinfos["chunks"].extend(tav_res["chunks"])
-                kbinfos["doc_aggs"].extend(tav_res["doc_aggs"])
+                retrievals["tavily"] = timed("Web search", thread_pool_exec(Tavily(prompt_config["tavily_api_key"]).retrieve_chunks, question))
             if prompt_config.get("use_kg"):
-                ck = await settings.kg_retriever.retrieval(" ".join(questions), tenant_ids, dialog.kb_ids, embd_mdl,
-                                                       LLMBundle(dialog.tenant_id, LLMType.CHAT))
-                if ck["content_with_weight"]:
-                    kbinfos["chunks"].insert(0, ck)
+                retrievals["kg"] = timed("KG retrieval", settings.kg_retriever.retrieval(question, tenant_ids, dialog.kb_ids, embd_mdl,
+                                                                                        LLMBundle(dialog.tenant_id, LLMType.CHAT)))
+            tasks = [asyncio.create_task(aw) for aw in retrievals.values()]
+            try:
+                results = dict(zip(retrievals.keys(), await asyncio.gather(*tasks)))
+            except Exception:
+                for t in tasks:
+                    t.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+
+            if "chunks" in results:
+                kbinfos = results["chunks"]
+            if "tavily" in results:
+                kbinfos["chunks"].extend(results["tavily"]["chunks"])
+                kbinfos["doc_aggs"].extend(results["tavily"]["doc_aggs"])
+            if "kg" in results and results["kg"]["content_with_weight"]:
+                kbinfos["chunks"].insert(0, results["kg"])
 
     knowledges = kb_prompt(kbinfos, max_tokens)
     logging.debug("{}->{}".format(" ".join(questions), "\n->".join(knowledges)))
@@ -471,7 +515,7 @@ async def async_chat(dialog, messages, stream=True, **kwargs):
         gen_conf["max_tokens"] = min(gen_conf["max_tokens"], max_tokens - used_token_count)
 
     def decorate_answer(answer):
-        nonlocal embd_mdl, prompt_config, knowledges, kwargs, kbinfos, prompt, retrieval_ts, questions, langfuse_tracer
+        nonlocal embd_mdl, prompt_config, knowledges, kwargs, kbinfos, prompt, retrieval_ts, questions, langfuse_tracer, stage_costs
 
         refs = []
         ans = answer.split("</think>")
@@ -522,6 +566,11 @@ async def async_chat(dialog, messages, stream=True, **kwargs):
         retrieval_time_cost = (retrieval_ts - refine_question_ts) * 1000
         generate_result_time_cost = (finish_chat_ts - retrieval_ts) * 1000
 
+        # Stages overlap, so their latencies don't add up to the totals above.
+        stage_breakdown = ""
+        if stage_costs:
+            stage_breakdown = "  - Stages(concurrent):\n" + "".join(f"    - {name}: {cost:.1f}ms\n" for name, cost in stage_costs.items())
+
         tk_num = num_tokens_from_string(think + answer)
         prompt += "\n\n### Query:\n%s" % " ".join(questions)
         prompt = (
@@ -533,6 +582,7 @@ async def async_chat(dialog, messages, stream=True, **kwargs):
             f"  - Bind models: {bind_embedding_time_cost:.1f}ms\n"
             f"  - Query refinement(LLM): {refine_question_time_cost:.1f}ms\n"
             f"  - Retrieval: {retrieval_time_cost:.1f}ms\n"
+            f"{stage_breakdown}"
             f"  - Generate answer: {generate_result_time_cost:.1f}ms\n\n"
             "## Token usage:\n"
             f"  - Generated tokens(approximately): {tk_num}\n"
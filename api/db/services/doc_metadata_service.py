@@ -22,17 +22,32 @@ This is the SOLE source of truth for document metadata - MySQL meta_fields colum
 
 import json
 import logging
+import os
 import re
 from copy import deepcopy
 from typing import Dict, List, Optional
 
 from api.db.db_models import DB, Document
 from common import settings
-from common.metadata_utils import dedupe_list
+from common.cache_utils import LRUCache
+from common.metadata_utils import MetadataIndex, dedupe_list
 from api.db.db_models import Knowledgebase
 from common.doc_store.doc_store_base import OrderByExpr
 
 
+# Per-KB inverted metadata indexes, see get_flatted_meta_by_kbs. An index is tagged with the KB's
+# metadata version, a Redis counter bumped by every metadata write. Every write also logs the
+# document's new metadata under its version, so a process whose index is behind (e.g. the API
+# server, after the task executor wrote) replays the changes; it is only rebuilt once the
+# META_CHANGE_LOG_SIZE last changes no longer cover the gap.
+META_INDEX_CACHE_SIZE = int(os.environ.get("META_INDEX_CACHE_SIZE", 64))
+META_CHANGE_LOG_SIZE = int(os.environ.get("META_CHANGE_LOG_SIZE", 1000))
+META_INDEX_PAGE_SIZE = 5000
+_META_VERSION_PREFIX = "doc_meta:ver:"
+_META_LOG_PREFIX = "doc_meta:log:"
+_meta_indexes = LRUCache(maxsize=META_INDEX_CACHE_SIZE)
+
+
 class DocMetadataService:
     """Service for managing document metadata in ES/Infinity"""
 
@@ -320,6 +335,7 @@ class DocMetadataService:
                 except Exception as e:
                     logging.warning(f"Failed to refresh metadata index {index_name}: {e}")
             
+            cls._on_metadata_changed(kb_id, doc_id, doc_meta["meta_fields"])
             logging.debug(f"Successfully inserted metadata for document {doc_id}")
             return True
 
@@ -375,6 +391,7 @@ class DocMetadataService:
                         refresh=True,  # Make changes immediately visible
                         doc={"meta_fields": processed_meta}
                     )
+                    cls._on_metadata_changed(kb_id, doc_id, processed_meta)
                     logging.debug(f"Successfully updated metadata for document {doc_id} using ES partial update")
                     return True
                 except Exception as e:
@@ -459,6 +476,7 @@ class DocMetadataService:
                 kb_id  # Pass actual kb_id (delete() will handle metadata tables correctly)
             )
             logging.debug(f"[METADATA DELETE] Deleted count: {deleted_count}")
+            cls._on_metadata_changed(kb_id, doc_id, None)
 
             # Only check if table should be dropped if not skipped (for bulk operations)
             # Note: delete operation already uses refresh=True, so data is immediately available
@@ -682,75 +700,147 @@ class DocMetadataService:
             return {}
 
     @classmethod
-    @DB.connection_context()
-    def get_flatted_meta_by_kbs(cls, kb_ids: List[str]) -> Dict:
-        """
-        Get flattened metadata for documents in knowledge bases.
-
-        - Parses stringified JSON meta_fields when possible and skips non-dict or unparsable values.
-        - Expands list values into individual entries.
-          Example: {"tags": ["foo","bar"], "author": "alice"} ->
-            meta["tags"]["foo"] = [doc_id], meta["tags"]["bar"] = [doc_id], meta["author"]["alice"] = [doc_id]
-        Prefer for metadata_condition filtering and scenarios that must respect list semantics.
+    def _meta_versions(cls, kb_ids: List[str]) -> Optional[List[str]]:
+        from rag.utils.redis_conn import REDIS_CONN
 
-        Args:
-            kb_ids: List of knowledge base IDs
+        if not REDIS_CONN.is_alive():
+            return None
+        return [v or "0" for v in REDIS_CONN.get_many([_META_VERSION_PREFIX + kb_id for kb_id in kb_ids])]
 
-        Returns:
-            Metadata dictionary in format: {field_name: {value: [doc_ids]}}
+    @classmethod
+    def _on_metadata_changed(cls, kb_id: str, doc_id: str, meta_fields: Optional[Dict]):
+        """
+        Bump the KB's metadata version and log the change under it. If this process holds the
+        index of the previous version, the change is applied to it in place instead of dropping it.
         """
+        from rag.utils.redis_conn import REDIS_CONN
+
+        cached = _meta_indexes.pop(kb_id)
+        entry = json.dumps({"doc_id": doc_id, "meta_fields": meta_fields or None}, ensure_ascii=False, default=str)
         try:
-            # Get tenant_id from first KB
-            kb = Knowledgebase.get_by_id(kb_ids[0])
-            if not kb:
-                return {}
+            version = REDIS_CONN.versioned_append(_META_VERSION_PREFIX + kb_id, _META_LOG_PREFIX + kb_id, entry, META_CHANGE_LOG_SIZE)
+        except Exception as e:
+            logging.warning(f"Failed to bump metadata version of KB {kb_id}: {e}")
+            return
+        if not cached or cached[0] != str(version - 1):
+            return
+        cls._apply_change(cached[1], doc_id, meta_fields)
+        _meta_indexes.set(kb_id, (str(version), cached[1]))
 
-            tenant_id = kb.tenant_id
-            index_name = cls._get_doc_meta_index_name(tenant_id)
+    @staticmethod
+    def _apply_change(index: MetadataIndex, doc_id: str, meta_fields: Optional[Dict]):
+        if meta_fields:
+            index.set_document(doc_id, meta_fields)
+        else:
+            index.remove_document(doc_id)
 
-            condition = {"kb_id": kb_ids}
-            order_by = OrderByExpr()
+    @classmethod
+    def _replay_changes(cls, kb_id: str, cached, version: str) -> Optional[MetadataIndex]:
+        """Bring a cached index up to `version` from the change log, or None if it can't be."""
+        from rag.utils.redis_conn import REDIS_CONN
+
+        if not cached or not cached[0].isdigit() or not version.isdigit() or int(cached[0]) >= int(version):
+            return None
+        entries = REDIS_CONN.versioned_entries(_META_LOG_PREFIX + kb_id, int(cached[0]), int(version))
+        if entries is None:
+            return None
+        index = cached[1]
+        for entry in entries:
+            change = json.loads(entry)
+            cls._apply_change(index, change["doc_id"], change["meta_fields"])
+        return index
 
-            # Query with large limit
+    @classmethod
+    @DB.connection_context()
+    def _build_metadata_index(cls, kb_id: str) -> MetadataIndex:
+        """Load every metadata row of the KB, paging by document id instead of truncating at the search limit."""
+        index = MetadataIndex()
+        kb = Knowledgebase.get_by_id(kb_id)
+        if not kb:
+            return index
+        index_name = cls._get_doc_meta_index_name(kb.tenant_id)
+        if not settings.docStoreConn.index_exist(index_name, ""):
+            return index
+
+        doc_ids = [d.id for d in Document.select(Document.id).where(Document.kb_id == kb_id)]
+        for i in range(0, len(doc_ids), META_INDEX_PAGE_SIZE):
+            page = doc_ids[i:i + META_INDEX_PAGE_SIZE]
             results = settings.docStoreConn.search(
-                select_fields=["*"],  # Get all fields
+                select_fields=["*"],
                 highlight_fields=[],
-                condition=condition,
+                condition={"kb_id": kb_id, "id": page},
                 match_expressions=[],
-                order_by=order_by,
+                order_by=OrderByExpr(),
                 offset=0,
-                limit=10000,
+                limit=len(page),
                 index_names=index_name,
-                knowledgebase_ids=kb_ids
+                knowledgebase_ids=[kb_id]
             )
+            for doc_id, doc in cls._iter_search_results(results):
+                index.set_document(doc_id, cls._extract_metadata(doc))
+        logging.debug(f"[_build_metadata_index] KB: {kb_id}, indexed {len(index)}/{len(doc_ids)} documents")
+        return index
 
-            logging.debug(f"[get_flatted_meta_by_kbs] index_name: {index_name}, kb_ids: {kb_ids}")
-            logging.debug(f"[get_flatted_meta_by_kbs] results type: {type(results)}")
-
-            # Aggregate metadata
-            meta = {}
+    @classmethod
+    def get_metadata_index(cls, kb_ids: List[str]) -> MetadataIndex:
+        """
+        Inverted metadata index over the KBs, served from the per-process cache while the
+        KBs' metadata versions are unchanged.
+        """
+        kb_ids = list(dict.fromkeys(kb_ids))
+        versions = cls._meta_versions(kb_ids)
+        if versions is None:
+            # Redis can't tell whether a cached index is current.
+            return MetadataIndex.merge([cls._build_metadata_index(kb_id) for kb_id in kb_ids])
+
+        if len(kb_ids) > 1:
+            merged_key = ("merged", tuple(kb_ids), tuple(versions))
+            merged = _meta_indexes.get(merged_key)
+            if merged is not None:
+                return merged
+
+        indexes = []
+        for kb_id, version in zip(kb_ids, versions):
+            cached = _meta_indexes.get(kb_id)
+            if cached and cached[0] == version:
+                indexes.append(cached[1])
+                continue
+            index = cls._replay_changes(kb_id, cached, version)
+            if index is None:
+                index = cls._build_metadata_index(kb_id)
+            _meta_indexes.set(kb_id, (version, index))
+            indexes.append(index)
+
+        if len(kb_ids) == 1:
+            return indexes[0]
+        merged = MetadataIndex.merge(indexes)
+        _meta_indexes.set(merged_key, merged)
+        return merged
 
-            # Use helper to iterate over results in any format
-            for doc_id, doc in cls._iter_search_results(results):
-                # Extract metadata fields (exclude system fields)
-                doc_meta = cls._extract_metadata(doc)
+    @classmethod
+    def get_flatted_meta_by_kbs(cls, kb_ids: List[str]) -> Dict:
+        """
+        Get flattened metadata for documents in knowledge bases.
 
-                for k, v in doc_meta.items():
-                    if k not in meta:
-                        meta[k] = {}
+        - Parses stringified JSON meta_fields when possible and skips non-dict or unparsable values.
+        - Expands list values into individual entries.
+          Example: {"tags": ["foo","bar"], "author": "alice"} ->
+            meta["tags"]["foo"] = [doc_id], meta["tags"]["bar"] = [doc_id], meta["author"]["alice"] = [doc_id]
+        Prefer for metadata_condition filtering and scenarios that must respect list semantics.
 
-                    values = v if isinstance(v, list) else [v]
-                    for vv in values:
-                        if vv is None:
-                            continue
-                        sv = str(vv)
-                        if sv not in meta[k]:
-                            meta[k][sv] = []
-                        meta[k][sv].append(doc_id)
+        The result comes from the cached inverted index (see get_metadata_index), is shared
+        between callers and must not be modified. meta_filter evaluates it on the index bitmaps.
 
-            logging.debug(f"[get_flatted_meta_by_kbs] KBs: {kb_ids}, Returning metadata: {meta}")
-            return meta
+        Args:
+            kb_ids: List of knowledge base IDs
 
+        Returns:
+            Metadata dictionary in format: {field_name: {value: [doc_ids]}}
+        """
+        if not kb_ids:
+            return {}
+        try:
+            return cls.get_metadata_index(kb_ids).flatted()
         except Exception as e:
             logging.error(f"Error getting flattened metadata for KBs {kb_ids}: {e}")
             return {}
@@ -38,6 +38,7 @@ from common.misc_utils import get_uuid
 from common.time_utils import current_timestamp, get_format_time
 from common.constants import LLMType, ParserType, StatusEnum, TaskStatus, SVR_CONSUMER_GROUP_NAME
 from rag.nlp import rag_tokenizer, search
+from rag.utils.raptor_utils import raptor_tree_id
 from rag.utils.redis_conn import REDIS_CONN
 from common.doc_store.doc_store_base import OrderByExpr
 from common import settings
@@ -396,6 +397,12 @@ class DocumentService(CommonService):
         except Exception as e:
             logging.error(f"Failed to delete chunks from doc store for document {doc.id}: {e}")
 
+        # The RAPTOR tree of the document is filed under the fake doc id (non-critical)
+        try:
+            settings.docStoreConn.delete({"id": raptor_tree_id(doc.id)}, search.index_name(tenant_id), doc.kb_id)
+        except Exception as e:
+            logging.warning(f"Failed to delete the RAPTOR tree of document {doc.id}: {e}")
+
         # Delete document metadata (non-critical, log and continue)
         try:
             DocMetadataService.delete_document_metadata(doc.id)
@@ -21,7 +21,7 @@ from datetime import datetime
 
 from api.db.db_utils import bulk_insert_into_db
 from deepdoc.parser import PdfParser
-from peewee import JOIN
+from peewee import JOIN, fn
 from api.db.db_models import DB, File2Document, File
 from api.db import FileType
 from api.db.db_models import Task, Document, Knowledgebase, Tenant
@@ -220,6 +220,22 @@ class TaskService(CommonService):
         """
         cls.model.update(chunk_ids=chunk_ids).where(cls.model.id == id).execute()
 
+    @classmethod
+    @DB.connection_context()
+    def append_chunk_ids(cls, id: str, chunk_ids: str):
+        """Append chunk IDs to those already recorded for a task.
+
+        Unlike update_chunk_ids, the statement only carries the new IDs, so recording
+        the chunks of a large document bulk by bulk stays linear in its chunk count.
+
+        Args:
+            id (str): The unique identifier of the task.
+            chunk_ids (str): Space-separated string of chunk identifiers to append.
+        """
+        cls.model.update(
+            chunk_ids=fn.CONCAT(fn.COALESCE(cls.model.chunk_ids, ""), " ", chunk_ids)
+        ).where(cls.model.id == id).execute()
+
     @classmethod
     @DB.connection_context()
     def get_ongoing_doc_name(cls):
@@ -13,12 +13,18 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import atexit
+import copy
 import os
 import json
 import logging
+import threading
+import time
+from collections import defaultdict
 from peewee import IntegrityError
 from langfuse import Langfuse
 from common import settings
+from common.cache_utils import LRUCache
 from common.constants import MINERU_DEFAULT_CONFIG, MINERU_ENV_KEYS, PADDLEOCR_DEFAULT_CONFIG, PADDLEOCR_ENV_KEYS, LLMType
 from api.db.db_models import DB, LLMFactories, TenantLLM
 from api.db.services.common_service import CommonService
@@ -26,6 +32,43 @@ from api.db.services.langfuse_service import TenantLangfuseService
 from api.db.services.user_service import TenantService
 from rag.llm import ChatModel, CvModel, EmbeddingModel, OcrModel, RerankModel, Seq2txtModel, TTSModel
 
+# Model configs, model instances (with their HTTP clients) and Langfuse clients are pooled per process.
+# Entries are keyed by the tenant's LLM config version, a Redis counter bumped by
+# TenantLLMService.invalidate_model_pool() whenever the tenant's models or Langfuse keys change;
+# MODEL_POOL_TTL bounds staleness when Redis can't tell. MODEL_POOL_SIZE=0 disables pooling.
+MODEL_POOL_SIZE = int(os.environ.get("MODEL_POOL_SIZE", 256))
+MODEL_POOL_TTL = int(os.environ.get("MODEL_POOL_TTL", 600))
+_TENANT_LLM_VERSION_PREFIX = "tenant_llm:ver:"
+_model_configs = LRUCache(maxsize=MODEL_POOL_SIZE, ttl=MODEL_POOL_TTL)
+_model_instances = LRUCache(maxsize=MODEL_POOL_SIZE, ttl=MODEL_POOL_TTL)
+_langfuse_clients = LRUCache(maxsize=MODEL_POOL_SIZE, ttl=MODEL_POOL_TTL)
+
+
+def _tenant_llm_version(tenant_id) -> str:
+    from rag.utils.redis_conn import REDIS_CONN
+
+    return REDIS_CONN.get(_TENANT_LLM_VERSION_PREFIX + str(tenant_id)) or "0"
+
+
+def get_tenant_langfuse(tenant_id):
+    """The tenant's authenticated Langfuse client, or None if it has none or the auth check fails."""
+    key = (tenant_id, _tenant_llm_version(tenant_id))
+    if key in _langfuse_clients:
+        return _langfuse_clients.get(key)
+
+    langfuse = None
+    langfuse_keys = TenantLangfuseService.filter_by_tenant(tenant_id=tenant_id)
+    if langfuse_keys:
+        client = Langfuse(public_key=langfuse_keys.public_key, secret_key=langfuse_keys.secret_key, host=langfuse_keys.host)
+        try:
+            if client.auth_check():
+                langfuse = client
+        except Exception:
+            # Skip langfuse tracing if connection fails
+            pass
+    _langfuse_clients.set(key, langfuse)
+    return langfuse
+
 
 class LLMFactoriesService(CommonService):
     model = LLMFactories
@@ -85,8 +128,31 @@ class TenantLLMService(CommonService):
         return model_name, None
 
     @classmethod
-    @DB.connection_context()
+    def invalidate_model_pool(cls, tenant_id):
+        """Drop the pooled model configs and instances of `tenant_id` in every process."""
+        from rag.utils.redis_conn import REDIS_CONN
+
+        try:
+            REDIS_CONN.incrby(_TENANT_LLM_VERSION_PREFIX + str(tenant_id), 1)
+        except Exception as e:
+            logging.warning(f"Failed to bump LLM config version of tenant {tenant_id}: {e}")
+        # Entries of this process are dropped right away, whatever Redis says.
+        _model_configs.clear()
+        _model_instances.clear()
+        _langfuse_clients.clear()
+
+    @classmethod
     def get_model_config(cls, tenant_id, llm_type, llm_name=None):
+        key = (tenant_id, str(llm_type), llm_name, _tenant_llm_version(tenant_id))
+        model_config = _model_configs.get(key)
+        if model_config is None:
+            model_config = cls._get_model_config(tenant_id, llm_type, llm_name)
+            _model_configs.set(key, model_config)
+        return copy.deepcopy(model_config)
+
+    @classmethod
+    @DB.connection_context()
+    def _get_model_config(cls, tenant_id, llm_type, llm_name=None):
         from api.db.services.llm_service import LLMService
 
         e, tenant = TenantService.get_by_id(tenant_id)
@@ -132,9 +198,25 @@ class TenantLLMService(CommonService):
         return model_config
 
     @classmethod
-    @DB.connection_context()
     def model_instance(cls, tenant_id, llm_type, llm_name=None, lang="Chinese", **kwargs):
         model_config = TenantLLMService.get_model_config(tenant_id, llm_type, llm_name)
+        key = json.dumps(
+            [str(llm_type), lang, model_config["llm_factory"], model_config["llm_name"], model_config["api_key"], model_config.get("api_base"), kwargs],
+            sort_keys=True,
+            default=str,
+        )
+        mdl = _model_instances.get(key)
+        if mdl is None:
+            mdl = cls._build_model_instance(model_config, llm_type, lang, **kwargs)
+            if mdl is None:
+                return None
+            _model_instances.set(key, mdl)
+        # A shallow copy shares the provider clients and their connection pools, while
+        # per-bundle state such as bound tools stays private to the caller.
+        return copy.copy(mdl)
+
+    @classmethod
+    def _build_model_instance(cls, model_config, llm_type, lang="Chinese", **kwargs):
         kwargs.update({"provider": model_config["llm_factory"]})
         if llm_type == LLMType.EMBEDDING.value:
             if model_config["llm_factory"] not in EmbeddingModel:
@@ -182,13 +264,54 @@ class TenantLLMService(CommonService):
         return None
 
     @classmethod
-    @DB.connection_context()
     def increase_usage(cls, tenant_id, llm_type, used_tokens, llm_name=None):
+        if TOKEN_USAGE_FLUSH_INTERVAL > 0:
+            token_usage_accumulator.add(tenant_id, llm_type, used_tokens, llm_name)
+            return True
+        return cls._increase_usage(tenant_id, llm_type, used_tokens, llm_name)
+
+    @classmethod
+    @DB.connection_context()
+    def _increase_usage(cls, tenant_id, llm_type, used_tokens, llm_name=None):
         e, tenant = TenantService.get_by_id(tenant_id)
         if not e:
             logging.error(f"Tenant not found: {tenant_id}")
             return 0
+        try:
+            return cls._update_usage(tenant, llm_type, used_tokens, llm_name)
+        except Exception:
+            logging.exception("TenantLLMService.increase_usage got exception,Failed to update used_tokens for tenant_id=%s, llm_name=%s", tenant_id, llm_name)
+            return 0
+
+    @classmethod
+    @DB.connection_context()
+    def apply_usage(cls, usage: dict) -> set:
+        """
+        Write aggregated token usage, {(tenant_id, llm_type, llm_name): used_tokens}, one row per
+        transaction so a failing row doesn't hold back the others. Returns the keys that are done
+        with: written, or dropped because their tenant or model type is unknown.
+        """
+        done = set()
+        tenants = {}
+        for key, used_tokens in usage.items():
+            tenant_id, llm_type, llm_name = key
+            try:
+                if tenant_id not in tenants:
+                    e, tenant = TenantService.get_by_id(tenant_id)
+                    tenants[tenant_id] = tenant if e else None
+                if not tenants[tenant_id]:
+                    logging.error(f"Tenant not found: {tenant_id}")
+                    done.add(key)
+                    continue
+                with DB.atomic():
+                    cls._update_usage(tenants[tenant_id], llm_type, used_tokens, llm_name or None)
+                done.add(key)
+            except Exception:
+                logging.exception("TenantLLMService.apply_usage failed to update used_tokens for tenant_id=%s, llm_name=%s", tenant_id, llm_name)
+        return done
 
+    @classmethod
+    def _update_usage(cls, tenant, llm_type, used_tokens, llm_name=None):
         llm_map = {
             LLMType.EMBEDDING.value: tenant.embd_id if not llm_name else llm_name,
             LLMType.SPEECH2TEXT.value: tenant.asr_id,
@@ -205,18 +328,11 @@ class TenantLLMService(CommonService):
             return 0
 
         llm_name, llm_factory = TenantLLMService.split_model_name_and_factory(mdlnm)
-
-        try:
-            num = (
-                cls.model.update(used_tokens=cls.model.used_tokens + used_tokens)
-                .where(cls.model.tenant_id == tenant_id, cls.model.llm_name == llm_name, cls.model.llm_factory == llm_factory if llm_factory else True)
-                .execute()
-            )
-        except Exception:
-            logging.exception("TenantLLMService.increase_usage got exception,Failed to update used_tokens for tenant_id=%s, llm_name=%s", tenant_id, llm_name)
-            return 0
-
-        return num
+        return (
+            cls.model.update(used_tokens=cls.model.used_tokens + used_tokens)
+            .where(cls.model.tenant_id == tenant.id, cls.model.llm_name == llm_name, cls.model.llm_factory == llm_factory if llm_factory else True)
+            .execute()
+        )
 
     @classmethod
     @DB.connection_context()
@@ -545,6 +661,95 @@ class FallbackExecutor:
         return result
 
 
+class TokenUsageAccumulator:
+    """
+    Coalesces TenantLLMService.increase_usage calls per (tenant, llm_type, llm_name).
+
+    Every call is added to a Redis hash right away, so the usage outlives a crash of the
+    process. Every `interval` seconds, and at exit, the process holding the flush lock writes
+    the hash to the DB and deducts from it what was committed. A crash between the commit and
+    the deduction counts that usage twice rather than losing it. Usage that can't reach Redis
+    is kept in memory and written directly.
+    """
+
+    JOURNAL_KEY = "llm_usage:journal"
+    FLUSH_LOCK_KEY = "llm_usage:flush"
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._pending = defaultdict(int)
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def add(self, tenant_id, llm_type, used_tokens, llm_name=None):
+        if not used_tokens:
+            return
+        from rag.utils.redis_conn import REDIS_CONN
+
+        key = (tenant_id, str(llm_type), llm_name or "")
+        try:
+            REDIS_CONN.REDIS.hincrby(self.JOURNAL_KEY, json.dumps(key), used_tokens)
+            journaled = True
+        except Exception as e:
+            logging.warning(f"Failed to journal token usage in Redis, keeping it in memory: {e}")
+            journaled = False
+        with self._lock:
+            if not journaled:
+                self._pending[key] += used_tokens
+            # Started lazily, and again in a forked child which doesn't inherit the thread.
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name="token_usage_flusher", daemon=True).start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logging.exception("TokenUsageAccumulator.flush got exception")
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+        if pending:
+            done = TenantLLMService.apply_usage(pending)
+            with self._lock:
+                for k, v in pending.items():
+                    if k not in done:
+                        self._pending[k] += v
+        self._flush_journal()
+
+    def _flush_journal(self):
+        from rag.utils.redis_conn import REDIS_CONN, RedisDistributedLock
+
+        lock = RedisDistributedLock(self.FLUSH_LOCK_KEY, timeout=60)
+        try:
+            if not lock.acquire():
+                # Another process is writing the journal.
+                return
+        except Exception as e:
+            logging.warning(f"Failed to lock the token usage journal: {e}")
+            return
+        try:
+            fields = {}
+            for field, v in (REDIS_CONN.REDIS.hgetall(self.JOURNAL_KEY) or {}).items():
+                if int(v) > 0:
+                    fields[tuple(json.loads(field))] = (field, int(v))
+            if not fields:
+                return
+            done = TenantLLMService.apply_usage({k: v for k, (_, v) in fields.items()})
+            REDIS_CONN.hash_deduct(self.JOURNAL_KEY, dict(fields[k] for k in done))
+        finally:
+            lock.release()
+
+
+# TOKEN_USAGE_FLUSH_INTERVAL=0 writes token usage synchronously on every model call.
+TOKEN_USAGE_FLUSH_INTERVAL = float(os.environ.get("TOKEN_USAGE_FLUSH_INTERVAL", 5))
+token_usage_accumulator = TokenUsageAccumulator(TOKEN_USAGE_FLUSH_INTERVAL)
+
+
 class LLM4Tenant:
     def __init__(self, tenant_id, llm_type, llm_name=None, lang="Chinese", **kwargs):
         self.tenant_id = tenant_id
@@ -558,15 +763,7 @@ class LLM4Tenant:
         self.is_tools = model_config.get("is_tools", False)
         self.verbose_tool_use = kwargs.get("verbose_tool_use")
 
-        langfuse_keys = TenantLangfuseService.filter_by_tenant(tenant_id=tenant_id)
-        self.langfuse = None
-        if langfuse_keys:
-            langfuse = Langfuse(public_key=langfuse_keys.public_key, secret_key=langfuse_keys.secret_key, host=langfuse_keys.host)
-            try:
-                if langfuse.auth_check():
-                    self.langfuse = langfuse
-                    trace_id = self.langfuse.create_trace_id()
-                    self.trace_context = {"trace_id": trace_id}
-            except Exception:
-                # Skip langfuse tracing if connection fails
-                pass
+        self.langfuse = get_tenant_langfuse(tenant_id)
+        if self.langfuse:
+            trace_id = self.langfuse.create_trace_id()
+            self.trace_context = {"trace_id": trace_id}
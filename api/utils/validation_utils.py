@@ -333,6 +333,7 @@ class RaptorConfig(Base):
     threshold: Annotated[float, Field(default=0.1, ge=0.0, le=1.0)]
     max_cluster: Annotated[int, Field(default=64, ge=1, le=1024)]
     random_seed: Annotated[int, Field(default=0, ge=0)]
+    incremental: Annotated[bool, Field(default=False)]
     auto_disable_for_structured_data: Annotated[bool, Field(default=True)]
 
 
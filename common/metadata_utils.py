@@ -15,6 +15,7 @@
 #
 import ast
 import logging
+import threading
 from typing import Any, Callable, Dict
 
 import json_repair
@@ -39,104 +40,111 @@ def convert_conditions(metadata_condition):
     ]
 
 
-def meta_filter(metas: dict, filters: list[dict], logic: str = "and"):
-    doc_ids = set([])
-
-    def filter_out(v2docs, operator, value):
-        ids = []
-        for input, docids in v2docs.items():
-
-            if operator in ["=", "≠", ">", "<", "≥", "≤"]:
-                # Check if input is in YYYY-MM-DD date format
-                input_str = str(input).strip()
-                value_str = str(value).strip()
-
-                # Strict date format detection: YYYY-MM-DD (must be 10 chars with correct format)
-                is_input_date = (
-                    len(input_str) == 10 and
-                    input_str[4] == '-' and
-                    input_str[7] == '-' and
-                    input_str[:4].isdigit() and
-                    input_str[5:7].isdigit() and
-                    input_str[8:10].isdigit()
-                )
-
-                is_value_date = (
-                    len(value_str) == 10 and
-                    value_str[4] == '-' and
-                    value_str[7] == '-' and
-                    value_str[:4].isdigit() and
-                    value_str[5:7].isdigit() and
-                    value_str[8:10].isdigit()
-                )
-
-                if is_value_date:
-                    # Query value is in date format
-                    if is_input_date:
-                        # Data is also in date format: perform date comparison
-                        input = input_str
-                        value = value_str
-                    else:
-                        # Data is not in date format: skip this record (no match)
-                        continue
+def match_meta_values(v2docs, operator, value) -> list:
+    """Return the keys of `v2docs` (metadata values) that satisfy `operator` against `value`."""
+    keys = []
+    for input in v2docs:
+        key = input
+
+        if operator in ["=", "≠", ">", "<", "≥", "≤"]:
+            # Check if input is in YYYY-MM-DD date format
+            input_str = str(input).strip()
+            value_str = str(value).strip()
+
+            # Strict date format detection: YYYY-MM-DD (must be 10 chars with correct format)
+            is_input_date = (
+                len(input_str) == 10 and
+                input_str[4] == '-' and
+                input_str[7] == '-' and
+                input_str[:4].isdigit() and
+                input_str[5:7].isdigit() and
+                input_str[8:10].isdigit()
+            )
+
+            is_value_date = (
+                len(value_str) == 10 and
+                value_str[4] == '-' and
+                value_str[7] == '-' and
+                value_str[:4].isdigit() and
+                value_str[5:7].isdigit() and
+                value_str[8:10].isdigit()
+            )
+
+            if is_value_date:
+                # Query value is in date format
+                if is_input_date:
+                    # Data is also in date format: perform date comparison
+                    input = input_str
+                    value = value_str
                 else:
-                    # Query value is not in date format: use original logic
-                    try:
-                        if isinstance(input, list):
-                            input = input[0]
-                        input = ast.literal_eval(input)
-                        value = ast.literal_eval(value)
-                    except Exception:
-                        pass
-
-                    # Convert strings to lowercase
-                    if isinstance(input, str):
-                        input = input.lower()
-                    if isinstance(value, str):
-                        value = value.lower()
+                    # Data is not in date format: skip this record (no match)
+                    continue
             else:
-                # Non-comparison operators: maintain original logic
+                # Query value is not in date format: use original logic
+                try:
+                    if isinstance(input, list):
+                        input = input[0]
+                    input = ast.literal_eval(input)
+                    value = ast.literal_eval(value)
+                except Exception:
+                    pass
+
+                # Convert strings to lowercase
                 if isinstance(input, str):
                     input = input.lower()
                 if isinstance(value, str):
                     value = value.lower()
+        else:
+            # Non-comparison operators: maintain original logic
+            if isinstance(input, str):
+                input = input.lower()
+            if isinstance(value, str):
+                value = value.lower()
 
-            matched = False
-            try:
-                if operator == "contains":
-                    matched = str(input).find(value) >= 0 if not isinstance(input, list) else any(str(i).find(value) >= 0 for i in input)
-                elif operator == "not contains":
-                    matched = str(input).find(value) == -1 if not isinstance(input, list) else all(str(i).find(value) == -1 for i in input)
-                elif operator == "in":
-                    matched = input in value if not isinstance(input, list) else all(i in value for i in input)
-                elif operator == "not in":
-                    matched = input not in value if not isinstance(input, list) else all(i not in value for i in input)
-                elif operator == "start with":
-                    matched = str(input).lower().startswith(str(value).lower()) if not isinstance(input, list) else "".join([str(i).lower() for i in input]).startswith(str(value).lower())
-                elif operator == "end with":
-                    matched = str(input).lower().endswith(str(value).lower()) if not isinstance(input, list) else "".join([str(i).lower() for i in input]).endswith(str(value).lower())
-                elif operator == "empty":
-                    matched = not input
-                elif operator == "not empty":
-                    matched = bool(input)
-                elif operator == "=":
-                    matched = input == value
-                elif operator == "≠":
-                    matched = input != value
-                elif operator == ">":
-                    matched = input > value
-                elif operator == "<":
-                    matched = input < value
-                elif operator == "≥":
-                    matched = input >= value
-                elif operator == "≤":
-                    matched = input <= value
-            except Exception:
-                pass
-
-            if matched:
-                ids.extend(docids)
-        return ids
+        matched = False
+        try:
+            if operator == "contains":
+                matched = str(input).find(value) >= 0 if not isinstance(input, list) else any(str(i).find(value) >= 0 for i in input)
+            elif operator == "not contains":
+                matched = str(input).find(value) == -1 if not isinstance(input, list) else all(str(i).find(value) == -1 for i in input)
+            elif operator == "in":
+                matched = input in value if not isinstance(input, list) else all(i in value for i in input)
+            elif operator == "not in":
+                matched = input not in value if not isinstance(input, list) else all(i not in value for i in input)
+            elif operator == "start with":
+                matched = str(input).lower().startswith(str(value).lower()) if not isinstance(input, list) else "".join([str(i).lower() for i in input]).startswith(str(value).lower())
+            elif operator == "end with":
+                matched = str(input).lower().endswith(str(value).lower()) if not isinstance(input, list) else "".join([str(i).lower() for i in input]).endswith(str(value).lower())
+            elif operator == "empty":
+                matched = not input
+            elif operator == "not empty":
+                matched = bool(input)
+            elif operator == "=":
+                matched = input == value
+            elif operator == "≠":
+                matched = input != value
+            elif operator == ">":
+                matched = input > value
+            elif operator == "<":
+                matched = input < value
+            elif operator == "≥":
+                matched = input >= value
+            elif operator == "≤":
+                matched = input <= value
+        except Exception:
+            pass
+
+        if matched:
+            keys.append(key)
+    return keys
+
+
+def meta_filter(metas: dict, filters: list[dict], logic: str = "and"):
+    index = getattr(metas, "index", None)
+    if isinstance(index, MetadataIndex):
+        return index.filter(filters, logic)
+
+    doc_ids = set([])
 
     for f in filters:
         k = f["key"]
@@ -145,7 +153,7 @@ def meta_filter(metas: dict, filters: list[dict], logic: str = "and"):
             ids = []
         else:
             v2docs = metas[k]
-            ids = filter_out(v2docs, f["op"], f["value"])
+            ids = [doc_id for key in match_meta_values(v2docs, f["op"], f["value"]) for doc_id in v2docs[key]]
 
         if not doc_ids:
             doc_ids = set(ids)
@@ -341,3 +349,141 @@ def turn2jsonschema(obj: dict | list) -> Dict[str, Any]:
             normalized.append(normalized_item)
         return metadata_schema(normalized)
     return {}
+
+
+class FlattenedMetadata(dict):
+    """
+    {field: {value: [doc_ids]}} built from a MetadataIndex, which meta_filter evaluates
+    directly. Shared between callers, so it must not be modified.
+    """
+
+    def __init__(self, index: "MetadataIndex", *args):
+        super().__init__(*args)
+        self.index = index
+
+
+class MetadataIndex:
+    """
+    Inverted index of document metadata: field -> value -> bitmap of document positions.
+
+    Values are flattened the way filters see them: list values are expanded, None is skipped
+    and every value is keyed by its str(). Bitmaps are plain ints, so a filter condition is an
+    OR over the bitmaps of the values it matches and conditions combine with & and |.
+    """
+
+    def __init__(self):
+        self._doc_ids: list = []  # position -> doc id, None once removed
+        self._positions: dict[str, int] = {}
+        self._doc_entries: dict[int, tuple[list, list]] = {}  # position -> (fields, [(field, value)])
+        self._postings: dict[str, dict[str, int]] = {}
+        self._field_docs: dict[str, int] = {}
+        self._flatted = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._positions)
+
+    def set_document(self, doc_id: str, meta: dict):
+        with self._lock:
+            self._remove(doc_id)
+            if not isinstance(meta, dict) or not meta:
+                return
+            entries = []
+            for k, v in meta.items():
+                for vv in v if isinstance(v, list) else [v]:
+                    if vv is not None and (k, str(vv)) not in entries:
+                        entries.append((k, str(vv)))
+            self._add(doc_id, list(meta.keys()), entries)
+
+    def remove_document(self, doc_id: str):
+        with self._lock:
+            self._remove(doc_id)
+            # Removed positions stay as holes in the bitmaps; repack once they dominate.
+            if len(self._doc_ids) > 1024 and len(self._doc_ids) > 2 * len(self._positions):
+                docs = self._documents()
+                self.__init__()
+                for doc in docs:
+                    self._add(*doc)
+
+    def _add(self, doc_id, fields, entries):
+        self._flatted = None
+        pos = len(self._doc_ids)
+        self._doc_ids.append(doc_id)
+        self._positions[doc_id] = pos
+        for k in fields:
+            self._postings.setdefault(k, {})
+            self._field_docs[k] = self._field_docs.get(k, 0) + 1
+        for k, sv in entries:
+            self._postings[k][sv] = self._postings[k].get(sv, 0) | (1 << pos)
+        self._doc_entries[pos] = (fields, entries)
+
+    def _remove(self, doc_id):
+        pos = self._positions.pop(doc_id, None)
+        if pos is None:
+            return
+        self._flatted = None
+        self._doc_ids[pos] = None
+        fields, entries = self._doc_entries.pop(pos)
+        mask = ~(1 << pos)
+        for k, sv in entries:
+            values = self._postings[k]
+            values[sv] &= mask
+            if not values[sv]:
+                del values[sv]
+        for k in fields:
+            self._field_docs[k] -= 1
+            if not self._field_docs[k]:
+                del self._field_docs[k]
+                del self._postings[k]
+
+    def _documents(self) -> list:
+        return [(self._doc_ids[pos], fields, entries) for pos, (fields, entries) in sorted(self._doc_entries.items())]
+
+    def _decode(self, bitmap: int) -> list[str]:
+        bits = bin(bitmap)[:1:-1]
+        ids = []
+        i = bits.find("1")
+        while i >= 0:
+            ids.append(self._doc_ids[i])
+            i = bits.find("1", i + 1)
+        return ids
+
+    def flatted(self) -> FlattenedMetadata:
+        with self._lock:
+            if self._flatted is None:
+                self._flatted = FlattenedMetadata(self, {
+                    k: {sv: self._decode(bitmap) for sv, bitmap in values.items()} for k, values in self._postings.items()
+                })
+            return self._flatted
+
+    def filter(self, filters: list[dict], logic: str = "and") -> list[str]:
+        """Same semantics as meta_filter over the flattened metadata, evaluated on bitmaps."""
+        with self._lock:
+            result = 0
+            for f in filters:
+                values = self._postings.get(f["key"])
+                bitmap = 0
+                if values:
+                    for sv in match_meta_values(values, f["op"], f["value"]):
+                        bitmap |= values[sv]
+
+                if not result:
+                    result = bitmap
+                elif logic == "and":
+                    result &= bitmap
+                    if not result:
+                        return []
+                else:
+                    result |= bitmap
+            return self._decode(result)
+
+    @classmethod
+    def merge(cls, indexes: list["MetadataIndex"]) -> "MetadataIndex":
+        merged = cls()
+        for index in indexes:
+            with index._lock:
+                docs = index._documents()
+            for doc_id, fields, entries in docs:
+                merged._remove(doc_id)
+                merged._add(doc_id, fields, entries)
+        return merged
@@ -18,6 +18,7 @@ import asyncio
 import logging
 import math
 import os
+import queue
 import random
 import re
 import sys
@@ -39,6 +40,7 @@ from sklearn.metrics import silhouette_score
 from common.file_utils import get_project_base_directory
 from common.misc_utils import pip_install_torch
 from deepdoc.vision import OCR, AscendLayoutRecognizer, LayoutRecognizer, Recognizer, TableStructureRecognizer
+from deepdoc.vision.ocr import OCR_DET_BATCH_SIZE, ocr_stats
 from rag.nlp import rag_tokenizer
 from rag.prompts.generator import vision_llm_describe_prompt
 from common import settings
@@ -51,6 +53,65 @@ LOCK_KEY_pdfplumber = "global_shared_lock_pdfplumber"
 if LOCK_KEY_pdfplumber not in sys.modules:
     sys.modules[LOCK_KEY_pdfplumber] = threading.Lock()
 
+# Render, OCR and release the pages one by one instead of rendering the whole range first.
+PDF_PAGE_STREAMING = os.environ.get("PDF_PAGE_STREAMING", "false").lower() in ["true", "1", "yes"]
+# Max pages rendered but not OCRed yet, when streaming.
+PDF_PAGE_WINDOW = max(1, int(os.environ.get("PDF_PAGE_WINDOW", "4")))
+_page_cache_lock = threading.Lock()
+
+# Build the boxes of born-digital pages from their chars, running OCR on their figures only.
+PDF_TEXT_LAYER_FAST_PATH = os.environ.get("PDF_TEXT_LAYER_FAST_PATH", "false").lower() in ["true", "1", "yes"]
+PDF_TEXT_LAYER_MIN_CHARS = int(os.environ.get("PDF_TEXT_LAYER_MIN_CHARS", "32"))
+# Share of the page's ink that neither chars, rules nor figures account for.
+PDF_TEXT_LAYER_MAX_UNCOVERED_INK = float(os.environ.get("PDF_TEXT_LAYER_MAX_UNCOVERED_INK", "0.05"))
+# Share of the page area taken by figures.
+PDF_TEXT_LAYER_MAX_FIGURE_RATIO = float(os.environ.get("PDF_TEXT_LAYER_MAX_FIGURE_RATIO", "0.5"))
+
+# Detect the pages OCR_DET_BATCH_SIZE at a time and recognize the crops of many pages together.
+OCR_CROSS_PAGE_BATCH = os.environ.get("OCR_CROSS_PAGE_BATCH", "false").lower() in ["true", "1", "yes"]
+# Crops waiting for recognition before they are recognized, bounding their memory.
+OCR_MAX_PENDING_CROPS = int(os.environ.get("OCR_MAX_PENDING_CROPS", "1024"))
+
+
+class EncodedPageImage:
+    """
+    A rendered page kept as lossless PNG once OCRed, when streaming.
+
+    It stands in for the PIL image in `page_images`: `size` is kept aside, anything
+    else decodes the page. The last few decoded pages are shared through `cache`, since
+    cropping visits the same page many times in a row.
+    """
+
+    def __init__(self, img: Image.Image, cache):
+        buf = BytesIO()
+        img.save(buf, format="PNG", compress_level=1)
+        self._png = buf.getvalue()
+        self._cache = cache
+        self.size = img.size
+        self.width, self.height = img.size
+        self.mode = img.mode
+
+    def decode(self) -> Image.Image:
+        with _page_cache_lock:
+            img = self._cache.pop(id(self), None)
+            if img is not None:
+                # Most recently used last.
+                self._cache[id(self)] = img
+                return img
+        img = Image.open(BytesIO(self._png))
+        img.load()
+        with _page_cache_lock:
+            self._cache[id(self)] = img
+            while len(self._cache) > PDF_PAGE_WINDOW:
+                self._cache.pop(next(iter(self._cache)))
+        return img
+
+    def __getattr__(self, name):
+        return getattr(self.decode(), name)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.decode(), dtype=dtype)
+
 
 class RAGFlowPdfParser:
     def __init__(self, **kwargs):
@@ -582,10 +643,177 @@ class RAGFlowPdfParser:
 
             logging.info(f"Added {added} OCR results from rotated table {table_index}")
 
-    def __ocr(self, pagenum, img, chars, ZM=3, device_id: int | None = None):
+    @staticmethod
+    def _page_graphics(page):
+        """
+        Figure regions (images and vector drawings, merged when they overlap) and rules
+        (lines and rectangle edges) of a pdfplumber page, as (x0, top, x1, bottom).
+        """
+        regions = []
+        for o in page.images + page.curves:
+            r = [o["x0"], o["top"], o["x1"], o["bottom"]]
+            i = 0
+            while i < len(regions):
+                a = regions[i]
+                if a[0] <= r[2] and r[0] <= a[2] and a[1] <= r[3] and r[1] <= a[3]:
+                    r = [min(a[0], r[0]), min(a[1], r[1]), max(a[2], r[2]), max(a[3], r[3])]
+                    regions.pop(i)
+                    i = 0
+                    continue
+                i += 1
+            regions.append(r)
+
+        rules = [(o["x0"], o["top"], o["x1"], o["bottom"]) for o in page.lines]
+        for o in page.rects:
+            x0, top, x1, bott = o["x0"], o["top"], o["x1"], o["bottom"]
+            rules.extend([(x0, top, x1, top), (x0, bott, x1, bott), (x0, top, x0, bott), (x1, top, x1, bott)])
+        return [tuple(r) for r in regions], rules
+
+    def _text_layer_reliable(self, pagenum, img, chars, ZM):
+        """
+        Whether the chars of the page can stand in for OCR: enough of them, hardly any
+        undecodable glyph or vertical text, figures not taking most of the page, and the
+        ink of the rendered page explained by chars, rules and figures.
+        """
+        if len(chars) < PDF_TEXT_LAYER_MIN_CHARS or pagenum > len(self.page_graphics) or self.page_graphics[pagenum - 1] is None:
+            return False
+        if sum(1 for c in chars if "(cid:" in c["text"] or "\ufffd" in c["text"]) > len(chars) * 0.02:
+            return False
+        if sum(1 for c in chars if not c.get("upright", True)) > len(chars) * 0.1:
+            return False
+
+        regions, rules = self.page_graphics[pagenum - 1]
+        width, height = img.size[0] / ZM, img.size[1] / ZM
+        if sum((r[2] - r[0]) * (r[3] - r[1]) for r in regions) > width * height * PDF_TEXT_LAYER_MAX_FIGURE_RATIO:
+            return False
+
+        # A quarter of the rendering resolution is plenty to tell where ink is.
+        scale = ZM / 4
+        ink = np.asarray(img.convert("L").reduce(4)) < 160
+        total = ink.sum()
+        if not total:
+            return True
+        covered = np.zeros_like(ink)
+        for x0, top, x1, bott in [(c["x0"], c["top"], c["x1"], c["bottom"]) for c in chars] + rules + regions:
+            covered[max(0, int(top * scale) - 1) : int(bott * scale) + 2, max(0, int(x0 * scale) - 1) : int(x1 * scale) + 2] = True
+        return (ink & ~covered).sum() <= total * PDF_TEXT_LAYER_MAX_UNCOVERED_INK
+
+    @staticmethod
+    def _text_layer_boxes(chars, pagenum):
+        """Line up the chars of a page and cut the lines into boxes at wide gaps, like the detector does."""
+        lines = []
+        for c in sorted(chars, key=lambda c: (c["top"], c["x0"])):
+            if not c["text"]:
+                continue
+            for ln in reversed(lines[-8:]):
+                overlap = min(ln["bottom"], c["bottom"]) - max(ln["top"], c["top"])
+                if overlap >= 0.5 * max(min(ln["bottom"] - ln["top"], c["bottom"] - c["top"]), 1e-6):
+                    ln["chars"].append(c)
+                    ln["top"], ln["bottom"] = min(ln["top"], c["top"]), max(ln["bottom"], c["bottom"])
+                    break
+            else:
+                lines.append({"top": c["top"], "bottom": c["bottom"], "chars": [c]})
+
+        bxs = []
+        for ln in lines:
+            b, prev = None, None
+            for c in sorted(ln["chars"], key=lambda c: c["x0"]):
+                if b and c["x0"] - prev["x1"] > 1.2 * max(c["bottom"] - c["top"], prev["bottom"] - prev["top"]):
+                    bxs.append(b)
+                    b = None
+                if not b:
+                    b = {"x0": c["x0"], "x1": c["x1"], "top": c["top"], "bottom": c["bottom"], "text": "", "page_number": pagenum}
+                elif c["text"] == " ":
+                    if b["text"] and re.match(r"[0-9a-zA-Zа-яА-Я,.?;:!%%]", b["text"][-1]):
+                        b["text"] += " "
+                    continue
+                elif (
+                    not b["text"].endswith(" ")
+                    and re.match(r"[0-9a-zA-Z,.:;!%]+", prev["text"] + c["text"])
+                    and c["x0"] - prev["x1"] >= min(c["width"], prev["width"]) / 2
+                ):
+                    b["text"] += " "
+                b["text"] += c["text"]
+                b["x0"], b["x1"] = min(b["x0"], c["x0"]), max(b["x1"], c["x1"])
+                b["top"], b["bottom"] = min(b["top"], c["top"]), max(b["bottom"], c["bottom"])
+                prev = c
+            if b:
+                bxs.append(b)
+        for b in bxs:
+            b["text"] = b["text"].strip()
+        return [b for b in bxs if b["text"]]
+
+    def __text_layer_ocr(self, pagenum, img, ZM=3, device_id: int | None = None):
+        """Boxes of a page with a reliable text layer (see `_text_layer_reliable`): from its chars, plus OCR of its figures."""
+        start = timer()
+        chars = self.page_chars[pagenum - 1]
+        bxs = Recognizer.sort_Y_firstly(self._text_layer_boxes(chars, pagenum), np.median([c["height"] for c in chars]) / 3)
+        boxes_to_reg = []
+        img_np = np.array(img)
+        for x0, top, x1, bott in self.page_graphics[pagenum - 1][0]:
+            left, right = max(0, int(x0 * ZM)), min(img_np.shape[1], int(x1 * ZM))
+            top, bott = max(0, int(top * ZM)), min(img_np.shape[0], int(bott * ZM))
+            if right - left < 16 or bott - top < 16:
+                continue
+            for pts, _ in self.ocr.detect(img_np[top:bott, left:right], device_id) or []:
+                pts = np.array(pts, dtype=np.float32) + np.array([left, top], dtype=np.float32)
+                b = {"x0": pts[0][0] / ZM, "x1": pts[1][0] / ZM, "top": pts[0][1] / ZM, "bottom": pts[-1][1] / ZM, "text": "", "page_number": pagenum}
+                if b["x0"] > b["x1"] or b["top"] > b["bottom"]:
+                    continue
+                # Text drawn over the figure is already in the chars.
+                ii = Recognizer.find_overlapped(b, bxs)
+                if ii is not None and Recognizer.overlapped_area(b, bxs[ii]) > 0.5:
+                    continue
+                b["box_image"] = self.ocr.get_rotate_crop_image(img_np, pts)
+                boxes_to_reg.append(b)
+        texts = self.ocr.recognize_batch([b["box_image"] for b in boxes_to_reg], device_id) if boxes_to_reg else []
+        for b, t in zip(boxes_to_reg, texts):
+            b["text"] = t
+            del b["box_image"]
+        bxs = Recognizer.sort_Y_firstly(bxs + [b for b in boxes_to_reg if b["text"]], np.median([c["height"] for c in chars]) / 3)
+        if self.mean_height[pagenum - 1] == 0:
+            self.mean_height[pagenum - 1] = np.median([b["bottom"] - b["top"] for b in bxs])
+        self.boxes.append(bxs)
+        logging.info(f"__text_layer_ocr {len(chars)} chars, {len(boxes_to_reg)} figure boxes cost ({timer() - start}s)")
+
+    def __ocr_pages(self, pages, ZM, pending):
+        """
+        OCR of several (pagenum, img, chars): the pages needing detection are detected in one
+        batch, and their crops are left in `pending` for `__recognize_pending`.
+        """
+        text_layer = [PDF_TEXT_LAYER_FAST_PATH and self._text_layer_reliable(pn, img, self.page_chars[pn - 1], ZM) for pn, img, _ in pages]
         start = timer()
-        bxs = self.ocr.detect(np.array(img), device_id)
-        logging.info(f"__ocr detecting boxes of a image cost ({timer() - start}s)")
+        detected = iter(self.ocr.detect_batch([np.array(img) for (_, img, _), t in zip(pages, text_layer) if not t]))
+        logging.info(f"__ocr_pages detecting boxes of {text_layer.count(False)} images cost ({timer() - start}s)")
+        for (pn, img, chars), t in zip(pages, text_layer):
+            if t:
+                self.__text_layer_ocr(pn, img, ZM)
+            else:
+                self.__ocr(pn, img, chars, ZM, bxs=next(detected), pending=pending)
+
+    def __recognize_pending(self, pending, device_id: int | None = None):
+        """Recognize the crops `__ocr` left in `pending`, all pages together, and finish their pages."""
+        start = timer()
+        boxes_to_reg = [b for _, reg, _ in pending for b in reg]
+        texts = self.ocr.recognize_batch([b["box_image"] for b in boxes_to_reg], device_id) if boxes_to_reg else []
+        for b, t in zip(boxes_to_reg, texts):
+            b["text"] = t
+            del b["box_image"]
+        for pagenum, _, bxs in pending:
+            bxs[:] = [b for b in bxs if b["text"]]
+            if self.mean_height[pagenum - 1] == 0:
+                self.mean_height[pagenum - 1] = np.median([b["bottom"] - b["top"] for b in bxs])
+        logging.info(f"__recognize_pending {len(boxes_to_reg)} boxes of {len(pending)} pages cost {timer() - start}s")
+        pending.clear()
+
+    def __ocr(self, pagenum, img, chars, ZM=3, device_id: int | None = None, bxs=None, pending=None):
+        if bxs is None:
+            if PDF_TEXT_LAYER_FAST_PATH and self._text_layer_reliable(pagenum, img, self.page_chars[pagenum - 1], ZM):
+                self.__text_layer_ocr(pagenum, img, ZM, device_id)
+                return
+            start = timer()
+            bxs = self.ocr.detect(np.array(img), device_id)
+            logging.info(f"__ocr detecting boxes of a image cost ({timer() - start}s)")
 
         start = timer()
         if not bxs:
@@ -637,6 +865,11 @@ class RAGFlowPdfParser:
                 b["box_image"] = self.ocr.get_rotate_crop_image(img_np, np.array([[left, top], [right, top], [right, bott], [left, bott]], dtype=np.float32))
                 boxes_to_reg.append(b)
             del b["txt"]
+        if pending is not None:
+            # The page is finished by __recognize_pending, along with other pages.
+            pending.append((pagenum, boxes_to_reg, bxs))
+            self.boxes.append(bxs)
+            return
         texts = self.ocr.recognize_batch([b["box_image"] for b in boxes_to_reg], device_id)
         for i in range(len(boxes_to_reg)):
             boxes_to_reg[i]["text"] = texts[i]
@@ -1378,6 +1611,104 @@ class RAGFlowPdfParser:
         except Exception:
             logging.exception("total_page_number")
 
+    def __open_page_stream(self, fnm, page_from, page_to):
+        """Open the PDF for `__stream_pages` and read the chars and outlines, holding the pdfplumber lock one page at a time."""
+        lock = sys.modules[LOCK_KEY_pdfplumber]
+        self.pdf = None
+        self.page_images = []
+        self.page_chars = []
+        self.outlines = []
+        self._page_cache = {}
+        try:
+            with lock:
+                self.pdf = pdfplumber.open(fnm) if isinstance(fnm, str) else pdfplumber.open(BytesIO(fnm))
+                self.total_page = len(self.pdf.pages)
+        except Exception as e:
+            logging.exception(f"RAGFlowPdfParser __images__, exception: {e}")
+            return
+
+        self._stream_pages = range(page_from, min(page_to, self.total_page))
+        for pn in self._stream_pages:
+            with lock:
+                page = self.pdf.pages[pn]
+                try:
+                    self.page_chars.append([c for c in page.dedupe_chars().chars if self._has_color(c)])
+                except Exception as e:
+                    logging.warning(f"Failed to extract characters for page {pn}: {str(e)}")
+                    self.page_chars.append([])
+                if PDF_TEXT_LAYER_FAST_PATH:
+                    try:
+                        self.page_graphics.append(self._page_graphics(page))
+                    except Exception as e:
+                        logging.warning(f"Failed to extract graphics for page {pn}: {str(e)}")
+                        self.page_graphics.append(None)
+                # Drops the parsed layout objects once what we need is out.
+                page.close()
+        self.page_images = [None] * len(self._stream_pages)
+
+        # Same document as pdfplumber's, no need to parse the file a second time.
+        try:
+            with lock:
+                for level, title, *_ in self.pdf.doc.get_outlines():
+                    self.outlines.append((title, level - 1))
+        except Exception as e:
+            logging.warning(f"Outlines exception: {e}")
+
+    async def __stream_pages(self, zoomin, window):
+        """
+        Yield (index, image) of the pages opened by `__open_page_stream`.
+
+        A thread renders the next page while the current one is being OCRed. A slot of
+        `window` is taken for every page yielded and given back once the page is OCRed,
+        so at most PDF_PAGE_WINDOW raw pages are alive at a time.
+        """
+        if self.pdf is None:
+            return
+        lock = sys.modules[LOCK_KEY_pdfplumber]
+        rendered = queue.Queue(maxsize=1)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    rendered.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def render():
+            try:
+                for i, pn in enumerate(self._stream_pages):
+                    with lock:
+                        page = self.pdf.pages[pn]
+                        img = page.to_image(resolution=72 * zoomin, antialias=True).annotated
+                        page.close()
+                    if not put((i, img)):
+                        return
+                put(None)
+            except Exception as e:
+                put(e)
+
+        renderer = threading.Thread(target=render, name="pdf_page_renderer", daemon=True)
+        renderer.start()
+        try:
+            while True:
+                await window.acquire()
+                item = await thread_pool_exec(rendered.get)
+                if item is None:
+                    window.release()
+                    return
+                if isinstance(item, Exception):
+                    window.release()
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            await thread_pool_exec(renderer.join)
+            with lock:
+                self.pdf.close()
+
     def __images__(self, fnm, zoomin=3, page_from=0, page_to=299, callback=None):
         self.lefted_chars = []
         self.mean_height = []
@@ -1386,44 +1717,54 @@ class RAGFlowPdfParser:
         self.garbages = {}
         self.page_cum_height = [0]
         self.page_layout = []
+        self.page_graphics = []
         self.page_from = page_from
         start = timer()
-        try:
-            with sys.modules[LOCK_KEY_pdfplumber]:
-                with pdfplumber.open(fnm) if isinstance(fnm, str) else pdfplumber.open(BytesIO(fnm)) as pdf:
-                    self.pdf = pdf
-                    self.page_images = [p.to_image(resolution=72 * zoomin, antialias=True).annotated for i, p in enumerate(self.pdf.pages[page_from:page_to])]
+        if PDF_PAGE_STREAMING:
+            self.__open_page_stream(fnm, page_from, page_to)
+        else:
+            try:
+                with sys.modules[LOCK_KEY_pdfplumber]:
+                    with pdfplumber.open(fnm) if isinstance(fnm, str) else pdfplumber.open(BytesIO(fnm)) as pdf:
+                        self.pdf = pdf
+                        self.page_images = [p.to_image(resolution=72 * zoomin, antialias=True).annotated for i, p in enumerate(self.pdf.pages[page_from:page_to])]
 
-                    try:
-                        self.page_chars = [[c for c in page.dedupe_chars().chars if self._has_color(c)] for page in self.pdf.pages[page_from:page_to]]
-                    except Exception as e:
-                        logging.warning(f"Failed to extract characters for pages {page_from}-{page_to}: {str(e)}")
-                        self.page_chars = [[] for _ in range(page_to - page_from)]  # If failed to extract, using empty list instead.
+                        try:
+                            self.page_chars = [[c for c in page.dedupe_chars().chars if self._has_color(c)] for page in self.pdf.pages[page_from:page_to]]
+                        except Exception as e:
+                            logging.warning(f"Failed to extract characters for pages {page_from}-{page_to}: {str(e)}")
+                            self.page_chars = [[] for _ in range(page_to - page_from)]  # If failed to extract, using empty list instead.
 
-                    self.total_page = len(self.pdf.pages)
+                        if PDF_TEXT_LAYER_FAST_PATH:
+                            try:
+                                self.page_graphics = [self._page_graphics(page) for page in self.pdf.pages[page_from:page_to]]
+                            except Exception as e:
+                                logging.warning(f"Failed to extract graphics for pages {page_from}-{page_to}: {str(e)}")
 
-        except Exception as e:
-            logging.exception(f"RAGFlowPdfParser __images__, exception: {e}")
-        logging.info(f"__images__ dedupe_chars cost {timer() - start}s")
+                        self.total_page = len(self.pdf.pages)
 
-        self.outlines = []
-        try:
-            with pdf2_read(fnm if isinstance(fnm, str) else BytesIO(fnm)) as pdf:
-                self.pdf = pdf
+            except Exception as e:
+                logging.exception(f"RAGFlowPdfParser __images__, exception: {e}")
+            logging.info(f"__images__ dedupe_chars cost {timer() - start}s")
 
-                outlines = self.pdf.outline
+            self.outlines = []
+            try:
+                with pdf2_read(fnm if isinstance(fnm, str) else BytesIO(fnm)) as pdf:
+                    self.pdf = pdf
 
-                def dfs(arr, depth):
-                    for a in arr:
-                        if isinstance(a, dict):
-                            self.outlines.append((a["/Title"], depth))
-                            continue
-                        dfs(a, depth + 1)
+                    outlines = self.pdf.outline
 
-                dfs(outlines, 0)
+                    def dfs(arr, depth):
+                        for a in arr:
+                            if isinstance(a, dict):
+                                self.outlines.append((a["/Title"], depth))
+                                continue
+                            dfs(a, depth + 1)
 
-        except Exception as e:
-            logging.warning(f"Outlines exception: {e}")
+                    dfs(outlines, 0)
+
+            except Exception as e:
+                logging.warning(f"Outlines exception: {e}")
 
         if not self.outlines:
             logging.warning("Miss outlines")
@@ -1438,7 +1779,7 @@ class RAGFlowPdfParser:
         else:
             self.is_english = False
 
-        async def __img_ocr(i, id, img, chars, limiter):
+        def __space_chars(chars):
             j = 0
             while j + 1 < len(chars):
                 if (
@@ -1450,15 +1791,47 @@ class RAGFlowPdfParser:
                     chars[j]["text"] += " "
                 j += 1
 
-            if limiter:
-                async with limiter:
-                    await thread_pool_exec(self.__ocr, i + 1, img, chars, zoomin, id)
-            else:
-                self.__ocr(i + 1, img, chars, zoomin, id)
+        async def __img_ocr(i, id, img, chars, limiter):
+            __space_chars(chars)
+            try:
+                if limiter:
+                    async with limiter:
+                        await thread_pool_exec(self.__ocr, i + 1, img, chars, zoomin, id)
+                else:
+                    self.__ocr(i + 1, img, chars, zoomin, id)
+                if PDF_PAGE_STREAMING:
+                    self.page_images[i] = await thread_pool_exec(EncodedPageImage, img, self._page_cache)
+            finally:
+                if PDF_PAGE_STREAMING:
+                    window.release()
 
             if callback and i % 6 == 5:
                 callback((i + 1) * 0.6 / len(self.page_images))
 
+        async def __img_ocr_group(group, pending):
+            try:
+                for _, _, chars in group:
+                    __space_chars(chars)
+                self.__ocr_pages([(i + 1, img, chars) for i, img, chars in group], zoomin, pending)
+                if PDF_PAGE_STREAMING:
+                    for i, img, _ in group:
+                        self.page_images[i] = await thread_pool_exec(EncodedPageImage, img, self._page_cache)
+            finally:
+                if PDF_PAGE_STREAMING:
+                    for _ in group:
+                        window.release()
+            group.clear()
+            if sum(len(reg) for _, reg, _ in pending) >= OCR_MAX_PENDING_CROPS:
+                self.__recognize_pending(pending)
+
+        async def __pages():
+            if PDF_PAGE_STREAMING:
+                async for i, img in self.__stream_pages(zoomin, window):
+                    yield i, img
+                return
+            for i, img in enumerate(self.page_images):
+                yield i, img
+
         async def __img_ocr_launcher():
             def __ocr_preprocess():
                 chars = self.page_chars[i] if not self.is_english else []
@@ -1470,7 +1843,7 @@ class RAGFlowPdfParser:
             if self.parallel_limiter:
                 tasks = []
 
-                for i, img in enumerate(self.page_images):
+                async for i, img in __pages():
                     chars = __ocr_preprocess()
 
                     semaphore = self.parallel_limiter[i % settings.PARALLEL_DEVICES]
@@ -1496,16 +1869,31 @@ class RAGFlowPdfParser:
                     await asyncio.gather(*tasks, return_exceptions=True)
                     raise
 
+            elif OCR_CROSS_PAGE_BATCH:
+                # Streamed pages stay alive until their group is OCRed, the group must fit in the window.
+                group_size = min(OCR_DET_BATCH_SIZE, PDF_PAGE_WINDOW) if PDF_PAGE_STREAMING else OCR_DET_BATCH_SIZE
+                group, pending = [], []
+                async for i, img in __pages():
+                    group.append((i, img, __ocr_preprocess()))
+                    if len(group) >= group_size:
+                        await __img_ocr_group(group, pending)
+                    if callback and i % 6 == 5:
+                        callback((i + 1) * 0.6 / len(self.page_images))
+                if group:
+                    await __img_ocr_group(group, pending)
+                self.__recognize_pending(pending)
+
             else:
-                for i, img in enumerate(self.page_images):
+                async for i, img in __pages():
                     chars = __ocr_preprocess()
                     await __img_ocr(i, 0, img, chars, None)
 
         start = timer()
+        window = asyncio.Semaphore(PDF_PAGE_WINDOW) if PDF_PAGE_STREAMING else None
 
         asyncio.run(__img_ocr_launcher())
 
-        logging.info(f"__images__ {len(self.page_images)} pages cost {timer() - start}s")
+        logging.info(f"__images__ {len(self.page_images)} pages cost {timer() - start}s, OCR throughput: {ocr_stats()}")
 
         if not self.is_english and not any([c for c in self.page_chars]) and self.boxes:
             bxes = [b for bxs in self.boxes for b in bxs]
@@ -342,16 +342,18 @@ class AscendLayoutRecognizer(Recognizer):
 
         assert len(image_list) == len(ocr_res)
 
-        images = [np.array(im) if not isinstance(im, np.ndarray) else im for im in image_list]
         layouts_all_pages = []  # list of list[{"type","score","bbox":[x1,y1,x2,y2]}]
+        page_heights = []
 
         conf_thr = max(thr, 0.08)
 
-        batch_loop_cnt = math.ceil(float(len(images)) / batch_size)
+        batch_loop_cnt = math.ceil(float(len(image_list)) / batch_size)
         for bi in range(batch_loop_cnt):
             s = bi * batch_size
-            e = min((bi + 1) * batch_size, len(images))
-            batch_images = images[s:e]
+            e = min((bi + 1) * batch_size, len(image_list))
+            # Converted one batch at a time, the pages may be decoded on access.
+            batch_images = [np.array(im) if not isinstance(im, np.ndarray) else im for im in image_list[s:e]]
+            page_heights.extend(im.shape[0] for im in batch_images)
 
             inputs_list = self.preprocess(batch_images)
             logging.debug("preprocess done")
@@ -418,8 +420,8 @@ class AscendLayoutRecognizer(Recognizer):
                     lts_of_ty[ii]["visited"] = True
 
                     keep_feats = [
-                        lts_of_ty[ii]["type"] == "footer" and bxs[i]["bottom"] < image_list[pn].shape[0] * 0.9 / scale_factor,
-                        lts_of_ty[ii]["type"] == "header" and bxs[i]["top"] > image_list[pn].shape[0] * 0.1 / scale_factor,
+                        lts_of_ty[ii]["type"] == "footer" and bxs[i]["bottom"] < page_heights[pn] * 0.9 / scale_factor,
+                        lts_of_ty[ii]["type"] == "header" and bxs[i]["top"] > page_heights[pn] * 0.1 / scale_factor,
                     ]
                     if drop and lts_of_ty[ii]["type"] in self.garbage_layouts and not any(keep_feats):
                         garbages.setdefault(lts_of_ty[ii]["type"], []).append(bxs[i].get("text", ""))
@@ -16,8 +16,10 @@
 import gc
 import logging
 import copy
+import threading
 import time
 import os
+from collections import defaultdict
 
 from huggingface_hub import snapshot_download
 
@@ -35,6 +37,46 @@ from .postprocess import build_post_process
 
 loaded_models = {}
 
+# Pages of the same size detected in one run.
+OCR_DET_BATCH_SIZE = max(1, int(os.environ.get("OCR_DET_BATCH_SIZE", "4")))
+# Text crops, sorted by width, recognized in one run.
+OCR_REC_BATCH_SIZE = max(1, int(os.environ.get("OCR_REC_BATCH_SIZE", "16")))
+
+_stats_lock = threading.Lock()
+_stats = {"det_pages": 0, "det_seconds": 0.0, "rec_crops": 0, "rec_seconds": 0.0}
+
+
+def _count(**kwargs):
+    with _stats_lock:
+        for k, v in kwargs.items():
+            _stats[k] += v
+
+
+def ocr_stats() -> dict:
+    """Detection and recognition throughput of this process."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["det_pages_per_s"] = round(stats["det_pages"] / stats["det_seconds"], 2) if stats["det_seconds"] else 0
+    stats["rec_crops_per_s"] = round(stats["rec_crops"] / stats["rec_seconds"], 2) if stats["rec_seconds"] else 0
+    return stats
+
+
+def _default_intra_op_threads():
+    """
+    2, as before, unless the models run in CHUNK_WORKERS worker processes: then the CPUs are
+    split between the workers of all the TASK_EXECUTORS executors of this host.
+    """
+    workers = int(os.environ.get("CHUNK_WORKERS", "0"))
+    if workers <= 0:
+        return 2
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    executors = max(1, int(os.environ.get("TASK_EXECUTORS", "1")))
+    # These models stop scaling well past a handful of threads.
+    return max(1, min(8, cpus // (workers * executors)))
+
 def transform(data, ops=None):
     """ transform """
     if ops is None:
@@ -97,7 +139,7 @@ def load_model(model_dir, nm, device_id: int | None = None):
     options.enable_cpu_mem_arena = False
     options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
     # Prevent CPU oversubscription by allowing explicit thread control in multi-worker environments
-    options.intra_op_num_threads = int(os.environ.get("OCR_INTRA_OP_NUM_THREADS", "2"))
+    options.intra_op_num_threads = int(os.environ.get("OCR_INTRA_OP_NUM_THREADS", _default_intra_op_threads()))
     options.inter_op_num_threads = int(os.environ.get("OCR_INTER_OP_NUM_THREADS", "2"))
 
     # https://github.com/microsoft/onnxruntime/issues/9509#issuecomment-951546580
@@ -139,7 +181,7 @@ def load_model(model_dir, nm, device_id: int | None = None):
 class TextRecognizer:
     def __init__(self, model_dir, device_id: int | None = None):
         self.rec_image_shape = [int(v) for v in "3, 48, 320".split(",")]
-        self.rec_batch_num = 16
+        self.rec_batch_num = OCR_REC_BATCH_SIZE
         postprocess_params = {
             'name': 'CTCLabelDecode',
             "character_dict_path": os.path.join(model_dir, "ocr.res"),
@@ -507,31 +549,42 @@ class TextDetector:
         gc.collect()
 
     def __call__(self, img):
-        ori_im = img.copy()
-        data = {'image': img}
+        dt_boxes, elapse = self.detect_batch([img])
+        return dt_boxes[0], elapse
 
+    def detect_batch(self, img_list):
+        """
+        Detect the text boxes of several images. The images resizing to the same shape, like
+        the pages of a document, run OCR_DET_BATCH_SIZE at a time. None for an image that
+        could not be preprocessed.
+        """
         st = time.time()
-        data = transform(data, self.preprocess_op)
-        img, shape_list = data
-        if img is None:
-            return None, 0
-        img = np.expand_dims(img, axis=0)
-        shape_list = np.expand_dims(shape_list, axis=0)
-        img = img.copy()
-        input_dict = {}
-        input_dict[self.input_tensor.name] = img
-        for i in range(100000):
-            try:
-                outputs = self.predictor.run(None, input_dict, self.run_options)
-                break
-            except Exception as e:
-                if i >= 3:
-                    raise e
-                time.sleep(5)
-
-        post_result = self.postprocess_op({"maps": outputs[0]}, shape_list)
-        dt_boxes = post_result[0]['points']
-        dt_boxes = self.filter_tag_det_res(dt_boxes, ori_im.shape)
+        dt_boxes = [None] * len(img_list)
+        batch_size = self.input_tensor.shape[0] if isinstance(self.input_tensor.shape[0], int) and self.input_tensor.shape[0] > 0 else OCR_DET_BATCH_SIZE
+        by_shape = defaultdict(list)
+        for i, img in enumerate(img_list):
+            data = transform({'image': img}, self.preprocess_op)
+            if data is None or data[0] is None:
+                continue
+            by_shape[data[0].shape].append((i, data[0], data[1]))
+
+        for items in by_shape.values():
+            for beg in range(0, len(items), batch_size):
+                batch = items[beg:beg + batch_size]
+                input_dict = {}
+                input_dict[self.input_tensor.name] = np.stack([img for _, img, _ in batch])
+                for i in range(100000):
+                    try:
+                        outputs = self.predictor.run(None, input_dict, self.run_options)
+                        break
+                    except Exception as e:
+                        if i >= 3:
+                            raise e
+                        time.sleep(5)
+
+                post_result = self.postprocess_op({"maps": outputs[0]}, np.stack([shape for _, _, shape in batch]))
+                for (i, _, _), res in zip(batch, post_result):
+                    dt_boxes[i] = self.filter_tag_det_res(res['points'], img_list[i].shape)
 
         return dt_boxes, time.time() - st
 
@@ -678,6 +731,7 @@ class OCR:
         start = time.time()
         dt_boxes, elapse = self.text_detector[device_id](img)
         time_dict['det'] = elapse
+        _count(det_pages=1, det_seconds=elapse)
 
         if dt_boxes is None:
             end = time.time()
@@ -687,6 +741,20 @@ class OCR:
         return zip(self.sorted_boxes(dt_boxes), [
                    ("", 0) for _ in range(len(dt_boxes))])
 
+    def detect_batch(self, img_list, device_id: int | None = None):
+        """`detect` of several images, batching the ones of the same size."""
+        if device_id is None:
+            device_id = 0
+        if not img_list:
+            return []
+
+        dt_boxes_list, elapse = self.text_detector[device_id].detect_batch(img_list)
+        _count(det_pages=len(img_list), det_seconds=elapse)
+        return [
+            (None, None, {'det': elapse, 'rec': 0, 'cls': 0, 'all': elapse}) if dt_boxes is None else zip(self.sorted_boxes(dt_boxes), [("", 0) for _ in range(len(dt_boxes))])
+            for dt_boxes in dt_boxes_list
+        ]
+
     def recognize(self, ori_im, box, device_id: int | None = None):
         if device_id is None:
             device_id = 0
@@ -703,6 +771,7 @@ class OCR:
         if device_id is None:
             device_id = 0
         rec_res, elapse = self.text_recognizer[device_id](img_list)
+        _count(rec_crops=len(img_list), rec_seconds=elapse)
         texts = []
         for i in range(len(rec_res)):
             text, score = rec_res[i]
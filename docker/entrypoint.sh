@@ -255,6 +255,7 @@ fi
 if [[ "${ENABLE_TASKEXECUTOR}" -eq 1 ]]; then
     if [[ "${CONSUMER_NO_END}" -gt "${CONSUMER_NO_BEG}" ]]; then
         echo "Starting task executors on host '${HOST_ID}' for IDs in [${CONSUMER_NO_BEG}, ${CONSUMER_NO_END})..."
+        export TASK_EXECUTORS=$((CONSUMER_NO_END - CONSUMER_NO_BEG))
         for (( i=CONSUMER_NO_BEG; i<CONSUMER_NO_END; i++ ))
         do
           task_exe "${i}" "${HOST_ID}" &
@@ -262,6 +263,7 @@ if [[ "${ENABLE_TASKEXECUTOR}" -eq 1 ]]; then
     else
         # Otherwise, start a fixed number of workers
         echo "Starting ${WORKERS} task executor(s) on host '${HOST_ID}'..."
+        export TASK_EXECUTORS="${WORKERS}"
         for (( i=0; i<WORKERS; i++ ))
         do
           task_exe "${i}" "${HOST_ID}" &
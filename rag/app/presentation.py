@@ -24,6 +24,7 @@ from PIL import Image
 from PyPDF2 import PdfReader as pdf2_read
 
 from deepdoc.parser import PdfParser, PlainParser
+from deepdoc.parser.pdf_parser import EncodedPageImage
 from deepdoc.parser.ppt_parser import RAGFlowPptParser
 from rag.app.naive import by_plaintext, PARSERS
 from common.parser_config_utils import normalize_layout_recognizer
@@ -107,6 +108,8 @@ class Pdf(PdfParser):
             if not full_page_text.strip():
                 full_page_text = f"[No text or data found in Page {current_pn}]"
             page_img = self.page_images[i]
+            if isinstance(page_img, EncodedPageImage):
+                page_img = page_img.decode()
             res.append((full_page_text, page_img))
 
         callback(0.9, "Parsing finished")
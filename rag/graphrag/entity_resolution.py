@@ -15,9 +15,9 @@
 #
 import asyncio
 import logging
-import itertools
 import os
 import re
+from collections import Counter, defaultdict
 from dataclasses import dataclass
 from typing import Any, Callable
 
@@ -39,6 +39,51 @@ DEFAULT_ENTITY_INDEX_DELIMITER = "<|>"
 DEFAULT_RESOLUTION_RESULT_DELIMITER = "&&"
 
 
+def _char_multiset(name: str) -> set[tuple[str, int]]:
+    """Characters of `name` numbered by occurrence, so set overlap equals multiset overlap."""
+    seen = Counter()
+    toks = set()
+    for c in name:
+        toks.add((c, seen[c]))
+        seen[c] += 1
+    return toks
+
+
+def _digit_2grams(name: str) -> frozenset[str]:
+    return frozenset(name[i:i + 2] for i in range(len(name) - 1) if any(c.isdigit() for c in name[i:i + 2]))
+
+
+def _overlap_candidates(toks: dict[str, set], min_overlap: Callable, probes: list[str], check: Callable) -> set[tuple[str, str]]:
+    """
+    Prefix filtering: pairs (a, b), a < b, one of them in `probes`, whose token sets may
+    share at least `min_overlap(len(tokens))` tokens and that pass `check(a, b)`. Each
+    name keeps only its rarest len - min_overlap + 1 tokens; two sets whose overlap
+    reaches the threshold always share one of them, so no qualifying pair is missed.
+    """
+    df = Counter(t for ts in toks.values() for t in ts)
+    prefixes = {}
+    index = defaultdict(list)
+    for n, ts in toks.items():
+        t = min_overlap(len(ts))
+        if not ts or t > len(ts):
+            continue
+        prefixes[n] = sorted(ts, key=lambda x: (df[x], x))[:len(ts) - t + 1]
+        for tok in prefixes[n]:
+            index[tok].append(n)
+
+    pairs = set()
+    for a in probes:
+        seen = {a}
+        for tok in prefixes.get(a, []):
+            for b in index[tok]:
+                if b in seen:
+                    continue
+                seen.add(b)
+                if check(a, b):
+                    pairs.add((a, b) if a < b else (b, a))
+    return pairs
+
+
 @dataclass
 class EntityResolutionResult:
     """Entity resolution result class definition."""
@@ -97,7 +142,7 @@ class EntityResolution(Extractor):
 
         candidate_resolution = {entity_type: [] for entity_type in entity_types}
         for k, v in node_clusters.items():
-            candidate_resolution[k] = [(a, b) for a, b in itertools.combinations(v, 2) if (a in subgraph_nodes or b in subgraph_nodes) and self.is_similarity(a, b)]
+            candidate_resolution[k] = await thread_pool_exec(self.candidate_pairs, v, subgraph_nodes)
         num_candidates = sum([len(candidates) for _, candidates in candidate_resolution.items()])
         callback(msg=f"Identified {num_candidates} candidate pairs")
         remain_candidates_to_resolve = num_candidates
@@ -279,6 +324,50 @@ class EntityResolution(Extractor):
 
         return any(any(c.isdigit() for c in pair) for pair in diff)
 
+    def candidate_pairs(self, names: list[str], subgraph_nodes: set[str]) -> list[tuple[str, str]]:
+        """
+        Same pairs, in the same order, as filtering all combinations of `names` touching
+        `subgraph_nodes` with `is_similarity`, without comparing every pair:
+          * names are blocked by their digit-bearing 2-grams, which must be equal to pass
+            `_has_digit_in_2gram_diff`;
+          * two English names need editdistance <= min_len // 2, hence at least
+            max_len - min_len // 2 >= ceil(len / 2) characters in common (bag distance);
+          * otherwise the character sets must share 2 (small sets) or 80% of the larger set.
+        Only pairs passing these necessary conditions reach `is_similarity`.
+        """
+        blocks = defaultdict(list)
+        for n in names:
+            blocks[_digit_2grams(n)].append(n)
+
+        pairs = set()
+        for block in blocks.values():
+            probes = [n for n in block if n in subgraph_nodes]
+            if probes:
+                pairs.update(self._block_candidate_pairs(block, probes))
+        return [(a, b) for a, b in sorted(pairs) if self.is_similarity(a, b)]
+
+    @staticmethod
+    def _block_candidate_pairs(block: list[str], probes: list[str]) -> set[tuple[str, str]]:
+        english = set(n for n in block if is_english(n))
+        multisets = {n: _char_multiset(n) for n in english}
+
+        def english_check(a, b):
+            short, long = sorted([len(a), len(b)])
+            return long - short <= short // 2 and len(multisets[a] & multisets[b]) >= long - short // 2
+
+        charsets = {n: set(n) for n in block}
+
+        def charset_check(a, b):
+            if a in english and b in english:
+                return False
+            max_l = max(len(charsets[a]), len(charsets[b]))
+            common = len(charsets[a] & charsets[b])
+            return common > 1 if max_l < 4 else 5 * common >= 4 * max_l
+
+        pairs = _overlap_candidates(multisets, lambda n: (n + 1) // 2, [n for n in probes if n in english], english_check)
+        pairs.update(_overlap_candidates(charsets, lambda n: 2 if n < 4 else (4 * n + 4) // 5, probes, charset_check))
+        return pairs
+
     def is_similarity(self, a, b):
         if self._has_digit_in_2gram_diff(a, b):
             return False
@@ -41,6 +41,7 @@ from rag.graphrag.utils import (
 from common.misc_utils import thread_pool_exec
 from rag.llm.chat_model import Base as CompletionLLM
 from rag.prompts.generator import message_fit_in
+from rag.utils import llm_cache
 from common.exceptions import TaskCanceledException
 
 GRAPH_FIELD_SEP = "<SEP>"
@@ -66,7 +67,7 @@ class Extractor:
     def _chat(self, system, history, gen_conf={}, task_id=""):
         hist = deepcopy(history)
         conf = deepcopy(gen_conf)
-        response = get_llm_cache(self._llm.llm_name, system, hist, conf)
+        response = get_llm_cache(self._llm.llm_name, system, hist, conf, purpose=llm_cache.GRAPH)
         if response:
             return response
         _, system_msg = message_fit_in([{"role": "system", "content": system}], int(self._llm.max_length * 0.92))
@@ -81,7 +82,7 @@ class Extractor:
                 response = re.sub(r"^.*</think>", "", response, flags=re.DOTALL)
                 if response.find("**ERROR**") >= 0:
                     raise Exception(response)
-                set_llm_cache(self._llm.llm_name, system, response, history, gen_conf)
+                set_llm_cache(self._llm.llm_name, system, response, history, gen_conf, purpose=llm_cache.GRAPH)
                 break
             except Exception as e:
                 logging.exception(e)
@@ -26,9 +26,11 @@ import numpy as np
 import xxhash
 from networkx.readwrite import json_graph
 
+from common.cache_utils import LRUCache
 from common.misc_utils import get_uuid
 from common.connection_utils import timeout
 from rag.nlp import rag_tokenizer, search
+from rag.utils import llm_cache
 from rag.utils.redis_conn import REDIS_CONN
 from common import settings
 from common.doc_store.doc_store_base import OrderByExpr
@@ -93,44 +95,75 @@ def dict_has_keys_with_types(data: dict, expected_fields: list[tuple[str, type]]
     return True
 
 
-def get_llm_cache(llmnm, txt, history, genconf):
-    hasher = xxhash.xxh64()
-    hasher.update((str(llmnm)+str(txt)+str(history)+str(genconf)).encode("utf-8"))
+def get_llm_cache(llmnm, txt, history, genconf, purpose=llm_cache.CHAT):
+    return llm_cache.lookup(purpose, llmnm, txt, history, genconf)
 
-    k = hasher.hexdigest()
-    bin = REDIS_CONN.get(k)
-    if not bin:
-        return None
-    return bin
 
+def set_llm_cache(llmnm, txt, v, history, genconf, purpose=llm_cache.CHAT):
+    llm_cache.store(purpose, llmnm, txt, v, history, genconf)
 
-def set_llm_cache(llmnm, txt, v, history, genconf):
-    hasher = xxhash.xxh64()
-    hasher.update((str(llmnm)+str(txt)+str(history)+str(genconf)).encode("utf-8"))
-    k = hasher.hexdigest()
-    REDIS_CONN.set(k, v.encode("utf-8"), 24 * 3600)
 
+EMBED_CACHE_TTL = int(os.environ.get("EMBED_CACHE_TTL", 24 * 3600))
+# float16 halves the Redis footprint at the cost of ~3 significant digits.
+EMBED_CACHE_DTYPE = np.dtype(os.environ.get("EMBED_CACHE_DTYPE", "float32"))
+_EMBED_CACHE_DTYPE_TAGS = {np.dtype("float32"): b"\x04", np.dtype("float16"): b"\x02"}
+_EMBED_CACHE_TAG_DTYPES = {v: k for k, v in _EMBED_CACHE_DTYPE_TAGS.items()}
+# Optional in-process tier in front of Redis, disabled unless a size is given.
+_embed_lru = LRUCache(maxsize=int(os.environ.get("EMBED_CACHE_LRU_SIZE", 0)))
 
-def get_embed_cache(llmnm, txt):
+
+def _embed_cache_key(llmnm, txt):
     hasher = xxhash.xxh64()
     hasher.update(str(llmnm).encode("utf-8"))
     hasher.update(str(txt).encode("utf-8"))
+    return "embd:" + hasher.hexdigest()
 
-    k = hasher.hexdigest()
-    bin = REDIS_CONN.get(k)
-    if not bin:
-        return
-    return np.array(json.loads(bin))
 
+def _pack_embedding(arr) -> bytes:
+    return _EMBED_CACHE_DTYPE_TAGS[EMBED_CACHE_DTYPE] + np.asarray(arr, dtype=EMBED_CACHE_DTYPE).tobytes()
 
-def set_embed_cache(llmnm, txt, arr):
-    hasher = xxhash.xxh64()
-    hasher.update(str(llmnm).encode("utf-8"))
-    hasher.update(str(txt).encode("utf-8"))
 
-    k = hasher.hexdigest()
-    arr = json.dumps(arr.tolist() if isinstance(arr, np.ndarray) else arr)
-    REDIS_CONN.set(k, arr.encode("utf-8"), 24 * 3600)
+def _unpack_embedding(bin: bytes):
+    dtype = _EMBED_CACHE_TAG_DTYPES.get(bin[:1])
+    if dtype is None:
+        return None
+    return np.frombuffer(bin[1:], dtype=dtype).astype(np.float32)
+
+
+def get_embed_cache_many(llmnm, txts) -> list:
+    """Look up embeddings of `txts`; returns a list aligned with `txts` holding float32 arrays or None."""
+    keys = [_embed_cache_key(llmnm, txt) for txt in txts]
+    res = [_embed_lru.get(k) for k in keys]
+    missed = [i for i, v in enumerate(res) if v is None]
+    if not missed:
+        return res
+    bins = REDIS_CONN.get_many([keys[i] for i in missed], binary=True)
+    for i, bin in zip(missed, bins):
+        if not bin:
+            continue
+        arr = _unpack_embedding(bin)
+        if arr is None:
+            continue
+        res[i] = arr
+        _embed_lru.set(keys[i], arr)
+    return res
+
+
+def set_embed_cache_many(llmnm, txts, arrs):
+    mapping = {}
+    for txt, arr in zip(txts, arrs):
+        k = _embed_cache_key(llmnm, txt)
+        mapping[k] = _pack_embedding(arr)
+        _embed_lru.set(k, np.asarray(arr, dtype=np.float32))
+    REDIS_CONN.set_many(mapping, EMBED_CACHE_TTL, binary=True)
+
+
+def get_embed_cache(llmnm, txt):
+    return get_embed_cache_many(llmnm, [txt])[0]
+
+
+def set_embed_cache(llmnm, txt, arr):
+    set_embed_cache_many(llmnm, [txt], [arr])
 
 
 def get_tags_from_cache(kb_ids):
@@ -297,9 +330,7 @@ def chunk_id(chunk):
     return xxhash.xxh64((chunk["content_with_weight"] + chunk["kb_id"]).encode("utf-8")).hexdigest()
 
 
-async def graph_node_to_chunk(kb_id, embd_mdl, ent_name, meta, chunks):
-    global chat_limiter
-    enable_timeout_assertion = os.environ.get("ENABLE_TIMEOUT_ASSERTION")
+def _graph_node_chunk(kb_id, ent_name, meta) -> dict:
     chunk = {
         "id": get_uuid(),
         "important_kwd": [ent_name],
@@ -314,19 +345,7 @@ async def graph_node_to_chunk(kb_id, embd_mdl, ent_name, meta, chunks):
         "available_int": 0,
     }
     chunk["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(chunk["content_ltks"])
-    ebd = get_embed_cache(embd_mdl.llm_name, ent_name)
-    if ebd is None:
-        async with chat_limiter:
-            timeout = 3 if enable_timeout_assertion else 30000000
-            ebd, _ = await asyncio.wait_for(
-                thread_pool_exec(embd_mdl.encode, [ent_name]),
-                timeout=timeout
-            )
-        ebd = ebd[0]
-        set_embed_cache(embd_mdl.llm_name, ent_name, ebd)
-    assert ebd is not None
-    chunk["q_%d_vec" % len(ebd)] = ebd
-    chunks.append(chunk)
+    return chunk
 
 
 @timeout(3, 3)
@@ -351,8 +370,7 @@ async def get_relation(tenant_id, kb_id, from_ent_name, to_ent_name, size=1):
     return res
 
 
-async def graph_edge_to_chunk(kb_id, embd_mdl, from_ent_name, to_ent_name, meta, chunks):
-    enable_timeout_assertion = os.environ.get("ENABLE_TIMEOUT_ASSERTION")
+def _graph_edge_chunk(kb_id, from_ent_name, to_ent_name, meta) -> dict:
     chunk = {
         "id": get_uuid(),
         "from_entity_kwd": from_ent_name,
@@ -367,23 +385,7 @@ async def graph_edge_to_chunk(kb_id, embd_mdl, from_ent_name, to_ent_name, meta,
         "available_int": 0,
     }
     chunk["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(chunk["content_ltks"])
-    txt = f"{from_ent_name}->{to_ent_name}"
-    ebd = get_embed_cache(embd_mdl.llm_name, txt)
-    if ebd is None:
-        async with chat_limiter:
-            timeout = 3 if enable_timeout_assertion else 300000000
-            ebd, _ = await asyncio.wait_for(
-                thread_pool_exec(
-                    embd_mdl.encode,
-                    [txt + f": {meta['description']}"]
-                ),
-                timeout=timeout
-            )
-        ebd = ebd[0]
-        set_embed_cache(embd_mdl.llm_name, txt, ebd)
-    assert ebd is not None
-    chunk["q_%d_vec" % len(ebd)] = ebd
-    chunks.append(chunk)
+    return chunk
 
 
 async def does_graph_contains(tenant_id, kb_id, doc_id):
@@ -435,55 +437,134 @@ async def get_graph(tenant_id, kb_id, exclude_rebuild=None):
     return result
 
 
+def _changed_sources(graph: nx.Graph, change: GraphChange) -> set[str]:
+    """
+    Documents whose subgraph may differ after `change`. A removed node's documents are
+    covered by the node it was merged into, which is always among the updated nodes.
+    """
+    nodes = set(change.added_updated_nodes)
+    for edges in [change.added_updated_edges, change.removed_edges]:
+        for from_node, to_node in edges:
+            nodes.add(from_node)
+            nodes.add(to_node)
+    sources = set()
+    for n in nodes:
+        if graph.has_node(n):
+            sources.update(graph.nodes[n].get("source_id", []))
+    return sources
+
+
+def _subgraph_chunks(kb_id, graph: nx.Graph, sources: set[str]) -> list[dict]:
+    members = defaultdict(list)
+    for n, attrs in graph.nodes(data=True):
+        for source in set(attrs.get("source_id", [])) & sources:
+            members[source].append(n)
+    chunks = []
+    for source in sorted(sources):
+        subgraph = graph.subgraph(members[source]).copy()
+        subgraph.graph["source_id"] = [source]
+        for n in subgraph.nodes:
+            subgraph.nodes[n]["source_id"] = [source]
+        chunks.append(
+            {
+                "id": get_uuid(),
+                "content_with_weight": json.dumps(nx.node_link_data(subgraph, edges="edges"), ensure_ascii=False),
+                "knowledge_graph_kwd": "subgraph",
+                "kb_id": kb_id,
+                "source_id": [source],
+                "available_int": 0,
+                "removed_kwd": "N",
+            }
+        )
+    return chunks
+
+
+async def insert_graph_chunks(tenant_id: str, kb_id: str, chunks: list[dict]):
+    enable_timeout_assertion = os.environ.get("ENABLE_TIMEOUT_ASSERTION")
+    for b in range(0, len(chunks), settings.DOC_BULK_SIZE):
+        timeout = 3 if enable_timeout_assertion else 30000000
+        doc_store_result = await asyncio.wait_for(
+            thread_pool_exec(
+                settings.docStoreConn.insert,
+                chunks[b : b + settings.DOC_BULK_SIZE],
+                search.index_name(tenant_id),
+                kb_id
+            ),
+            timeout=timeout
+        )
+        if doc_store_result:
+            error_message = f"Insert chunk error: {doc_store_result}, please check log file and Elasticsearch/Infinity status!"
+            raise Exception(error_message)
+
+
+def _relations_to_restore(graph: nx.Graph, change: GraphChange, nodes) -> dict:
+    """
+    The relations among `nodes` still in the graph, keyed by their undirected pair. The terms
+    delete of the removed edges drops every relation between two of these nodes, whichever
+    way it was stored, so each of them is written back once.
+    """
+    nodes = set(nodes)
+    restore = {}
+    for f in sorted(nodes):
+        if not graph.has_node(f):
+            continue
+        for t in graph.neighbors(f):
+            if t in nodes and (f, t) not in change.removed_edges and (t, f) not in change.removed_edges:
+                restore.setdefault(get_from_to(f, t), (f, t))
+    return restore
+
+
 async def set_graph(tenant_id: str, kb_id: str, embd_mdl, graph: nx.Graph, change: GraphChange, callback):
     global chat_limiter
     start = asyncio.get_running_loop().time()
-
-    await thread_pool_exec(
-        settings.docStoreConn.delete,
-        {"knowledge_graph_kwd": ["graph", "subgraph"]},
-        search.index_name(tenant_id),
-        kb_id
-    )
+    idxnm = search.index_name(tenant_id)
+
+    # Subgraphs are only rewritten for documents whose membership changed. Without a
+    # live graph chunk to tell which documents were stored before, rewrite them all.
+    old_sources = set(await get_graph_doc_ids(tenant_id, kb_id))
+    new_sources = set(graph.graph.get("source_id", []))
+    if old_sources:
+        rewrite_sources = (_changed_sources(graph, change) | (new_sources - old_sources)) & new_sources
+        await thread_pool_exec(settings.docStoreConn.delete, {"knowledge_graph_kwd": ["graph"]}, idxnm, kb_id)
+        stale_sources = rewrite_sources | (old_sources - new_sources)
+        if stale_sources:
+            await thread_pool_exec(
+                settings.docStoreConn.delete,
+                {"knowledge_graph_kwd": ["subgraph"], "source_id": sorted(stale_sources)},
+                idxnm,
+                kb_id
+            )
+    else:
+        rewrite_sources = new_sources
+        await thread_pool_exec(settings.docStoreConn.delete, {"knowledge_graph_kwd": ["graph", "subgraph"]}, idxnm, kb_id)
 
     if change.removed_nodes:
         await thread_pool_exec(
             settings.docStoreConn.delete,
             {"knowledge_graph_kwd": ["entity"], "entity_kwd": sorted(change.removed_nodes)},
-            search.index_name(tenant_id),
+            idxnm,
             kb_id
         )
 
+    # Edges to (re)insert, keyed by their undirected pair.
+    edges = {get_from_to(f, t): (f, t) for f, t in change.added_updated_edges}
     if change.removed_edges:
-
-        async def del_edges(from_node, to_node):
-            async with chat_limiter:
-                await thread_pool_exec(
-                    settings.docStoreConn.delete,
-                    {"knowledge_graph_kwd": ["relation"], "from_entity_kwd": from_node, "to_entity_kwd": to_node},
-                    search.index_name(tenant_id),
-                    kb_id
-                )
-
-        tasks = []
-        for from_node, to_node in change.removed_edges:
-            tasks.append(asyncio.create_task(del_edges(from_node, to_node)))
-
-        try:
-            await asyncio.gather(*tasks, return_exceptions=False)
-        except Exception as e:
-            logging.error(f"Error while deleting edges: {e}")
-            for t in tasks:
-                t.cancel()
-            await asyncio.gather(*tasks, return_exceptions=True)
-            raise
+        nodes = sorted(set(n for edge in change.removed_edges for n in edge))
+        await thread_pool_exec(
+            settings.docStoreConn.delete,
+            {"knowledge_graph_kwd": ["relation"], "from_entity_kwd": nodes, "to_entity_kwd": nodes},
+            idxnm,
+            kb_id
+        )
+        for pair, edge in _relations_to_restore(graph, change, nodes).items():
+            edges.setdefault(pair, edge)
 
     now = asyncio.get_running_loop().time()
     if callback:
         callback(msg=f"set_graph removed {len(change.removed_nodes)} nodes and {len(change.removed_edges)} edges from index in {now - start:.2f}s.")
     start = now
 
-    chunks = [
+    blobs = [
         {
             "id": get_uuid(),
             "content_with_weight": json.dumps(nx.node_link_data(graph, edges="edges"), ensure_ascii=False),
@@ -494,56 +575,62 @@ async def set_graph(tenant_id: str, kb_id: str, embd_mdl, graph: nx.Graph, chang
             "removed_kwd": "N",
         }
     ]
+    blobs.extend(_subgraph_chunks(kb_id, graph, rewrite_sources))
 
-    # generate updated subgraphs
-    for source in graph.graph["source_id"]:
-        subgraph = graph.subgraph([n for n in graph.nodes if source in graph.nodes[n]["source_id"]]).copy()
-        subgraph.graph["source_id"] = [source]
-        for n in subgraph.nodes:
-            subgraph.nodes[n]["source_id"] = [source]
-        chunks.append(
-            {
-                "id": get_uuid(),
-                "content_with_weight": json.dumps(nx.node_link_data(subgraph, edges="edges"), ensure_ascii=False),
-                "knowledge_graph_kwd": "subgraph",
-                "kb_id": kb_id,
-                "source_id": [source],
-                "available_int": 0,
-                "removed_kwd": "N",
-            }
-        )
-
-    tasks = []
-    for ii, node in enumerate(change.added_updated_nodes):
-        node_attrs = graph.nodes[node]
-        tasks.append(asyncio.create_task(
-            graph_node_to_chunk(kb_id, embd_mdl, node, node_attrs, chunks)
-        ))
-        if ii % 100 == 9 and callback:
-            callback(msg=f"Get embedding of nodes: {ii}/{len(change.added_updated_nodes)}")
-    try:
-        await asyncio.gather(*tasks, return_exceptions=False)
-    except Exception as e:
-        logging.error(f"Error in get_embedding_of_nodes: {e}")
-        for t in tasks:
-            t.cancel()
-        await asyncio.gather(*tasks, return_exceptions=True)
-        raise
-
-    tasks = []
-    for ii, (from_node, to_node) in enumerate(change.added_updated_edges):
+    # (chunk, embedding cache key, text to embed) of every entity and relation to write.
+    items = []
+    for node in change.added_updated_nodes:
+        items.append((_graph_node_chunk(kb_id, node, graph.nodes[node]), node, node))
+    for from_node, to_node in edges.values():
         edge_attrs = graph.get_edge_data(from_node, to_node)
         if not edge_attrs:
             continue
-        tasks.append(asyncio.create_task(
-            graph_edge_to_chunk(kb_id, embd_mdl, from_node, to_node, edge_attrs, chunks)
-        ))
-        if ii % 100 == 9 and callback:
-            callback(msg=f"Get embedding of edges: {ii}/{len(change.added_updated_edges)}")
+        txt = f"{from_node}->{to_node}"
+        items.append((_graph_edge_chunk(kb_id, from_node, to_node, edge_attrs), txt, txt + f": {edge_attrs['description']}"))
+
+    ebds = await thread_pool_exec(get_embed_cache_many, embd_mdl.llm_name, [key for _, key, _ in items])
+    missed = [i for i, ebd in enumerate(ebds) if ebd is None]
+    done = 0
+    enable_timeout_assertion = os.environ.get("ENABLE_TIMEOUT_ASSERTION")
+
+    async def write(idxs):
+        nonlocal done
+        if not idxs:
+            return
+        chunks = []
+        for i in idxs:
+            chunk, ebd = items[i][0], ebds[i]
+            assert ebd is not None
+            chunk["q_%d_vec" % len(ebd)] = ebd
+            chunks.append(chunk)
+        await insert_graph_chunks(tenant_id, kb_id, chunks)
+        done += len(idxs)
+        if callback:
+            callback(msg=f"Insert entity/relation chunks: {done}/{len(items)}")
+
+    async def embed_and_write(batch):
+        async with chat_limiter:
+            timeout = 3 if enable_timeout_assertion else 30000000
+            vts, _ = await asyncio.wait_for(
+                thread_pool_exec(embd_mdl.encode, [items[i][2] for i in batch]),
+                timeout=timeout
+            )
+        for i, ebd in zip(batch, vts):
+            ebds[i] = ebd
+        await thread_pool_exec(set_embed_cache_many, embd_mdl.llm_name, [items[i][1] for i in batch], vts)
+        await write(batch)
+
+    # Blobs and cached entities/relations are written while the rest is being embedded.
+    tasks = [
+        asyncio.create_task(insert_graph_chunks(tenant_id, kb_id, blobs)),
+        asyncio.create_task(write([i for i, ebd in enumerate(ebds) if ebd is not None])),
+    ]
+    for b in range(0, len(missed), settings.EMBEDDING_BATCH_SIZE):
+        tasks.append(asyncio.create_task(embed_and_write(missed[b : b + settings.EMBEDDING_BATCH_SIZE])))
     try:
         await asyncio.gather(*tasks, return_exceptions=False)
     except Exception as e:
-        logging.error(f"Error in get_embedding_of_edges: {e}")
+        logging.error(f"Error while writing graph chunks: {e}")
         for t in tasks:
             t.cancel()
         await asyncio.gather(*tasks, return_exceptions=True)
@@ -551,30 +638,7 @@ async def set_graph(tenant_id: str, kb_id: str, embd_mdl, graph: nx.Graph, chang
 
     now = asyncio.get_running_loop().time()
     if callback:
-        callback(msg=f"set_graph converted graph change to {len(chunks)} chunks in {now - start:.2f}s.")
-    start = now
-
-    enable_timeout_assertion = os.environ.get("ENABLE_TIMEOUT_ASSERTION")
-    es_bulk_size = 4
-    for b in range(0, len(chunks), es_bulk_size):
-        timeout = 3 if enable_timeout_assertion else 30000000
-        doc_store_result = await asyncio.wait_for(
-            thread_pool_exec(
-                settings.docStoreConn.insert,
-                chunks[b : b + es_bulk_size],
-                search.index_name(tenant_id),
-                kb_id
-            ),
-            timeout=timeout
-        )
-        if b % 100 == es_bulk_size and callback:
-            callback(msg=f"Insert chunks: {b}/{len(chunks)}")
-        if doc_store_result:
-            error_message = f"Insert chunk error: {doc_store_result}, please check log file and Elasticsearch/Infinity status!"
-            raise Exception(error_message)
-    now = asyncio.get_running_loop().time()
-    if callback:
-        callback(msg=f"set_graph added/updated {len(change.added_updated_nodes)} nodes and {len(change.added_updated_edges)} edges from index in {now - start:.2f}s.")
+        callback(msg=f"set_graph added/updated {len(change.added_updated_nodes)} nodes, {len(edges)} edges and {len(blobs) - 1} subgraphs in {now - start:.2f}s.")
 
 
 def is_continuous_subsequence(subseq, seq):
@@ -16,13 +16,18 @@
 
 import logging
 import json
+import os
 import re
 from collections import defaultdict
 
+from common.cache_utils import LRUCache
 from common.query_base import QueryBase
 from common.doc_store.doc_store_base import MatchTextExpr
 from rag.nlp import rag_tokenizer, term_weight, synonym
 
+# Expires like the realtime synonym dictionary reload, so synonym updates still show up.
+_question_analyses = LRUCache(maxsize=int(os.environ.get("QUESTION_CACHE_SIZE", 4096)), ttl=3600)
+
 
 class FulltextQueryer(QueryBase):
     def __init__(self):
@@ -39,7 +44,23 @@ class FulltextQueryer(QueryBase):
         ]
 
     def question(self, txt, tbl="qa", min_match: float = 0.6):
-        original_query = txt
+        # The analysis only depends on the text; `min_match` is applied to the cached result,
+        # so the search retries and reranks of one retrieval analyze the question once.
+        analysis = _question_analyses.get(txt)
+        if analysis is None:
+            analysis = self._analyze_question(txt)
+            _question_analyses.set(txt, analysis)
+        query, keywords, with_min_match = analysis
+        if query is None:
+            return None, list(keywords)
+        if with_min_match:
+            extra_options = {"minimum_should_match": min_match, "original_query": txt}
+        else:
+            extra_options = {"original_query": txt}
+        return MatchTextExpr(self.query_fields, query, 100, extra_options), list(keywords)
+
+    def _analyze_question(self, txt):
+        """Tokenize, weigh and expand `txt`; returns (query string, keywords, whether min_match applies)."""
         txt = self.add_space_between_eng_zh(txt)
         txt = re.sub(
             r"[ :|\r\n\t,，。？?/`!！&^%%()\[\]{}<>]+",
@@ -81,9 +102,7 @@ class FulltextQueryer(QueryBase):
             if not q:
                 q.append(txt)
             query = " ".join(q)
-            return MatchTextExpr(
-                self.query_fields, query, 100, {"original_query": original_query}
-            ), keywords
+            return query, keywords, False
 
         def need_fine_grained_tokenize(tk):
             if len(tk) < 3:
@@ -166,10 +185,8 @@ class FulltextQueryer(QueryBase):
             query = " OR ".join([f"({t})" for t in qs if t])
             if not query:
                 query = otxt
-            return MatchTextExpr(
-                self.query_fields, query, 100, {"minimum_should_match": min_match, "original_query": original_query}
-            ), keywords
-        return None, keywords
+            return query, keywords, True
+        return None, keywords, True
 
     def hybrid_similarity(self, avec, bvecs, atks, btkss, tkweight=0.3, vtweight=0.7):
         from sklearn.metrics.pairwise import cosine_similarity
@@ -181,22 +198,67 @@ class FulltextQueryer(QueryBase):
             return np.array(tksim), tksim, sims[0]
         return np.array(sims[0]) * vtweight + np.array(tksim) * tkweight, tksim, sims[0]
 
+    def hybrid_similarity_matrix(self, avecs, bvecs, atkss, btkss, tkweight=0.3, vtweight=0.7):
+        """
+        hybrid_similarity for many queries at once: row i holds what
+        hybrid_similarity(avecs[i], bvecs, atkss[i], btkss, ...)[0] would return.
+        """
+        import numpy as np
+
+        avecs = np.asarray(avecs, dtype=np.float64)
+        bvecs = np.asarray(bvecs, dtype=np.float64)
+        anorm = np.linalg.norm(avecs, axis=1, keepdims=True)
+        bnorm = np.linalg.norm(bvecs, axis=1, keepdims=True)
+        # Zero vectors get zero similarity, like sklearn's cosine_similarity.
+        sims = (avecs / np.where(anorm == 0, 1, anorm)) @ (bvecs / np.where(bnorm == 0, 1, bnorm)).T
+        tksims = self.token_similarity_matrix(atkss, btkss)
+        no_vector = np.sum(sims, axis=1) == 0
+        return np.where(no_vector[:, None], tksims, sims * vtweight + tksims * tkweight)
+
     def token_similarity(self, atks, btkss):
-        def to_dict(tks):
-            if isinstance(tks, str):
-                tks = tks.split()
+        if not btkss:
+            return []
+        return self.token_similarity_matrix([atks], btkss)[0].tolist()
+
+    def token_similarity_matrix(self, atkss, btkss):
+        """token_similarity of every query in `atkss` against every candidate in `btkss`, as a len(atkss) x len(btkss) array."""
+        from scipy.sparse import csr_matrix
+        import numpy as np
+
+        def to_dict(tks, wts):
             d = defaultdict(int)
-            wts = self.tw.weights(tks, preprocess=False)
-            for i, (t, c) in enumerate(wts):
+            for i, (t, c) in enumerate(zip(tks, wts)):
                 d[t] += c * 0.4
-                if i+1 < len(wts):
-                    _t, _c = wts[i+1]
-                    d[t+_t] += max(c, _c) * 0.6
+                if i + 1 < len(tks):
+                    d[t + tks[i + 1]] += max(c, wts[i + 1]) * 0.6
             return d
 
-        atks = to_dict(atks)
-        btkss = [to_dict(tks) for tks in btkss]
-        return [self.similarity(atks, btks) for btks in btkss]
+        def to_bag(tks):
+            if isinstance(tks, str):
+                tks = tks.split()
+            return list(tks) + [tks[i] + tks[i + 1] for i in range(len(tks) - 1)]
+
+        qtwts = [to_dict(tks, wts) for tks, wts in self.tw.batch_weights(atkss, preprocess=False)]
+        if not btkss:
+            return np.zeros((len(qtwts), 0))
+
+        # Like similarity(), a candidate scores the query weight of every unigram/bigram
+        # it shares with the query, so candidates are projected onto the queries' vocabulary
+        # as 0/1 rows and all pairs are scored with a single sparse matrix product.
+        vocab = {}
+        for qtwt in qtwts:
+            for t in qtwt:
+                vocab.setdefault(t, len(vocab))
+        indptr, indices = [0], []
+        for btks in btkss:
+            indices.extend({vocab[t] for t in to_bag(btks) if t in vocab})
+            indptr.append(len(indices))
+        hits = csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(indptr) - 1, len(vocab)))
+        qv = np.zeros((len(vocab), len(qtwts)))
+        for j, qtwt in enumerate(qtwts):
+            for t, w in qtwt.items():
+                qv[vocab[t], j] = w
+        return ((hits @ qv + 1e-9) / (np.sum(qv, axis=0) + 1e-9)).T
 
     def similarity(self, qtwt, dtwt):
         if isinstance(dtwt, type("")):
@@ -0,0 +1,168 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Opt-in cache for Dealer.retrieval (RETRIEVAL_CACHE_ENABLED).
+
+Two levels are cached, each with an in-process LRU in front of Redis:
+  * query embeddings, keyed by (embedding model, normalized question);
+  * retrieval results, keyed by the full request plus the version of every
+    knowledge base involved.
+
+The KB version is a Redis counter bumped by every chunk insert/update/delete
+going through KBVersionedDocStore, so a result cached before a change is never
+served after it.
+"""
+
+import copy
+import json
+import logging
+import os
+import re
+
+import xxhash
+
+from common.cache_utils import LRUCache
+
+RETRIEVAL_CACHE_ENABLED = os.environ.get("RETRIEVAL_CACHE_ENABLED", "false").lower() in ["true", "1", "yes"]
+RETRIEVAL_CACHE_TTL = int(os.environ.get("RETRIEVAL_CACHE_TTL", 600))
+RETRIEVAL_CACHE_LRU_SIZE = int(os.environ.get("RETRIEVAL_CACHE_LRU_SIZE", 1024))
+
+_KB_VERSION_PREFIX = "retrieval:kbver:"
+_RESULT_PREFIX = "retrieval:res:"
+# Local copies of results are short-lived: the KB versions are re-read from Redis on every lookup anyway.
+_results = LRUCache(maxsize=RETRIEVAL_CACHE_LRU_SIZE, ttl=RETRIEVAL_CACHE_TTL)
+
+
+def normalize_question(question: str) -> str:
+    # Whitespace only: case changes the query embedding (and so the results) for most models.
+    return re.sub(r"\s+", " ", question.strip())
+
+
+def _model_name(mdl) -> str:
+    if mdl is None:
+        return ""
+    return str(getattr(mdl, "llm_name", type(mdl).__name__))
+
+
+def _as_list(v) -> list:
+    if v is None:
+        return []
+    if isinstance(v, str):
+        return [v]
+    return list(v)
+
+
+def kb_versions(kb_ids) -> list | None:
+    """Current version of each KB, or None when Redis can't tell (the cache is then bypassed)."""
+    from rag.utils.redis_conn import REDIS_CONN
+
+    kb_ids = _as_list(kb_ids)
+    if not kb_ids or not REDIS_CONN.is_alive():
+        return None
+    versions = REDIS_CONN.get_many([_KB_VERSION_PREFIX + kb_id for kb_id in kb_ids])
+    return [v or "0" for v in versions]
+
+
+def bump_kb_versions(kb_ids):
+    from rag.utils.redis_conn import REDIS_CONN
+
+    for kb_id in set(_as_list(kb_ids)):
+        try:
+            REDIS_CONN.incrby(_KB_VERSION_PREFIX + kb_id, 1)
+        except Exception as e:
+            logging.warning(f"Failed to bump retrieval cache version of kb {kb_id}: {e}")
+
+
+def result_key(question, embd_mdl, rerank_mdl, tenant_ids, kb_ids, **kwargs) -> str | None:
+    kb_ids = sorted(_as_list(kb_ids))
+    versions = kb_versions(kb_ids)
+    if versions is None:
+        return None
+    req = {
+        "question": normalize_question(question),
+        "embd_mdl": _model_name(embd_mdl),
+        "rerank_mdl": _model_name(rerank_mdl),
+        "tenant_ids": sorted(_as_list(tenant_ids)),
+        "kb_ids": kb_ids,
+        "versions": versions,
+        **{k: sorted(v) if k == "doc_ids" and v else v for k, v in kwargs.items()},
+    }
+    return _RESULT_PREFIX + xxhash.xxh128(json.dumps(req, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+def get_result(key: str) -> dict | None:
+    from rag.utils.redis_conn import REDIS_CONN
+
+    res = _results.get(key)
+    if res is None:
+        bin = REDIS_CONN.get(key)
+        if not bin:
+            return None
+        try:
+            res = json.loads(bin)
+        except Exception:
+            return None
+        _results.set(key, res)
+    # Callers decorate the returned chunks in place.
+    return copy.deepcopy(res)
+
+
+def set_result(key: str, ranks: dict):
+    from rag.utils.redis_conn import REDIS_CONN
+
+    _results.set(key, copy.deepcopy(ranks))
+    REDIS_CONN.set_obj(key, ranks, RETRIEVAL_CACHE_TTL)
+
+
+def get_query_vector(embd_mdl, question: str):
+    from rag.graphrag.utils import get_embed_cache
+
+    # encode_queries may differ from encode (e.g. instruction prefixes), so query vectors get their own namespace.
+    return get_embed_cache(_model_name(embd_mdl) + "#query", normalize_question(question))
+
+
+def set_query_vector(embd_mdl, question: str, vector):
+    from rag.graphrag.utils import set_embed_cache
+
+    set_embed_cache(_model_name(embd_mdl) + "#query", normalize_question(question), vector)
+
+
+class KBVersionedDocStore:
+    """
+    Wraps a DocStoreConnection and bumps the retrieval cache version of every KB a
+    chunk insert/update/delete touches. Everything else is delegated unchanged.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def insert(self, rows: list[dict], index_name: str, dataset_id: str = None) -> list[str]:
+        res = self._conn.insert(rows, index_name, dataset_id)
+        bump_kb_versions([dataset_id] if dataset_id else [r["kb_id"] for r in rows if r.get("kb_id")])
+        return res
+
+    def update(self, condition: dict, new_value: dict, index_name: str, dataset_id: str) -> bool:
+        res = self._conn.update(condition, new_value, index_name, dataset_id)
+        bump_kb_versions(dataset_id)
+        return res
+
+    def delete(self, condition: dict, index_name: str, dataset_id: str) -> int:
+        res = self._conn.delete(condition, index_name, dataset_id)
+        bump_kb_versions(dataset_id)
+        return res
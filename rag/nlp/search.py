@@ -13,14 +13,16 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import asyncio
 import json
 import logging
+import os
 import re
 import math
-from collections import OrderedDict, defaultdict
+from collections import Counter, OrderedDict, defaultdict
 from dataclasses import dataclass
 
-from rag.nlp import rag_tokenizer, query
+from rag.nlp import rag_tokenizer, query, retrieval_cache
 import numpy as np
 from common.doc_store.doc_store_base import MatchDenseExpr, FusionExpr, OrderByExpr, DocStoreConnection
 from common.string_utils import remove_redundant_spaces
@@ -33,6 +35,21 @@ from common.misc_utils import thread_pool_exec
 def index_name(uid): return f"ragflow_{uid}"
 
 
+# Two-phase retrieval fetches just what ranking needs for every candidate, then the
+# display fields for the final page only; multi-tenant searches fan out per index.
+TWO_PHASE_RETRIEVAL = os.environ.get("TWO_PHASE_RETRIEVAL", "false").lower() in ["true", "1", "yes"]
+# The token similarity of rerank() needs content_ltks of every candidate, so it stays in phase one
+# and only content_with_weight, positions and the other display fields are deferred.
+RANK_FIELDS = ["doc_id", "kb_id", "docnm_kwd", "content_ltks", "title_tks", "important_kwd", "question_tks",
+               "available_int", PAGERANK_FLD, TAG_FLD]
+# Infinity without a rerank model ranks by the engine score alone: phase one needs no text at all.
+SCORE_FIELDS = ["doc_id", "kb_id", "docnm_kwd", "available_int"]
+DISPLAY_FIELDS = ["docnm_kwd", "content_ltks", "kb_id", "img_id", "title_tks", "important_kwd", "position_int",
+                  "doc_id", "page_num_int", "top_int", "create_timestamp_flt", "knowledge_graph_kwd",
+                  "question_kwd", "question_tks", "doc_type_kwd",
+                  "available_int", "content_with_weight", "mom_id", PAGERANK_FLD, TAG_FLD]
+
+
 class Dealer:
     def __init__(self, dataStore: DocStoreConnection):
         self.qryr = query.FulltextQueryer()
@@ -48,9 +65,17 @@ class Dealer:
         aggregation: list | dict | None = None
         keywords: list[str] | None = None
         group_docs: list[list] | None = None
+        # chunk id -> index it was found in, set by fan-out searches.
+        chunk_index: dict | None = None
 
     async def get_vector(self, txt, emb_mdl, topk=10, similarity=0.1):
-        qv, _ = await thread_pool_exec(emb_mdl.encode_queries, txt)
+        qv = None
+        if retrieval_cache.RETRIEVAL_CACHE_ENABLED:
+            qv = await thread_pool_exec(retrieval_cache.get_query_vector, emb_mdl, txt)
+        if qv is None:
+            qv, _ = await thread_pool_exec(emb_mdl.encode_queries, txt)
+            if retrieval_cache.RETRIEVAL_CACHE_ENABLED:
+                await thread_pool_exec(retrieval_cache.set_query_vector, emb_mdl, txt, qv)
         shape = np.array(qv).shape
         if len(shape) > 1:
             raise Exception(
@@ -75,10 +100,13 @@ class Dealer:
                kb_ids: list[str],
                emb_mdl=None,
                highlight: bool | list | None = None,
-               rank_feature: dict | None = None
+               rank_feature: dict | None = None,
+               query_vector: list[float] | None = None
                ):
         if highlight is None:
             highlight = False
+        if req.get("two_phase") and req.get("question") and isinstance(idx_names, list) and len(idx_names) > 1:
+            return await self._fanout_search(req, idx_names, kb_ids, emb_mdl, highlight, rank_feature)
 
         filters = self.get_filters(req)
         orderBy = OrderByExpr()
@@ -88,11 +116,10 @@ class Dealer:
         ps = int(req.get("size", topk))
         offset, limit = pg * ps, ps
 
-        src = req.get("fields",
-                      ["docnm_kwd", "content_ltks", "kb_id", "img_id", "title_tks", "important_kwd", "position_int",
-                       "doc_id", "page_num_int", "top_int", "create_timestamp_flt", "knowledge_graph_kwd",
-                       "question_kwd", "question_tks", "doc_type_kwd",
-                       "available_int", "content_with_weight", "mom_id", PAGERANK_FLD, TAG_FLD])
+        if req.get("two_phase"):
+            src = req.get("fields", list(RANK_FIELDS))
+        else:
+            src = req.get("fields", list(DISPLAY_FIELDS))
         kwds = set([])
 
         qst = req.get("question", "")
@@ -119,7 +146,11 @@ class Dealer:
                 total = self.dataStore.get_total(res)
                 logging.debug("Dealer.search TOTAL: {}".format(total))
             else:
-                matchDense = await self.get_vector(qst, emb_mdl, topk, req.get("similarity", 0.1))
+                if query_vector is not None:
+                    matchDense = MatchDenseExpr(f"q_{len(query_vector)}_vec", list(query_vector), 'float', 'cosine', topk,
+                                                {"similarity": req.get("similarity", 0.1)})
+                else:
+                    matchDense = await self.get_vector(qst, emb_mdl, topk, req.get("similarity", 0.1))
                 q_vec = matchDense.embedding_data
                 if not settings.DOC_ENGINE_INFINITY:
                     src.append(f"q_{len(q_vec)}_vec")
@@ -170,6 +201,69 @@ class Dealer:
             keywords=keywords
         )
 
+    async def _fanout_search(self, req, idx_names: list[str], kb_ids: list[str], emb_mdl, highlight, rank_feature):
+        """Search every index concurrently and fuse the hits by score, as one multi-index search would."""
+        topk = int(req.get("topk", 1024))
+        ps = int(req.get("size", topk))
+        offset = (int(req.get("page", 1)) - 1) * ps
+        # The embedding is computed once and shared by all indexes.
+        query_vector = None
+        if emb_mdl is not None:
+            query_vector = (await self.get_vector(req["question"], emb_mdl, topk, req.get("similarity", 0.1))).embedding_data
+        sub_req = {**req, "page": 1, "size": offset + ps}
+        results = await asyncio.gather(*[
+            self.search(sub_req, [idx], kb_ids, emb_mdl, highlight, rank_feature=rank_feature, query_vector=query_vector)
+            for idx in idx_names
+        ])
+
+        hits, field, chunk_index, highlights, aggs = [], {}, {}, {}, Counter()
+        for idx, sres in zip(idx_names, results):
+            for chunk_id in sres.ids:
+                hits.append((get_float(sres.field.get(chunk_id, {}).get("_score", 0)), chunk_id))
+                chunk_index[chunk_id] = idx
+            field.update(sres.field or {})
+            highlights.update(sres.highlight or {})
+            for k, c in (sres.aggregation or []):
+                aggs[k] += c
+        hits.sort(key=lambda x: x[0] * -1)
+        ids = [chunk_id for _, chunk_id in hits[offset: offset + ps]]
+        return self.SearchResult(
+            total=sum([sres.total for sres in results]),
+            ids=ids,
+            query_vector=query_vector if query_vector is not None else [],
+            aggregation=list(aggs.items()),
+            highlight={k: v for k, v in highlights.items() if k in field},
+            field={chunk_id: field[chunk_id] for chunk_id in ids},
+            keywords=results[0].keywords if results else [],
+            chunk_index={chunk_id: chunk_index[chunk_id] for chunk_id in ids},
+        )
+
+    async def _fetch_chunks(self, sres, chunk_ids: list[str], idx_names: list[str], kb_ids: list[str]):
+        """
+        Second phase of two-phase retrieval: load the display fields of the chunks that made the
+        final page, with one id-filtered search per index.
+        """
+        groups = defaultdict(list)
+        for chunk_id in chunk_ids:
+            groups[(sres.chunk_index or {}).get(chunk_id, idx_names[0])].append(chunk_id)
+
+        async def fetch(idx, ids):
+            kbs = set()
+            for chunk_id in ids:
+                kb_id = sres.field[chunk_id].get("kb_id")
+                kbs.update(kb_id if isinstance(kb_id, list) else [kb_id])
+            res = await thread_pool_exec(self.dataStore.search, DISPLAY_FIELDS, [], {"id": ids}, [], OrderByExpr(), 0, len(ids),
+                                         idx, kb_ids if None in kbs else list(kbs))
+            docs = self.dataStore.get_fields(res, DISPLAY_FIELDS)
+            for chunk_id in ids:
+                if chunk_id in docs:
+                    sres.field[chunk_id].update(docs[chunk_id])
+                else:
+                    # Removed between the two phases.
+                    sres.field[chunk_id].setdefault("content_with_weight", "")
+
+        await asyncio.gather(*[fetch(idx, ids) for idx, ids in groups.items()])
+
     @staticmethod
     def trans2floats(txt):
         return [get_float(t) for t in txt.split("\t")]
@@ -226,25 +320,22 @@ class Dealer:
         assert len(ans_v[0]) == len(chunk_v[0]), "The dimension of query and chunk do not match: {} vs. {}".format(
             len(ans_v[0]), len(chunk_v[0]))
 
-        chunks_tks = [rag_tokenizer.tokenize(self.qryr.rmWWW(ck)).split()
-                      for ck in chunks]
+        # Chunks arrive as content_ltks from retrieval, already tokenized: only the
+        # question words are stripped, instead of tokenizing them all over again.
+        chunks_tks = [self.qryr.rmWWW(ck).split() for ck in chunks]
+        pieces_tks = [rag_tokenizer.tokenize(self.qryr.rmWWW(p)).split() for p in pieces_]
+        # One sentence x chunk similarity matrix serves every threshold below.
+        sim = self.qryr.hybrid_similarity_matrix(ans_v, chunk_v, pieces_tks, chunks_tks, tkweight, vtweight)
+        mx = np.max(sim, axis=1) * 0.99
         cites = {}
         thr = 0.63
-        while thr > 0.3 and len(cites.keys()) == 0 and pieces_ and chunks_tks:
-            for i, a in enumerate(pieces_):
-                sim, tksim, vtsim = self.qryr.hybrid_similarity(ans_v[i],
-                                                                chunk_v,
-                                                                rag_tokenizer.tokenize(
-                                                                    self.qryr.rmWWW(pieces_[i])).split(),
-                                                                chunks_tks,
-                                                                tkweight, vtweight)
-                mx = np.max(sim) * 0.99
-                logging.debug("{} SIM: {}".format(pieces_[i], mx))
-                if mx < thr:
-                    continue
-                cites[idx[i]] = list(
-                    set([str(ii) for ii in range(len(chunk_v)) if sim[ii] > mx]))[:4]
+        while thr > 0.3 and not np.any(mx >= thr):
             thr *= 0.8
+        if thr > 0.3:
+            for i in np.flatnonzero(mx >= thr):
+                logging.debug("{} SIM: {}".format(pieces_[i], mx[i]))
+                above = np.flatnonzero(sim[i] > mx[i])
+                cites[idx[i]] = [str(ii) for ii in above[np.argsort(-sim[i][above], kind="stable")][:4]]
 
         res = ""
         seted = set([])
@@ -380,6 +471,29 @@ class Dealer:
         if not question:
             return ranks
 
+        cache_key = None
+        if retrieval_cache.RETRIEVAL_CACHE_ENABLED:
+            cache_key = await thread_pool_exec(
+                retrieval_cache.result_key, question, embd_mdl, rerank_mdl, tenant_ids, kb_ids,
+                page=page, page_size=page_size, similarity_threshold=similarity_threshold,
+                vector_similarity_weight=vector_similarity_weight, top=top, doc_ids=doc_ids,
+                aggs=aggs, highlight=highlight, rank_feature=rank_feature,
+            )
+            if cache_key:
+                cached = await thread_pool_exec(retrieval_cache.get_result, cache_key)
+                if cached is not None:
+                    return cached
+
+        ranks = await self._retrieval(question, embd_mdl, tenant_ids, kb_ids, page, page_size, similarity_threshold,
+                                      vector_similarity_weight, top, doc_ids, aggs, rerank_mdl, highlight, rank_feature)
+        if cache_key:
+            await thread_pool_exec(retrieval_cache.set_result, cache_key, ranks)
+        return ranks
+
+    async def _retrieval(self, question, embd_mdl, tenant_ids, kb_ids, page, page_size, similarity_threshold,
+                         vector_similarity_weight, top, doc_ids, aggs, rerank_mdl, highlight, rank_feature):
+        ranks = {"total": 0, "chunks": [], "doc_aggs": {}}
+
         # Ensure RERANK_LIMIT is multiple of page_size
         RERANK_LIMIT = math.ceil(64 / page_size) * page_size if page_size > 1 else 1
         RERANK_LIMIT = max(30, RERANK_LIMIT)
@@ -393,12 +507,17 @@ class Dealer:
             "topk": top,
             "similarity": similarity_threshold,
             "available_int": 1,
+            # Highlights come with the first-phase hits, so they need the single-phase search.
+            "two_phase": TWO_PHASE_RETRIEVAL and not highlight,
         }
 
         if isinstance(tenant_ids, str):
             tenant_ids = tenant_ids.split(",")
 
-        sres = await self.search(req, [index_name(tid) for tid in tenant_ids], kb_ids, embd_mdl, highlight,
+        idx_names = [index_name(tid) for tid in tenant_ids]
+        if req["two_phase"] and settings.DOC_ENGINE_INFINITY and not rerank_mdl:
+            req["fields"] = list(SCORE_FIELDS)
+        sres = await self.search(req, idx_names, kb_ids, embd_mdl, highlight,
                            rank_feature=rank_feature)
 
         if rerank_mdl and sres.total > 0:
@@ -447,6 +566,8 @@ class Dealer:
         begin = page_index * page_size
         end = begin + page_size
         page_idx = valid_idx[begin:end]
+        if req["two_phase"]:
+            await self._fetch_chunks(sres, [sres.ids[i] for i in page_idx], idx_names, kb_ids)
 
         dim = len(sres.query_vector)
         vector_column = f"q_{dim}_vec"
@@ -19,10 +19,18 @@ import math
 import json
 import re
 import os
+import threading
 import numpy as np
 from rag.nlp import rag_tokenizer
+from common.cache_utils import LRUCache
 from common.file_utils import get_project_base_directory
 
+_NUM_PATTERN = re.compile(r"[0-9,.]{2,}$")
+_SHORT_LETTER_PATTERN = re.compile(r"[a-z]{1,2}$")
+_NUM_SPACE_PATTERN = re.compile(r"[0-9. -]{2,}$")
+_LETTER_PATTERN = re.compile(r"[a-z. -]+$")
+_OOV_WEIGHT_CACHE_SIZE = int(os.environ.get("TERM_WEIGHT_CACHE_SIZE", 200000))
+
 
 class Dealer:
     def __init__(self):
@@ -89,6 +97,13 @@ class Dealer:
         except Exception:
             logging.warning("Load term.freq FAIL!")
 
+        # Token weights only depend on the token and the static dictionaries above,
+        # so they are computed once per token: dictionary terms into a table built on
+        # first use, everything else into a bounded LRU.
+        self._weight_table = None
+        self._weight_table_lock = threading.Lock()
+        self._oov_weights = LRUCache(maxsize=_OOV_WEIGHT_CACHE_SIZE)
+
     def pretoken(self, txt, num=False, stpwd=True):
         patt = [
             r"[~—\t @#%!<>,\.\?\":;'\{\}\[\]_=\(\)\|，。？》•●○↓《；‘’：“”【¥ 】…￥！、·（）×`&\\/「」\\]"
@@ -160,87 +175,124 @@ class Dealer:
                 tks.append(t)
         return tks
 
-    def weights(self, tks, preprocess=True):
-        num_pattern = re.compile(r"[0-9,.]{2,}$")
-        short_letter_pattern = re.compile(r"[a-z]{1,2}$")
-        num_space_pattern = re.compile(r"[0-9. -]{2,}$")
-        letter_pattern = re.compile(r"[a-z. -]+$")
-
-        def ner(t):
-            if num_pattern.match(t):
-                return 2
-            if short_letter_pattern.match(t):
-                return 0.01
-            if not self.ne or t not in self.ne:
-                return 1
-            m = {"toxic": 2, "func": 1, "corp": 3, "loca": 3, "sch": 3, "stock": 3,
-                 "firstnm": 1}
-            return m[self.ne[t]]
-
-        def postag(t):
-            t = rag_tokenizer.tag(t)
-            if t in set(["r", "c", "d"]):
-                return 0.3
-            if t in set(["ns", "nt"]):
-                return 3
-            if t in set(["n"]):
-                return 2
-            if re.match(r"[0-9-]+", t):
-                return 2
+    def _ner_weight(self, t):
+        if _NUM_PATTERN.match(t):
+            return 2
+        if _SHORT_LETTER_PATTERN.match(t):
+            return 0.01
+        if not self.ne or t not in self.ne:
             return 1
+        m = {"toxic": 2, "func": 1, "corp": 3, "loca": 3, "sch": 3, "stock": 3,
+             "firstnm": 1}
+        return m[self.ne[t]]
+
+    @staticmethod
+    def _postag_weight(t):
+        t = rag_tokenizer.tag(t)
+        if t in set(["r", "c", "d"]):
+            return 0.3
+        if t in set(["ns", "nt"]):
+            return 3
+        if t in set(["n"]):
+            return 2
+        if re.match(r"[0-9-]+", t):
+            return 2
+        return 1
 
-        def freq(t):
-            if num_space_pattern.match(t):
-                return 3
-            s = rag_tokenizer.freq(t)
-            if not s and letter_pattern.match(t):
-                return 300
-            if not s:
+    def _freq(self, t):
+        if _NUM_SPACE_PATTERN.match(t):
+            return 3
+        s = rag_tokenizer.freq(t)
+        if not s and _LETTER_PATTERN.match(t):
+            return 300
+        if not s:
+            s = 0
+
+        if not s and len(t) >= 4:
+            s = [tt for tt in rag_tokenizer.fine_grained_tokenize(t).split() if len(tt) > 1]
+            if len(s) > 1:
+                s = np.min([self._freq(tt) for tt in s]) / 6.
+            else:
                 s = 0
 
-            if not s and len(t) >= 4:
-                s = [tt for tt in rag_tokenizer.fine_grained_tokenize(t).split() if len(tt) > 1]
-                if len(s) > 1:
-                    s = np.min([freq(tt) for tt in s]) / 6.
-                else:
-                    s = 0
-
-            return max(s, 10)
-
-        def df(t):
-            if num_space_pattern.match(t):
-                return 5
-            if t in self.df:
-                return self.df[t] + 3
-            elif letter_pattern.match(t):
-                return 300
-            elif len(t) >= 4:
-                s = [tt for tt in rag_tokenizer.fine_grained_tokenize(t).split() if len(tt) > 1]
-                if len(s) > 1:
-                    return max(3, np.min([df(tt) for tt in s]) / 6.)
+        return max(s, 10)
 
-            return 3
+    def _df(self, t):
+        if _NUM_SPACE_PATTERN.match(t):
+            return 5
+        if t in self.df:
+            return self.df[t] + 3
+        elif _LETTER_PATTERN.match(t):
+            return 300
+        elif len(t) >= 4:
+            s = [tt for tt in rag_tokenizer.fine_grained_tokenize(t).split() if len(tt) > 1]
+            if len(s) > 1:
+                return max(3, np.min([self._df(tt) for tt in s]) / 6.)
 
-        def idf(s, N):
-            return math.log10(10 + ((N - s + 0.5) / (s + 0.5)))
+        return 3
 
-        tw = []
+    @staticmethod
+    def _idf(s, N):
+        return math.log10(10 + ((N - s + 0.5) / (s + 0.5)))
+
+    def _compute_token_weight(self, t):
+        idf1 = self._idf(self._freq(t), 10000000)
+        idf2 = self._idf(self._df(t), 1000000000)
+        return (0.3 * idf1 + 0.7 * idf2) * float(self._ner_weight(t) * self._postag_weight(t))
+
+    def _build_weight_table(self):
+        with self._weight_table_lock:
+            if self._weight_table is not None:
+                return self._weight_table
+            table = {}
+            for t in set(self.df) | set(self.ne):
+                if not isinstance(t, str) or not t:
+                    continue
+                try:
+                    table[t] = self._compute_token_weight(t)
+                except Exception:
+                    logging.exception(f"Failed to precompute term weight for {t}")
+            self._weight_table = table
+            return table
+
+    def token_weight(self, t):
+        """Unnormalized weight of a single token, served from the precomputed table or the OOV LRU."""
+        table = self._weight_table
+        if table is None:
+            table = self._build_weight_table()
+        w = table.get(t)
+        if w is not None:
+            return w
+        w = self._oov_weights.get(t)
+        if w is None:
+            w = self._compute_token_weight(t)
+            self._oov_weights.set(t, w)
+        return w
+
+    def _expand(self, tks, preprocess):
         if not preprocess:
-            idf1 = np.array([idf(freq(t), 10000000) for t in tks])
-            idf2 = np.array([idf(df(t), 1000000000) for t in tks])
-            wts = (0.3 * idf1 + 0.7 * idf2) * \
-                  np.array([ner(t) * postag(t) for t in tks])
-            wts = [s for s in wts]
-            tw = list(zip(tks, wts))
-        else:
-            for tk in tks:
-                tt = self.token_merge(self.pretoken(tk, True))
-                idf1 = np.array([idf(freq(t), 10000000) for t in tt])
-                idf2 = np.array([idf(df(t), 1000000000) for t in tt])
-                wts = (0.3 * idf1 + 0.7 * idf2) * \
-                      np.array([ner(t) * postag(t) for t in tt])
-                wts = [s for s in wts]
-                tw.extend(zip(tt, wts))
-
-        S = np.sum([s for _, s in tw])
-        return [(t, s / S) for t, s in tw]
+            return list(tks)
+        tt = []
+        for tk in tks:
+            tt.extend(self.token_merge(self.pretoken(tk, True)))
+        return tt
+
+    def batch_weights(self, tkss, preprocess=False):
+        """
+        Weigh many token lists at once.
+
+        Returns a list of (tokens, weights) pairs where `weights` is a float64
+        NumPy array normalized to sum to 1, aligned with `tokens`.
+        """
+        res = []
+        for tks in tkss:
+            if isinstance(tks, str):
+                tks = tks.split()
+            tt = self._expand(tks, preprocess)
+            wts = np.fromiter((self.token_weight(t) for t in tt), dtype=np.float64, count=len(tt))
+            res.append((tt, wts / np.sum(wts)))
+        return res
+
+    def weights(self, tks, preprocess=True):
+        tt, wts = self.batch_weights([tks], preprocess=preprocess)[0]
+        return list(zip(tt, wts))
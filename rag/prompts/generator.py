@@ -164,6 +164,8 @@ CROSS_LANGUAGES_USER_PROMPT_TEMPLATE = load_prompt("cross_languages_user_prompt"
 FULL_QUESTION_PROMPT_TEMPLATE = load_prompt("full_question_prompt")
 KEYWORD_PROMPT_TEMPLATE = load_prompt("keyword_prompt")
 QUESTION_PROMPT_TEMPLATE = load_prompt("question_prompt")
+KEYWORD_BATCH_PROMPT_TEMPLATE = load_prompt("keyword_batch_prompt")
+QUESTION_BATCH_PROMPT_TEMPLATE = load_prompt("question_batch_prompt")
 VISION_LLM_DESCRIBE_PROMPT = load_prompt("vision_llm_describe_prompt")
 VISION_LLM_FIGURE_DESCRIBE_PROMPT = load_prompt("vision_llm_figure_describe_prompt")
 VISION_LLM_FIGURE_DESCRIBE_PROMPT_WITH_CONTEXT = load_prompt("vision_llm_figure_describe_prompt_with_context")
@@ -221,6 +223,51 @@ async def question_proposal(chat_mdl, content, topn=3):
     return kwd
 
 
+async def _batch_chunk_analysis(chat_mdl, template, contents, topn, sep):
+    """
+    Ask for the results of all `contents` in one request. Returns a list aligned
+    with `contents`; entries the answer doesn't cover are None so the caller can
+    fall back to the per-chunk prompt.
+    """
+    rendered_prompt = PROMPT_JINJA_ENV.from_string(template).render(contents=contents, topn=topn)
+    msg = [{"role": "system", "content": rendered_prompt}, {"role": "user", "content": "Output: "}]
+    _, msg = message_fit_in(msg, chat_mdl.max_length)
+    ans = await chat_mdl.async_chat(msg[0]["content"], msg[1:], {"temperature": 0.2})
+    if isinstance(ans, tuple):
+        ans = ans[0]
+    ans = re.sub(r"^.*</think>", "", ans, flags=re.DOTALL)
+    res = [None] * len(contents)
+    if ans.find("**ERROR**") >= 0:
+        return res
+    try:
+        ans = json_repair.loads(re.sub(r"^```(json)?|```$", "", ans.strip()).strip())
+    except Exception as e:
+        logging.warning(f"Failed to parse batched chunk analysis: {e}")
+        return res
+    if not isinstance(ans, dict):
+        return res
+    for k, v in ans.items():
+        try:
+            i = int(str(k).strip()) - 1
+        except ValueError:
+            continue
+        if not 0 <= i < len(contents):
+            continue
+        if isinstance(v, list):
+            v = sep.join(str(vv).strip() for vv in v if str(vv).strip())
+        if isinstance(v, str) and v.strip():
+            res[i] = v.strip()
+    return res
+
+
+async def keyword_extraction_batch(chat_mdl, contents, topn=3):
+    return await _batch_chunk_analysis(chat_mdl, KEYWORD_BATCH_PROMPT_TEMPLATE, contents, topn, ",")
+
+
+async def question_proposal_batch(chat_mdl, contents, topn=3):
+    return await _batch_chunk_analysis(chat_mdl, QUESTION_BATCH_PROMPT_TEMPLATE, contents, topn, "\n")
+
+
 async def full_question(tenant_id=None, llm_id=None, messages=[], language=None, chat_mdl=None):
     from common.constants import LLMType
     from api.db.services.llm_service import LLMBundle
@@ -19,6 +19,7 @@ import re
 
 import numpy as np
 import umap
+import xxhash
 from sklearn.mixture import GaussianMixture
 
 from api.db.services.task_service import has_canceled
@@ -33,6 +34,21 @@ from rag.graphrag.utils import (
     set_llm_cache,
 )
 from common.misc_utils import thread_pool_exec
+from rag.utils import llm_cache
+
+RAPTOR_TREE_VERSION = 1
+# The tree is rebuilt instead of updated once the new leaves exceed this share of the ones it holds.
+RAPTOR_TREE_REBUILD_RATIO = 0.5
+
+
+def raptor_leaf_key(text: str) -> str:
+    return xxhash.xxh64(text.encode("utf-8")).hexdigest()
+
+
+def _centroid(vectors) -> list[float]:
+    centroid = np.mean([np.asarray(v, dtype=np.float64) / (np.linalg.norm(v) or 1.0) for v in vectors], axis=0)
+    centroid /= np.linalg.norm(centroid) or 1.0
+    return [round(float(x), 6) for x in centroid]
 
 
 class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
@@ -63,7 +79,7 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
 
     @timeout(60 * 20)
     async def _chat(self, system, history, gen_conf):
-        cached = await thread_pool_exec(get_llm_cache, self._llm_model.llm_name, system, history, gen_conf)
+        cached = await thread_pool_exec(get_llm_cache, self._llm_model.llm_name, system, history, gen_conf, llm_cache.RAPTOR)
         if cached:
             return cached
 
@@ -74,7 +90,7 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
                 response = re.sub(r"^.*</think>", "", response, flags=re.DOTALL)
                 if response.find("**ERROR**") >= 0:
                     raise Exception(response)
-                await thread_pool_exec(set_llm_cache,self._llm_model.llm_name,system,response,history,gen_conf)
+                await thread_pool_exec(set_llm_cache, self._llm_model.llm_name, system, response, history, gen_conf, llm_cache.RAPTOR)
                 return response
             except Exception as exc:
                 last_exc = exc
@@ -98,68 +114,103 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
 
     def _get_optimal_clusters(self, embeddings: np.ndarray, random_state: int, task_id: str = ""):
         max_clusters = min(self._max_cluster, len(embeddings))
-        n_clusters = np.arange(1, max_clusters)
-        bics = []
-        for n in n_clusters:
-            self._check_task_canceled(task_id, "get optimal clusters")
+        n_clusters = list(range(1, max_clusters))
+        if len(n_clusters) <= 1:
+            return 1
+        bics = {}
+
+        def bic(n):
+            if n not in bics:
+                self._check_task_canceled(task_id, "get optimal clusters")
+                gm = GaussianMixture(n_components=n, random_state=random_state)
+                gm.fit(embeddings)
+                bics[n] = gm.bic(embeddings)
+            return bics[n]
+
+        # Coarse-to-fine: sweep every `step`-th k, then every k around the best coarse one.
+        step = max(1, int(len(n_clusters) ** 0.5))
+        best = min(n_clusters[::step], key=bic)
+        return min(range(max(1, best - step + 1), min(max_clusters - 1, best + step - 1) + 1), key=bic)
+
+    @timeout(60 * 20)
+    async def _summarize(self, texts: list[str], task_id: str = ""):
+        self._check_task_canceled(task_id, "summarization")
+
+        len_per_chunk = int((self._llm_model.max_length - self._max_token) / len(texts))
+        cluster_content = "\n".join([truncate(t, max(1, len_per_chunk)) for t in texts])
+        async with chat_limiter:
+            self._check_task_canceled(task_id, "before LLM call")
+
+            cnt = await self._chat(
+                "You're a helpful assistant.",
+                [
+                    {
+                        "role": "user",
+                        "content": self._prompt.format(cluster_content=cluster_content),
+                    }
+                ],
+                {"max_tokens": max(self._max_token, 512)},  # fix issue:  #10235
+            )
+            cnt = re.sub(
+                "(······\n由于长度的原因，回答被截断了，要继续吗？|For the content length reason, it stopped, continue?)",
+                "",
+                cnt,
+            )
+            logging.debug(f"SUM: {cnt}")
 
-            gm = GaussianMixture(n_components=n, random_state=random_state)
-            gm.fit(embeddings)
-            bics.append(gm.bic(embeddings))
-        optimal_clusters = n_clusters[np.argmin(bics)]
-        return optimal_clusters
+            self._check_task_canceled(task_id, "before embedding")
+
+            embds = await self._embedding_encode(cnt)
+        return cnt, embds
+
+    def _skip_cluster(self, size: int, exc: Exception, callback=None):
+        self._error_count += 1
+        warn_msg = f"[RAPTOR] Skip cluster ({size} chunks) due to error: {exc}"
+        logging.warning(warn_msg)
+        if callback:
+            callback(msg=warn_msg)
+        if self._error_count >= self._max_errors:
+            raise RuntimeError(f"RAPTOR aborted after {self._error_count} errors. Last error: {exc}") from exc
+
+    @staticmethod
+    async def _gather(coros):
+        tasks = [asyncio.create_task(c) for c in coros]
+        try:
+            await asyncio.gather(*tasks, return_exceptions=False)
+        except Exception as e:
+            logging.error(f"Error in RAPTOR cluster processing: {e}")
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
 
     async def __call__(self, chunks, random_state, callback=None, task_id: str = ""):
+        chunks, _ = await self._build(chunks, random_state, callback, task_id)
+        return chunks
+
+    async def _build(self, chunks, random_state, callback=None, task_id: str = ""):
+        """
+        Build the tree over `chunks` and return the chunks followed by the summaries, together
+        with the clusters as (layer, member indexes, summary index).
+        """
         if len(chunks) <= 1:
-            return []
+            return [], []
         chunks = [(s, a) for s, a in chunks if s and a is not None and len(a) > 0]
         layers = [(0, len(chunks))]
         start, end = 0, len(chunks)
+        clusters = []
 
-        @timeout(60 * 20)
-        async def summarize(ck_idx: list[int]):
+        async def summarize(ck_idx: list[int], layer: int):
             nonlocal chunks
-
-            self._check_task_canceled(task_id, "summarization")
-
-            texts = [chunks[i][0] for i in ck_idx]
-            len_per_chunk = int((self._llm_model.max_length - self._max_token) / len(texts))
-            cluster_content = "\n".join([truncate(t, max(1, len_per_chunk)) for t in texts])
             try:
-                async with chat_limiter:
-                    self._check_task_canceled(task_id, "before LLM call")
-
-                    cnt = await self._chat(
-                        "You're a helpful assistant.",
-                        [
-                            {
-                                "role": "user",
-                                "content": self._prompt.format(cluster_content=cluster_content),
-                            }
-                        ],
-                        {"max_tokens": max(self._max_token, 512)},  # fix issue:  #10235
-                    )
-                    cnt = re.sub(
-                        "(······\n由于长度的原因，回答被截断了，要继续吗？|For the content length reason, it stopped, continue?)",
-                        "",
-                        cnt,
-                    )
-                    logging.debug(f"SUM: {cnt}")
-
-                    self._check_task_canceled(task_id, "before embedding")
-
-                    embds = await self._embedding_encode(cnt)
-                    chunks.append((cnt, embds))
+                cnt, embds = await self._summarize([chunks[i][0] for i in ck_idx], task_id)
             except TaskCanceledException:
                 raise
             except Exception as exc:
-                self._error_count += 1
-                warn_msg = f"[RAPTOR] Skip cluster ({len(ck_idx)} chunks) due to error: {exc}"
-                logging.warning(warn_msg)
-                if callback:
-                    callback(msg=warn_msg)
-                if self._error_count >= self._max_errors:
-                    raise RuntimeError(f"RAPTOR aborted after {self._error_count} errors. Last error: {exc}") from exc
+                self._skip_cluster(len(ck_idx), exc, callback)
+                return
+            clusters.append((layer, ck_idx, len(chunks)))
+            chunks.append((cnt, embds))
 
         labels = []
         while end - start > 1:
@@ -167,7 +218,7 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
 
             embeddings = [embd for _, embd in chunks[start:end]]
             if len(embeddings) == 2:
-                await summarize([start, start + 1])
+                await summarize([start, start + 1], len(layers) - 1)
                 if callback:
                     callback(msg="Cluster one layer: {} -> {}".format(end - start, len(chunks) - end))
                 labels.extend([0, 0])
@@ -192,20 +243,13 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
                 lbls = [np.where(prob > self._threshold)[0] for prob in probs]
                 lbls = [lbl[0] if isinstance(lbl, np.ndarray) else lbl for lbl in lbls]
 
-            tasks = []
+            coros = []
             for c in range(n_clusters):
                 ck_idx = [i + start for i in range(len(lbls)) if lbls[i] == c]
                 assert len(ck_idx) > 0
                 self._check_task_canceled(task_id, "before cluster processing")
-                tasks.append(asyncio.create_task(summarize(ck_idx)))
-            try:
-                await asyncio.gather(*tasks, return_exceptions=False)
-            except Exception as e:
-                logging.error(f"Error in RAPTOR cluster processing: {e}")
-                for t in tasks:
-                    t.cancel()
-                await asyncio.gather(*tasks, return_exceptions=True)
-                raise
+                coros.append(summarize(ck_idx, len(layers) - 1))
+            await self._gather(coros)
 
             assert len(chunks) - end == n_clusters, "{} vs. {}".format(len(chunks) - end, n_clusters)
             labels.extend(lbls)
@@ -215,4 +259,132 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
             start = end
             end = len(chunks)
 
-        return chunks
+        return chunks, clusters
+
+    def _tree_config(self, random_state, dim):
+        return {
+            "prompt": self._prompt,
+            "max_token": self._max_token,
+            "threshold": self._threshold,
+            "max_cluster": self._max_cluster,
+            "random_seed": random_state,
+            "embd": f"{self._embd_model.llm_name}/{dim}",
+        }
+
+    async def update(self, chunks, tree, random_state, callback=None, task_id: str = ""):
+        """
+        Bring a persisted RAPTOR tree up to date with the current leaf `chunks`.
+
+        New leaves are assigned to the nearest layer-0 centroid, and only the clusters whose
+        membership changed are summarized again, together with their ancestors. The tree is built
+        from scratch when there is none, its configuration changed, or the new leaves outnumber
+        RAPTOR_TREE_REBUILD_RATIO of the ones it holds.
+
+        Returns the new summaries as (text, embedding), the updated tree and the texts of the old
+        summaries it no longer contains.
+        """
+        leaves = {}
+        for txt, vec in chunks:
+            if txt and vec is not None and len(vec) > 0:
+                leaves.setdefault(raptor_leaf_key(txt), (txt, vec))
+        dim = len(next(iter(leaves.values()))[1]) if leaves else 0
+        config = self._tree_config(random_state, dim)
+
+        old_summaries = [c["summary"] for c in (tree or {}).get("clusters", [])]
+        kept = sum(1 for k in leaves if k in tree["leaves"]) if tree else 0
+        if (
+            not tree
+            or tree.get("version") != RAPTOR_TREE_VERSION
+            or tree.get("config") != config
+            or kept <= 1
+            or not any(c["layer"] == 0 for c in tree["clusters"])
+            or len(leaves) - kept > kept * RAPTOR_TREE_REBUILD_RATIO
+        ):
+            summaries, tree = await self._build_tree(leaves, config, random_state, callback, task_id)
+        else:
+            summaries, tree = await self._update_tree(tree, leaves, callback, task_id)
+
+        current = set(c["summary"] for c in tree["clusters"])
+        return summaries, tree, [s for s in old_summaries if s not in current]
+
+    async def _build_tree(self, leaves, config, random_state, callback=None, task_id: str = ""):
+        keys = list(leaves.keys())
+        chunks, clusters = await self._build([leaves[k] for k in keys], random_state, callback, task_id)
+
+        refs = dict(enumerate(keys))
+        for n, (_, _, s) in enumerate(clusters):
+            refs[s] = f"c{n}"
+        tree = {"version": RAPTOR_TREE_VERSION, "config": config, "leaves": {k: "" for k in keys}, "clusters": []}
+        for layer, members, s in clusters:
+            cluster = {"id": refs[s], "layer": layer, "members": [refs[i] for i in members], "summary": chunks[s][0]}
+            if layer == 0:
+                cluster["centroid"] = _centroid([chunks[i][1] for i in members])
+                tree["leaves"].update({m: refs[s] for m in cluster["members"]})
+            tree["clusters"].append(cluster)
+        return chunks[len(keys):], tree
+
+    async def _update_tree(self, tree, leaves, callback=None, task_id: str = ""):
+        clusters = {c["id"]: dict(c) for c in tree["clusters"]}
+        parent = {m: c["id"] for c in clusters.values() if c["layer"] > 0 for m in c["members"]}
+        layer0 = [c for c in clusters.values() if c["layer"] == 0]
+        dirty = set()
+
+        assigned = set()
+        for c in layer0:
+            members = [m for m in c["members"] if m in leaves]
+            if len(members) != len(c["members"]):
+                c["members"] = members
+                dirty.add(c["id"])
+            assigned.update(members)
+
+        new_keys = [k for k in leaves if k not in assigned]
+        if new_keys:
+            centroids = np.array([c["centroid"] for c in layer0])
+            vectors = np.array([leaves[k][1] for k in new_keys], dtype=np.float64)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            for k, j in zip(new_keys, np.argmax(vectors @ centroids.T, axis=1)):
+                layer0[j]["members"] = layer0[j]["members"] + [k]
+                dirty.add(layer0[j]["id"])
+
+        summaries = []
+
+        async def resummarize(c):
+            texts = [leaves[m][0] if c["layer"] == 0 else clusters[m]["summary"] for m in c["members"]]
+            try:
+                cnt, embds = await self._summarize(texts, task_id)
+            except TaskCanceledException:
+                raise
+            except Exception as exc:
+                # Keep the previous summary of the cluster.
+                self._skip_cluster(len(texts), exc, callback)
+                return
+            c["summary"] = cnt
+            summaries.append((cnt, embds))
+
+        resummarized = 0
+        for layer in range(max(c["layer"] for c in clusters.values()) + 1):
+            self._check_task_canceled(task_id, "layer processing")
+            todo = []
+            for cid in sorted(cid for cid in dirty if cid in clusters and clusters[cid]["layer"] == layer):
+                c = clusters[cid]
+                if cid in parent:
+                    dirty.add(parent[cid])
+                if not c["members"]:
+                    del clusters[cid]
+                    if cid in parent:
+                        clusters[parent[cid]]["members"] = [m for m in clusters[parent[cid]]["members"] if m != cid]
+                    continue
+                if layer == 0:
+                    c["centroid"] = _centroid([leaves[m][1] for m in c["members"]])
+                todo.append(c)
+            await self._gather([resummarize(c) for c in todo])
+            resummarized += len(todo)
+
+        if callback:
+            removed = sum(1 for k in tree["leaves"] if k not in leaves)
+            callback(msg=f"RAPTOR tree updated: {len(new_keys)} new chunks, {removed} removed, {resummarized} clusters summarized again.")
+        tree = dict(tree, leaves={}, clusters=sorted(clusters.values(), key=lambda c: (c["layer"], c["id"])))
+        for c in tree["clusters"]:
+            if c["layer"] == 0:
+                tree["leaves"].update({m: c["id"] for m in c["members"]})
+        return summaries, tree
@@ -0,0 +1,175 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Process pool running the `chunk` function of the parser modules (CHUNK_WORKERS > 0).
+
+Parsing is CPU-bound Python, so threads of one executor mostly wait on the GIL. Each
+worker process initializes the settings and loads the OCR, layout and table structure
+ONNX sessions once at start-up (the small XGBoost text-concat model is still read by every
+parser). The document is handed over as a temp file path, and the worker streams its
+progress callbacks and then its chunks, CHUNK_WORKER_BATCH_SIZE at a time, back over one
+event queue shared by all workers.
+
+A worker that dies (e.g. OOM-killed on a large PDF) breaks its ProcessPoolExecutor: the
+jobs in flight fail and `get_chunk_worker_pool` starts a new pool for the next ones.
+"""
+
+import asyncio
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import importlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import uuid
+
+from common.exceptions import TaskCanceledException
+
+CHUNK_WORKERS = int(os.environ.get("CHUNK_WORKERS", "0"))
+CHUNK_WORKER_BATCH_SIZE = int(os.environ.get("CHUNK_WORKER_BATCH_SIZE", "64"))
+
+# Worker side: the event queue, set by _init_worker.
+_events = None
+_reporter = None
+
+
+def _init_worker(events, logfile_basename):
+    global _events, _reporter
+    from common import settings
+    from common.log_utils import init_root_logger
+    from rag.svr.task_progress import TaskProgressReporter
+
+    _events = events
+    _reporter = TaskProgressReporter()
+    init_root_logger(logfile_basename)
+    settings.init_settings()
+    try:
+        from deepdoc.parser.pdf_parser import RAGFlowPdfParser
+
+        # The ONNX sessions are cached per process, later parsers of this worker reuse them.
+        RAGFlowPdfParser()
+    except Exception:
+        logging.exception("Chunk worker failed to pre-load the deepdoc models")
+    logging.info(f"Chunk worker {os.getpid()} is ready")
+
+
+def _chunk_job(job_id, module_name, task_id, filename, path, kwargs):
+    def callback(prog=None, msg="Processing..."):
+        if _reporter.canceled(task_id):
+            raise TaskCanceledException(f"Task {task_id} was cancelled")
+        _events.put((job_id, "progress", (prog, msg)))
+
+    try:
+        with open(path, "rb") as f:
+            binary = f.read()
+        cks = importlib.import_module(module_name).chunk(filename, binary=binary, callback=callback, **kwargs)
+        for i in range(0, len(cks), CHUNK_WORKER_BATCH_SIZE):
+            _events.put((job_id, "chunks", cks[i : i + CHUNK_WORKER_BATCH_SIZE]))
+        _events.put((job_id, "done", len(cks)))
+    except BaseException as e:
+        try:
+            _events.put((job_id, "error", e))
+        except Exception:
+            # Not picklable.
+            _events.put((job_id, "error", RuntimeError(str(e))))
+
+
+class ChunkWorkerPool:
+    def __init__(self, workers: int, logfile_basename: str):
+        ctx = multiprocessing.get_context("spawn")
+        # A SimpleQueue pickles in put(), so a chunk that can't be sent fails the job instead of being dropped.
+        self._events = ctx.SimpleQueue()
+        self._pool = concurrent.futures.ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_worker, initargs=(self._events, logfile_basename))
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.broken = False
+        threading.Thread(target=self._dispatch, name="chunk_worker_events", daemon=True).start()
+        # Workers are spawned on demand; one no-op job per worker starts them all (and loads their models) now.
+        for _ in range(workers):
+            self._pool.submit(os.getpid)
+
+    def _dispatch(self):
+        while True:
+            job_id, kind, payload = self._events.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+            if job:
+                loop, queue = job
+                loop.call_soon_threadsafe(queue.put_nowait, (kind, payload))
+
+    async def chunk(self, chunker, filename, binary, task_id, callback=None, **kwargs):
+        """Run `chunker.chunk(filename, binary=binary, callback=callback, **kwargs)` in a worker process."""
+        loop = asyncio.get_running_loop()
+        job_id = uuid.uuid4().hex
+        queue = asyncio.Queue()
+        with self._lock:
+            self._jobs[job_id] = (loop, queue)
+        fd, path = tempfile.mkstemp(prefix="chunk_")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(binary)
+            fut = loop.run_in_executor(self._pool, _chunk_job, job_id, chunker.__name__, task_id, filename, path, kwargs)
+            cks = []
+            while True:
+                get = asyncio.ensure_future(queue.get())
+                await asyncio.wait([get, fut], return_when=asyncio.FIRST_COMPLETED)
+                if not get.done():
+                    get.cancel()
+                    # The job always ends with a done/error event unless the worker died.
+                    if fut.exception():
+                        raise fut.exception()
+                    get = asyncio.ensure_future(queue.get())
+                    await get
+                kind, payload = get.result()
+                if kind == "progress":
+                    if callback:
+                        callback(*payload)
+                elif kind == "chunks":
+                    cks.extend(payload)
+                elif kind == "error":
+                    raise payload
+                else:
+                    return cks
+        except BrokenProcessPool:
+            self.broken = True
+            logging.error(f"A chunk worker died while parsing {filename}, the worker pool is replaced")
+            raise
+        finally:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            os.remove(path)
+
+    def shutdown(self):
+        # The dispatcher thread is left blocked on the event queue: a worker that died while
+        # writing to it may still hold its lock.
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_chunk_worker_pool(logfile_basename: str) -> ChunkWorkerPool:
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool.broken:
+            _pool.shutdown()
+            _pool = None
+        if _pool is None:
+            _pool = ChunkWorkerPool(CHUNK_WORKERS, logfile_basename)
+        return _pool
@@ -38,12 +38,14 @@ from api.db.joint_services.memory_message_service import handle_save_to_memory_t
 from common.connection_utils import timeout
 from common.metadata_utils import turn2jsonschema, update_metadata_to
 from rag.utils.base64_image import image2id
-from rag.utils.raptor_utils import should_skip_raptor, get_skip_reason
+from rag.utils import llm_cache
+from deepdoc.vision.ocr import ocr_stats
+from rag.utils.raptor_utils import should_skip_raptor, get_skip_reason, raptor_tree_id
 from common.log_utils import init_root_logger
 from common.config_utils import show_configs
 from rag.graphrag.general.index import run_graphrag_for_kb
-from rag.graphrag.utils import get_llm_cache, set_llm_cache, get_tags_from_cache, set_tags_to_cache
-from rag.prompts.generator import keyword_extraction, question_proposal, content_tagging, run_toc_from_text, gen_metadata
+from rag.graphrag.utils import get_tags_from_cache, set_tags_to_cache, get_embed_cache_many, set_embed_cache_many
+from rag.prompts.generator import keyword_extraction, keyword_extraction_batch, question_proposal, question_proposal_batch, content_tagging, run_toc_from_text, gen_metadata
 import logging
 import os
 from datetime import datetime
@@ -66,13 +68,14 @@ from api.db.services.llm_service import LLMBundle
 from api.db.services.task_service import TaskService, has_canceled, CANVAS_DEBUG_DOC_ID, GRAPH_RAPTOR_FAKE_DOC_ID
 from api.db.services.file2document_service import File2DocumentService
 from common.versions import get_ragflow_version
-from api.db.db_models import close_connection
 from rag.app import laws, paper, presentation, manual, qa, table, book, resume, picture, naive, one, audio, email, tag, interrogation
 from rag.nlp import search, rag_tokenizer, add_positions, add_bbox_union, add_page_range
 from rag.nlp.interrogation_extractor import async_enhance_chunk_with_metadata
 from rag.raptor import RecursiveAbstractiveProcessing4TreeOrganizedRetrieval as Raptor
 from common.token_utils import num_tokens_from_string, truncate
 from rag.utils.redis_conn import REDIS_CONN, RedisDistributedLock
+from rag.svr.chunk_workers import CHUNK_WORKERS, get_chunk_worker_pool
+from rag.svr.task_progress import TaskProgressReporter
 from rag.graphrag.utils import chat_limiter
 from common.signal_utils import start_tracemalloc_and_snapshot, stop_tracemalloc
 from common.exceptions import TaskCanceledException
@@ -125,11 +128,29 @@ MAX_CONCURRENT_TASKS = int(os.environ.get("MAX_CONCURRENT_TASKS", "5"))
 MAX_CONCURRENT_CHUNK_BUILDERS = int(os.environ.get("MAX_CONCURRENT_CHUNK_BUILDERS", "1"))
 MAX_CONCURRENT_MINIO = int(os.environ.get("MAX_CONCURRENT_MINIO", "10"))
 task_limiter = asyncio.Semaphore(MAX_CONCURRENT_TASKS)
-chunk_limiter = asyncio.Semaphore(MAX_CONCURRENT_CHUNK_BUILDERS)
-embed_limiter = asyncio.Semaphore(MAX_CONCURRENT_CHUNK_BUILDERS)
+# With chunk worker processes (CHUNK_WORKERS), every worker can build chunks at the same time.
+chunk_limiter = asyncio.Semaphore(max(MAX_CONCURRENT_CHUNK_BUILDERS, CHUNK_WORKERS))
+MAX_CONCURRENT_EMBEDDING_BATCHES = int(os.environ.get("MAX_CONCURRENT_EMBEDDING_BATCHES", "4"))
+# Held per embedding batch: as many batches in flight as the chunk builders each running theirs.
+embed_limiter = asyncio.Semaphore(MAX_CONCURRENT_CHUNK_BUILDERS * MAX_CONCURRENT_EMBEDDING_BATCHES)
 minio_limiter = asyncio.Semaphore(MAX_CONCURRENT_MINIO)
 kg_limiter = asyncio.Semaphore(2)
+embedding_batch_limiters = {}
+# Streaming mode overlaps chunking stages instead of running them document-wide one after another.
+STREAMING_CHUNK_PIPELINE = os.environ.get("STREAMING_CHUNK_PIPELINE", "false").lower() in ["true", "1", "yes"]
+STREAM_GROUP_SIZE = int(os.environ.get("STREAM_GROUP_SIZE", "64"))
+STREAM_QUEUE_SIZE = int(os.environ.get("STREAM_QUEUE_SIZE", "2"))
+CHUNK_IDS_CHECKPOINT_SIZE = int(os.environ.get("CHUNK_IDS_CHECKPOINT_SIZE", "1024"))
+CHUNK_IDS_CHECKPOINT_INTERVAL = float(os.environ.get("CHUNK_IDS_CHECKPOINT_INTERVAL", "10"))
 WORKER_HEARTBEAT_TIMEOUT = int(os.environ.get("WORKER_HEARTBEAT_TIMEOUT", "120"))
+# Opt-in: every chunk vector is kept in Redis for EMBED_CACHE_TTL (24h by default), which adds up
+# to about 4 * dim bytes per chunk parsed in that window. Give Redis a maxmemory with an
+# allkeys-lru/volatile-lru policy, or lower EMBED_CACHE_TTL, before enabling it.
+EMBEDDING_CACHE_ENABLED = os.environ.get("EMBEDDING_CACHE_ENABLED", "false").lower() in ["true", "1", "yes"]
+# Chunks per keyword/question prompt; 1 keeps one LLM request per chunk.
+ENRICHMENT_BATCH_SIZE = int(os.environ.get("ENRICHMENT_BATCH_SIZE", "1"))
+ENRICHMENT_BATCH_MAX_TOKENS = int(os.environ.get("ENRICHMENT_BATCH_MAX_TOKENS", "2048"))
+PROGRESS_REPORTER = TaskProgressReporter()
 stop_event = threading.Event()
 
 
@@ -140,11 +161,17 @@ def signal_handler(sig, frame):
     sys.exit(0)
 
 
+def embedding_batch_limiter(llm_name):
+    if llm_name not in embedding_batch_limiters:
+        embedding_batch_limiters[llm_name] = asyncio.Semaphore(MAX_CONCURRENT_EMBEDDING_BATCHES)
+    return embedding_batch_limiters[llm_name]
+
+
 def set_progress(task_id, from_page=0, to_page=-1, prog=None, msg="Processing..."):
     try:
         if prog is not None and prog < 0:
             msg = "[ERROR]" + msg
-        cancel = has_canceled(task_id)
+        cancel = PROGRESS_REPORTER.canceled(task_id)
 
         if cancel:
             msg += " [Canceled]"
@@ -156,20 +183,14 @@ def set_progress(task_id, from_page=0, to_page=-1, prog=None, msg="Processing...
                     msg = f"Page({from_page + 1}~{to_page + 1}): " + msg
         if msg:
             msg = datetime.now().strftime("%H:%M:%S") + " " + msg
-        d = {"progress_msg": msg}
-        if prog is not None:
-            d["progress"] = prog
 
-        TaskService.update_progress(task_id, d)
+        PROGRESS_REPORTER.report(task_id, prog, msg)
 
-        close_connection()
         if cancel:
             raise TaskCanceledException(msg)
         logging.info(f"set_progress({task_id}), progress: {prog}, progress_msg: {msg}")
     except TaskCanceledException:
         raise
-    except DoesNotExist:
-        logging.warning(f"set_progress({task_id}) got exception DoesNotExist")
     except Exception as e:
         logging.exception(f"set_progress({task_id}), progress: {prog}, progress_msg: {msg}, got exception: {e}")
 
@@ -248,6 +269,12 @@ async def build_chunks(task, progress_callback):
         set_progress(task["id"], prog=-1, msg="File size exceeds( <= %dMb )" % (int(settings.DOC_MAXIMUM_SIZE / 1024 / 1024)))
         return []
 
+    cks = await chunk_document(task, progress_callback)
+    docs = await upload_chunk_images(task, cks)
+    return await enrich_chunks(task, docs, progress_callback)
+
+
+async def chunk_document(task, progress_callback):
     chunker = FACTORY[task["parser_id"].lower()]
     try:
         st = timer()
@@ -268,18 +295,33 @@ async def build_chunks(task, progress_callback):
 
     try:
         async with chunk_limiter:
-            cks = await thread_pool_exec(
-                chunker.chunk,
-                task["name"],
-                binary=binary,
-                from_page=task["from_page"],
-                to_page=task["to_page"],
-                lang=task["language"],
-                callback=progress_callback,
-                kb_id=task["kb_id"],
-                parser_config=task["parser_config"],
-                tenant_id=task["tenant_id"],
-            )
+            if CHUNK_WORKERS > 0:
+                cks = await get_chunk_worker_pool(CONSUMER_NAME).chunk(
+                    chunker,
+                    task["name"],
+                    binary,
+                    task["id"],
+                    callback=progress_callback,
+                    from_page=task["from_page"],
+                    to_page=task["to_page"],
+                    lang=task["language"],
+                    kb_id=task["kb_id"],
+                    parser_config=task["parser_config"],
+                    tenant_id=task["tenant_id"],
+                )
+            else:
+                cks = await thread_pool_exec(
+                    chunker.chunk,
+                    task["name"],
+                    binary=binary,
+                    from_page=task["from_page"],
+                    to_page=task["to_page"],
+                    lang=task["language"],
+                    callback=progress_callback,
+                    kb_id=task["kb_id"],
+                    parser_config=task["parser_config"],
+                    tenant_id=task["tenant_id"],
+                )
         logging.info("Chunking({}) {}/{} done".format(timer() - st, task["location"], task["name"]))
     except TaskCanceledException:
         raise
@@ -287,7 +329,10 @@ async def build_chunks(task, progress_callback):
         progress_callback(-1, "Internal server error while chunking: %s" % str(e).replace("'", ""))
         logging.exception("Chunking {}/{} got exception".format(task["location"], task["name"]))
         raise
+    return cks
 
+
+async def upload_chunk_images(task, cks):
     docs = []
     doc = {"doc_id": task["doc_id"], "kb_id": str(task["kb_id"])}
     if task["pagerank"]:
@@ -336,75 +381,125 @@ async def build_chunks(task, progress_callback):
 
     el = timer() - st
     logging.info("MINIO PUT({}) cost {:.3f} s".format(task["name"], el))
+    return docs
 
-    if task["parser_config"].get("auto_keywords", 0):
-        st = timer()
-        progress_callback(msg="Start to generate keywords for every chunk ...")
-        chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
 
-        async def doc_keyword_extraction(chat_mdl, d, topn):
-            cached = get_llm_cache(chat_mdl.llm_name, d["content_with_weight"], "keywords", {"topn": topn})
-            if not cached:
-                if has_canceled(task["id"]):
-                    progress_callback(-1, msg="Task has been canceled.")
-                    return
-                async with chat_limiter:
-                    cached = await keyword_extraction(chat_mdl, d["content_with_weight"], topn)
-                set_llm_cache(chat_mdl.llm_name, d["content_with_weight"], cached, "keywords", {"topn": topn})
-            if cached:
-                d["important_kwd"] = cached.split(",")
-                d["important_tks"] = rag_tokenizer.tokenize(" ".join(d["important_kwd"]))
+def pack_enrichment_batches(contents: list[str], idxs: list[int]) -> list[list[int]]:
+    """
+    Greedily group the chunks `idxs` point at into prompts of at most ENRICHMENT_BATCH_SIZE
+    chunks and ENRICHMENT_BATCH_MAX_TOKENS tokens. A chunk too long to share a prompt
+    ends up alone in its group.
+    """
+    groups, group, group_tokens = [], [], 0
+    for i in idxs:
+        tokens = num_tokens_from_string(contents[i])
+        if group and (len(group) >= ENRICHMENT_BATCH_SIZE or group_tokens + tokens > ENRICHMENT_BATCH_MAX_TOKENS):
+            groups.append(group)
+            group, group_tokens = [], 0
+        group.append(i)
+        group_tokens += tokens
+    if group:
+        groups.append(group)
+    return groups
+
+
+async def run_chunk_llm_phase(task, chat_mdl, docs, purpose, history, genconf, progress_callback, ask, ask_batch=None):
+    """
+    Get the LLM answer for every chunk of `docs`, aligned with `docs`.
+
+    The LLM cache of `purpose` is checked with one pipelined lookup. Misses are asked with `ask` one chunk
+    at a time or, when ENRICHMENT_BATCH_SIZE > 1 and `ask_batch` is given, several chunks per
+    prompt; chunks the batched answer leaves out fall back to `ask`.
+    """
+    contents = [d["content_with_weight"] for d in docs]
+    answers = await thread_pool_exec(llm_cache.lookup_many, purpose, chat_mdl.llm_name, contents, history, genconf)
+    missed = [i for i, a in enumerate(answers) if not a]
+    if not missed:
+        return answers
+
+    async def store(indices):
+        # Cached as they come, so what was paid for survives a failing chunk or a cancel.
+        answered = [i for i in indices if answers[i]]
+        if answered:
+            await thread_pool_exec(llm_cache.store_many, purpose, chat_mdl.llm_name, [contents[i] for i in answered], [answers[i] for i in answered], history, genconf)
+
+    async def ask_one(i):
+        if has_canceled(task["id"]):
+            progress_callback(-1, msg="Task has been canceled.")
             return
+        async with chat_limiter:
+            answers[i] = await ask(chat_mdl, contents[i])
+        await store([i])
 
-        tasks = []
-        for d in docs:
-            tasks.append(asyncio.create_task(doc_keyword_extraction(chat_mdl, d, task["parser_config"]["auto_keywords"])))
+    async def ask_group(group):
+        if len(group) == 1:
+            await ask_one(group[0])
+            return
+        if has_canceled(task["id"]):
+            progress_callback(-1, msg="Task has been canceled.")
+            return
+        async with chat_limiter:
+            res = await ask_batch(chat_mdl, [contents[i] for i in group])
+        for i, a in zip(group, res):
+            answers[i] = a
+        await store(group)
+        for i in group:
+            if not answers[i]:
+                await ask_one(i)
+
+    if ask_batch and ENRICHMENT_BATCH_SIZE > 1:
+        tasks = [asyncio.create_task(ask_group(g)) for g in pack_enrichment_batches(contents, missed)]
+    else:
+        tasks = [asyncio.create_task(ask_one(i)) for i in missed]
+    try:
+        await asyncio.gather(*tasks, return_exceptions=False)
+    except Exception:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    return answers
+
+
+async def enrich_chunks(task, docs, progress_callback):
+    chat_mdl = None
+
+    async def gen_keywords():
+        st = timer()
+        progress_callback(msg="Start to generate keywords for every chunk ...")
+        topn = task["parser_config"]["auto_keywords"]
         try:
-            await asyncio.gather(*tasks, return_exceptions=False)
+            answers = await run_chunk_llm_phase(task, chat_mdl, docs, llm_cache.KEYWORDS, "keywords", {"topn": topn}, progress_callback,
+                                                partial(keyword_extraction, topn=topn), partial(keyword_extraction_batch, topn=topn))
         except Exception as e:
             logging.error("Error in doc_keyword_extraction: {}".format(e))
-            for t in tasks:
-                t.cancel()
-            await asyncio.gather(*tasks, return_exceptions=True)
             raise
+        for d, kwd in zip(docs, answers):
+            if kwd:
+                d["important_kwd"] = kwd.split(",")
+                d["important_tks"] = rag_tokenizer.tokenize(" ".join(d["important_kwd"]))
         progress_callback(msg="Keywords generation {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
 
-    if task["parser_config"].get("auto_questions", 0):
+    async def gen_questions():
         st = timer()
         progress_callback(msg="Start to generate questions for every chunk ...")
-        chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
-
-        async def doc_question_proposal(chat_mdl, d, topn):
-            cached = get_llm_cache(chat_mdl.llm_name, d["content_with_weight"], "question", {"topn": topn})
-            if not cached:
-                if has_canceled(task["id"]):
-                    progress_callback(-1, msg="Task has been canceled.")
-                    return
-                async with chat_limiter:
-                    cached = await question_proposal(chat_mdl, d["content_with_weight"], topn)
-                set_llm_cache(chat_mdl.llm_name, d["content_with_weight"], cached, "question", {"topn": topn})
-            if cached:
-                d["question_kwd"] = cached.split("\n")
-                d["question_tks"] = rag_tokenizer.tokenize("\n".join(d["question_kwd"]))
-
-        tasks = []
-        for d in docs:
-            tasks.append(asyncio.create_task(doc_question_proposal(chat_mdl, d, task["parser_config"]["auto_questions"])))
+        topn = task["parser_config"]["auto_questions"]
         try:
-            await asyncio.gather(*tasks, return_exceptions=False)
+            answers = await run_chunk_llm_phase(task, chat_mdl, docs, llm_cache.QUESTIONS, "question", {"topn": topn}, progress_callback,
+                                                partial(question_proposal, topn=topn), partial(question_proposal_batch, topn=topn))
         except Exception as e:
             logging.error("Error in doc_question_proposal", exc_info=e)
-            for t in tasks:
-                t.cancel()
-            await asyncio.gather(*tasks, return_exceptions=True)
             raise
+        for d, qst in zip(docs, answers):
+            if qst:
+                d["question_kwd"] = qst.split("\n")
+                d["question_tks"] = rag_tokenizer.tokenize("\n".join(d["question_kwd"]))
         progress_callback(msg="Question generation {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
 
     # Interrogation-specific LLM enhancement
-    if task["parser_id"].lower() == "interrogation":
+    async def gen_interrogation_metadata():
         st = timer()
         progress_callback(msg="Start to extract metadata for interrogation record ...")
-        chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
 
         async def interrogation_metadata_task(chat_mdl, d):
             if has_canceled(task["id"]):
@@ -439,44 +534,54 @@ async def build_chunks(task, progress_callback):
             DocMetadataService.update_document_metadata(task["doc_id"], metadata)
         progress_callback(msg="Interrogation metadata extraction completed in {:.2f}s".format(timer() - st))
 
-    if task["parser_config"].get("enable_metadata", False) and task["parser_config"].get("metadata"):
+    async def gen_chunk_metadata():
         st = timer()
         progress_callback(msg="Start to generate meta-data for every chunk ...")
-        chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
 
-        async def gen_metadata_task(chat_mdl, d):
-            cached = get_llm_cache(chat_mdl.llm_name, d["content_with_weight"], "metadata", task["parser_config"]["metadata"])
-            if not cached:
-                if has_canceled(task["id"]):
-                    progress_callback(-1, msg="Task has been canceled.")
-                    return
-                async with chat_limiter:
-                    cached = await gen_metadata(chat_mdl, turn2jsonschema(task["parser_config"]["metadata"]), d["content_with_weight"])
-                set_llm_cache(chat_mdl.llm_name, d["content_with_weight"], cached, "metadata", task["parser_config"]["metadata"])
-            if cached:
-                d["metadata_obj"] = cached
+        async def ask(chat_mdl, content):
+            return await gen_metadata(chat_mdl, turn2jsonschema(task["parser_config"]["metadata"]), content)
 
-        tasks = []
-        for d in docs:
-            tasks.append(asyncio.create_task(gen_metadata_task(chat_mdl, d)))
         try:
-            await asyncio.gather(*tasks, return_exceptions=False)
+            answers = await run_chunk_llm_phase(task, chat_mdl, docs, llm_cache.METADATA, "metadata", task["parser_config"]["metadata"], progress_callback, ask)
         except Exception as e:
-            logging.error("Error in doc_question_proposal", exc_info=e)
-            for t in tasks:
-                t.cancel()
-            await asyncio.gather(*tasks, return_exceptions=True)
+            logging.error("Error in gen_metadata", exc_info=e)
             raise
         metadata = {}
-        for doc in docs:
-            metadata = update_metadata_to(metadata, doc["metadata_obj"])
-            del doc["metadata_obj"]
+        for meta in answers:
+            metadata = update_metadata_to(metadata, meta)
         if metadata:
             existing_meta = DocMetadataService.get_document_metadata(task["doc_id"])
             existing_meta = existing_meta if isinstance(existing_meta, dict) else {}
             metadata = update_metadata_to(metadata, existing_meta)
             DocMetadataService.update_document_metadata(task["doc_id"], metadata)
-        progress_callback(msg="Question generation {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
+        progress_callback(msg="Metadata generation {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
+
+    # The phases touch different fields of each chunk, so a chunk's keywords, questions
+    # and metadata are generated side by side; chat_limiter still bounds the LLM calls.
+    phases = []
+    if any([
+        task["parser_config"].get("auto_keywords", 0),
+        task["parser_config"].get("auto_questions", 0),
+        task["parser_id"].lower() == "interrogation",
+        task["parser_config"].get("enable_metadata", False) and task["parser_config"].get("metadata"),
+        task["kb_parser_config"].get("tag_kb_ids", []),
+    ]):
+        chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
+    if task["parser_config"].get("auto_keywords", 0):
+        phases.append(asyncio.create_task(gen_keywords()))
+    if task["parser_config"].get("auto_questions", 0):
+        phases.append(asyncio.create_task(gen_questions()))
+    if task["parser_id"].lower() == "interrogation":
+        phases.append(asyncio.create_task(gen_interrogation_metadata()))
+    if task["parser_config"].get("enable_metadata", False) and task["parser_config"].get("metadata"):
+        phases.append(asyncio.create_task(gen_chunk_metadata()))
+    try:
+        await asyncio.gather(*phases, return_exceptions=False)
+    except Exception:
+        for t in phases:
+            t.cancel()
+        await asyncio.gather(*phases, return_exceptions=True)
+        raise
 
     if task["kb_parser_config"].get("tag_kb_ids", []):
         progress_callback(msg="Start to tag for every chunk ...")
@@ -493,8 +598,6 @@ async def build_chunks(task, progress_callback):
         else:
             all_tags = json.loads(all_tags)
 
-        chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
-
         docs_to_tag = []
         for d in docs:
             task_canceled = has_canceled(task["id"])
@@ -506,40 +609,29 @@ async def build_chunks(task, progress_callback):
             else:
                 docs_to_tag.append(d)
 
-        async def doc_content_tagging(chat_mdl, d, topn_tags):
-            cached = get_llm_cache(chat_mdl.llm_name, d["content_with_weight"], all_tags, {"topn": topn_tags})
-            if not cached:
-                if has_canceled(task["id"]):
-                    progress_callback(-1, msg="Task has been canceled.")
-                    return
-                picked_examples = random.choices(examples, k=2) if len(examples) > 2 else examples
-                if not picked_examples:
-                    picked_examples.append({"content": "This is an example", TAG_FLD: {"example": 1}})
-                async with chat_limiter:
-                    cached = await content_tagging(
-                        chat_mdl,
-                        d["content_with_weight"],
-                        all_tags,
-                        picked_examples,
-                        topn_tags,
-                    )
-                if cached:
-                    cached = json.dumps(cached)
-            if cached:
-                set_llm_cache(chat_mdl.llm_name, d["content_with_weight"], cached, all_tags, {"topn": topn_tags})
-                d[TAG_FLD] = json.loads(cached)
+        async def doc_content_tagging(chat_mdl, content):
+            picked_examples = random.choices(examples, k=2) if len(examples) > 2 else examples
+            if not picked_examples:
+                picked_examples.append({"content": "This is an example", TAG_FLD: {"example": 1}})
+            tags = await content_tagging(
+                chat_mdl,
+                content,
+                all_tags,
+                picked_examples,
+                topn_tags,
+            )
+            return json.dumps(tags) if tags else None
 
-        tasks = []
-        for d in docs_to_tag:
-            tasks.append(asyncio.create_task(doc_content_tagging(chat_mdl, d, topn_tags)))
         try:
-            await asyncio.gather(*tasks, return_exceptions=False)
+            # The tag set can be large: it is hashed once here instead of once per chunk.
+            answers = await run_chunk_llm_phase(task, chat_mdl, docs_to_tag, llm_cache.TAGS, llm_cache.context_digest(all_tags), {"topn": topn_tags},
+                                                progress_callback, doc_content_tagging)
         except Exception as e:
             logging.error("Error tagging docs: {}".format(e))
-            for t in tasks:
-                t.cancel()
-            await asyncio.gather(*tasks, return_exceptions=True)
             raise
+        for d, tags in zip(docs_to_tag, answers):
+            if tags:
+                d[TAG_FLD] = json.loads(tags)
         progress_callback(msg="Tagging {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
 
     return docs
@@ -598,7 +690,14 @@ def init_kb(row, vector_size: int):
     return settings.docStoreConn.create_idx(idxnm, row.get("kb_id", ""), vector_size, parser_id)
 
 
-async def embedding(docs, mdl, parser_config=None, callback=None):
+async def embed_title(docs, mdl):
+    """Vector of the document title that chunk vectors are blended with, and its token count."""
+    vts, c = await thread_pool_exec(mdl.encode, [docs[0].get("docnm_kwd", "Title")])
+    return np.asarray(vts[0], dtype=np.float32), c
+
+
+async def embedding(docs, mdl, parser_config=None, callback=None, title_vec=None):
+    """`title_vec` from `embed_title`, for callers embedding a document in several calls; encoded here when None."""
     if parser_config is None:
         parser_config = {}
     tts, cnts = [], []
@@ -613,9 +712,8 @@ async def embedding(docs, mdl, parser_config=None, callback=None):
         cnts.append(c)
 
     tk_count = 0
-    if len(tts) == len(cnts):
-        vts, c = await thread_pool_exec(mdl.encode, tts[0:1])
-        tts = np.tile(vts[0], (len(cnts), 1))
+    if title_vec is None and len(tts) == len(cnts):
+        title_vec, c = await embed_title(docs, mdl)
         tk_count += c
 
     @timeout(60)
@@ -623,27 +721,63 @@ async def embedding(docs, mdl, parser_config=None, callback=None):
         nonlocal mdl
         return mdl.encode([truncate(c, mdl.max_length - 10) for c in txts])
 
-    cnts_ = np.array([])
-    for i in range(0, len(cnts), settings.EMBEDDING_BATCH_SIZE):
-        async with embed_limiter:
-            vts, c = await thread_pool_exec(batch_encode, cnts[i : i + settings.EMBEDDING_BATCH_SIZE])
-        if len(cnts_) == 0:
-            cnts_ = vts
-        else:
-            cnts_ = np.concatenate((cnts_, vts), axis=0)
+    # Rows land in a preallocated float32 matrix, allocated once the dimension is known.
+    vects = None
+
+    def place(rows, vs):
+        nonlocal vects
+        vs = np.asarray(vs, dtype=np.float32)
+        if vects is None:
+            vects = np.empty((len(cnts), vs.shape[1]), dtype=np.float32)
+        vects[rows] = vs
+
+    # Unchanged chunks of a re-parsed document hit the embedding cache and skip the model entirely.
+    if EMBEDDING_CACHE_ENABLED:
+        cached = await thread_pool_exec(get_embed_cache_many, mdl.llm_name, cnts)
+    else:
+        cached = [None] * len(cnts)
+    hits = [i for i, v in enumerate(cached) if v is not None]
+    missed = [i for i, v in enumerate(cached) if v is None]
+    if hits:
+        logging.info(f"Embedding cache hit {len(hits)}/{len(cnts)} chunks")
+        place(hits, [cached[i] for i in hits])
+
+    done = 0
+    batch_limiter = embedding_batch_limiter(mdl.llm_name)
+
+    async def encode_batch(batch):
+        nonlocal tk_count, done
+        txts = [cnts[j] for j in batch]
+        async with batch_limiter, embed_limiter:
+            vts, c = await thread_pool_exec(batch_encode, txts)
+        place(batch, vts)
+        if EMBEDDING_CACHE_ENABLED:
+            await thread_pool_exec(set_embed_cache_many, mdl.llm_name, txts, vts)
         tk_count += c
-        callback(prog=0.7 + 0.2 * (i + 1) / len(cnts), msg="")
-    cnts = cnts_
+        done += len(batch)
+        callback(prog=0.7 + 0.2 * done / len(missed), msg="")
+
+    # Up to MAX_CONCURRENT_EMBEDDING_BATCHES batches per model are in flight, and
+    # embed_limiter bounds the batches of all documents together.
+    tasks = [asyncio.create_task(encode_batch(missed[i : i + settings.EMBEDDING_BATCH_SIZE]))
+             for i in range(0, len(missed), settings.EMBEDDING_BATCH_SIZE)]
+    try:
+        await asyncio.gather(*tasks, return_exceptions=False)
+    except Exception:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
     filename_embd_weight = parser_config.get("filename_embd_weight", 0.1)  # due to the db support none value
     if not filename_embd_weight:
         filename_embd_weight = 0.1
     title_w = float(filename_embd_weight)
-    if tts.ndim == 2 and cnts.ndim == 2 and tts.shape == cnts.shape:
-        vects = title_w * tts + (1 - title_w) * cnts
-    else:
-        vects = cnts
+    if title_vec is not None and vects is not None and title_vec.shape[0] == vects.shape[1]:
+        vects *= (1 - title_w)
+        vects += title_w * title_vec
 
-    assert len(vects) == len(docs)
+    assert vects is not None and len(vects) == len(docs)
     vector_size = 0
     for i, d in enumerate(docs):
         v = vects[i].tolist()
@@ -796,7 +930,14 @@ async def run_raptor_for_kb(row, kb_parser_config, chat_mdl, embd_mdl, vector_si
 
     res = []
     tk_count = 0
+    # Ids of the summaries dropped from the cluster trees, deleted by the caller once `res` is indexed.
+    stale_ids = []
     max_errors = int(os.environ.get("RAPTOR_MAX_ERRORS", 3))
+    incremental = raptor_config.get("incremental", False)
+    idxnm = search.index_name(row["tenant_id"])
+
+    def summary_id(content):
+        return xxhash.xxh64((content + str(fake_doc_id)).encode("utf-8")).hexdigest()
 
     async def generate(chunks, did):
         nonlocal tk_count, res
@@ -809,15 +950,28 @@ async def run_raptor_for_kb(row, kb_parser_config, chat_mdl, embd_mdl, vector_si
             raptor_config["threshold"],
             max_errors=max_errors,
         )
-        original_length = len(chunks)
-        chunks = await raptor(chunks, kb_parser_config["raptor"]["random_seed"], callback, row["id"])
+        tree_chunk = None
+        if incremental:
+            # The cluster tree of `did` is persisted as one unavailable chunk. It is filed under the
+            # fake doc id so that it never shows up among the chunks of the document itself.
+            tree_id = raptor_tree_id(did)
+            tree_chunk = await thread_pool_exec(settings.docStoreConn.get, tree_id, idxnm, [str(row["kb_id"])])
+            tree = json.loads(tree_chunk["content_with_weight"]) if tree_chunk and tree_chunk.get("content_with_weight") else None
+            chunks, tree, stale = await raptor.update(chunks, tree, kb_parser_config["raptor"]["random_seed"], callback, row["id"])
+            stale = set(summary_id(s) for s in stale) - set(summary_id(content) for content, _ in chunks)
+            stale_ids.extend(sorted(stale))
+            tree_chunk = {"id": tree_id, "doc_id": fake_doc_id, "kb_id": [str(row["kb_id"])], "raptor_kwd": "raptor_tree", "available_int": 0, "content_with_weight": json.dumps(tree, ensure_ascii=False)}
+            original_length = 0
+        else:
+            original_length = len(chunks)
+            chunks = await raptor(chunks, kb_parser_config["raptor"]["random_seed"], callback, row["id"])
         doc = {"doc_id": did, "kb_id": [str(row["kb_id"])], "docnm_kwd": row["name"], "title_tks": rag_tokenizer.tokenize(row["name"]), "raptor_kwd": "raptor"}
         if row["pagerank"]:
             doc[PAGERANK_FLD] = int(row["pagerank"])
 
         for content, vctr in chunks[original_length:]:
             d = copy.deepcopy(doc)
-            d["id"] = xxhash.xxh64((content + str(fake_doc_id)).encode("utf-8")).hexdigest()
+            d["id"] = summary_id(content)
             d["create_time"] = str(datetime.now()).replace("T", " ")[:19]
             d["create_timestamp_flt"] = datetime.now().timestamp()
             d[vctr_nm] = vctr.tolist()
@@ -826,12 +980,17 @@ async def run_raptor_for_kb(row, kb_parser_config, chat_mdl, embd_mdl, vector_si
             d["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(d["content_ltks"])
             res.append(d)
             tk_count += num_tokens_from_string(content)
+        if tree_chunk:
+            # Written last, so the tree only references summaries that made it into the index.
+            res.append(tree_chunk)
 
     if raptor_config.get("scope", "file") == "file":
         for x, doc_id in enumerate(doc_ids):
             chunks = []
             skipped_chunks = 0
-            for d in settings.retriever.chunk_list(doc_id, row["tenant_id"], [str(row["kb_id"])], fields=["content_with_weight", vctr_nm], sort_by_position=True):
+            for d in settings.retriever.chunk_list(doc_id, row["tenant_id"], [str(row["kb_id"])], fields=["content_with_weight", vctr_nm, "raptor_kwd"], sort_by_position=True):
+                if d.get("raptor_kwd"):
+                    continue
                 # Skip chunks that don't have the required vector field (may have been indexed with different embedding model)
                 if vctr_nm not in d or d[vctr_nm] is None:
                     skipped_chunks += 1
@@ -853,7 +1012,9 @@ async def run_raptor_for_kb(row, kb_parser_config, chat_mdl, embd_mdl, vector_si
         chunks = []
         skipped_chunks = 0
         for doc_id in doc_ids:
-            for d in settings.retriever.chunk_list(doc_id, row["tenant_id"], [str(row["kb_id"])], fields=["content_with_weight", vctr_nm], sort_by_position=True):
+            for d in settings.retriever.chunk_list(doc_id, row["tenant_id"], [str(row["kb_id"])], fields=["content_with_weight", vctr_nm, "raptor_kwd"], sort_by_position=True):
+                if d.get("raptor_kwd"):
+                    continue
                 # Skip chunks that don't have the required vector field
                 if vctr_nm not in d or d[vctr_nm] is None:
                     skipped_chunks += 1
@@ -867,11 +1028,11 @@ async def run_raptor_for_kb(row, kb_parser_config, chat_mdl, embd_mdl, vector_si
         if not chunks:
             logging.error(f"RAPTOR: No valid chunks with vectors found in any document for kb {row['kb_id']}")
             callback(msg=f"[ERROR] No valid chunks with vectors found. Please ensure documents are parsed with the current embedding model (vector size: {vector_size}).")
-            return res, tk_count
+            return res, tk_count, stale_ids
 
         await generate(chunks, fake_doc_id)
 
-    return res, tk_count
+    return res, tk_count, stale_ids
 
 
 async def delete_image(kb_id, chunk_id):
@@ -883,7 +1044,58 @@ async def delete_image(kb_id, chunk_id):
         raise
 
 
-async def insert_chunks(task_id, task_tenant_id, task_dataset_id, chunks, progress_callback):
+class ChunkIdRecorder:
+    """
+    Records the ids of the chunks a task has indexed in `task.chunk_ids`.
+
+    Ids are written incrementally: the first checkpoint overwrites whatever a previous
+    run of the task left behind, later ones append only the new ids. Checkpoints are
+    taken every CHUNK_IDS_CHECKPOINT_SIZE ids or CHUNK_IDS_CHECKPOINT_INTERVAL seconds
+    and run in the background, so they overlap with the next doc-store bulk insert.
+    """
+
+    def __init__(self, task_id):
+        self.task_id = task_id
+        self.ids = []
+        # Ids not yet on the task row, including those of the checkpoint in flight.
+        self._pending = []
+        self._written = False
+        self._last_checkpoint = timer()
+        # (write task, number of pending ids it covers)
+        self._inflight = None
+
+    def add(self, chunk_ids):
+        self.ids.extend(chunk_ids)
+        self._pending.extend(chunk_ids)
+
+    async def checkpoint(self, force=False):
+        if not self._pending:
+            return
+        if not force and len(self._pending) < CHUNK_IDS_CHECKPOINT_SIZE and timer() - self._last_checkpoint < CHUNK_IDS_CHECKPOINT_INTERVAL:
+            return
+        # Keep writes ordered: the previous checkpoint must land before the next one is issued.
+        await self.wait()
+        if not self._pending:
+            return
+        update = TaskService.append_chunk_ids if self._written else TaskService.update_chunk_ids
+        self._last_checkpoint = timer()
+        self._inflight = (asyncio.create_task(thread_pool_exec(update, self.task_id, " ".join(self._pending))), len(self._pending))
+
+    async def wait(self):
+        if self._inflight is None:
+            return
+        (inflight, count), self._inflight = self._inflight, None
+        await inflight
+        # The ids leave the pending list only once they are on the task row; a failed write keeps them.
+        del self._pending[:count]
+        self._written = True
+
+    async def flush(self):
+        await self.checkpoint(force=True)
+        await self.wait()
+
+
+async def insert_chunks(task_id, task_tenant_id, task_dataset_id, chunks, progress_callback, chunk_id_recorder=None, mother_ids=None):
     """
     Insert chunks into document store (Elasticsearch OR Infinity).
 
@@ -893,9 +1105,15 @@ async def insert_chunks(task_id, task_tenant_id, task_dataset_id, chunks, progre
         task_dataset_id: Dataset/knowledge base ID
         chunks: List of chunk dictionaries to insert
         progress_callback: Callback function for progress updates
+        chunk_id_recorder: ChunkIdRecorder shared by several calls for the same task; the caller
+            flushes it. When omitted, the ids of these chunks are flushed before returning.
+        mother_ids: Mother chunk ids inserted by earlier calls, extended in place (streaming mode)
     """
     mothers = []
-    mother_ids = set([])
+    mother_ids = set([]) if mother_ids is None else mother_ids
+    owns_recorder = chunk_id_recorder is None
+    if owns_recorder:
+        chunk_id_recorder = ChunkIdRecorder(task_id)
     for ck in chunks:
         mom = ck.get("mom") or ck.get("mom_with_weight") or ""
         if not mom:
@@ -915,61 +1133,179 @@ async def insert_chunks(task_id, task_tenant_id, task_dataset_id, chunks, progre
                 del mom_ck[fld]
         mothers.append(mom_ck)
 
-    for b in range(0, len(mothers), settings.DOC_BULK_SIZE):
-        await thread_pool_exec(
-            settings.docStoreConn.insert,
-            mothers[b : b + settings.DOC_BULK_SIZE],
-            search.index_name(task_tenant_id),
-            task_dataset_id,
-        )
-        task_canceled = has_canceled(task_id)
-        if task_canceled:
-            progress_callback(-1, msg="Task has been canceled.")
-            return False
+    completed = False
+    try:
+        for b in range(0, len(mothers), settings.DOC_BULK_SIZE):
+            await thread_pool_exec(
+                settings.docStoreConn.insert,
+                mothers[b : b + settings.DOC_BULK_SIZE],
+                search.index_name(task_tenant_id),
+                task_dataset_id,
+            )
+            task_canceled = has_canceled(task_id)
+            if task_canceled:
+                progress_callback(-1, msg="Task has been canceled.")
+                return False
 
-    for b in range(0, len(chunks), settings.DOC_BULK_SIZE):
-        doc_store_result = await thread_pool_exec(
-            settings.docStoreConn.insert,
-            chunks[b : b + settings.DOC_BULK_SIZE],
-            search.index_name(task_tenant_id),
-            task_dataset_id,
-        )
-        task_canceled = has_canceled(task_id)
-        if task_canceled:
-            progress_callback(-1, msg="Task has been canceled.")
-            return False
-        if b % 128 == 0:
-            progress_callback(prog=0.8 + 0.1 * (b + 1) / len(chunks), msg="")
-        if doc_store_result:
-            error_message = f"Insert chunk error: {doc_store_result}, please check log file and Elasticsearch/Infinity status!"
-            progress_callback(-1, msg=error_message)
-            raise Exception(error_message)
-        chunk_ids = [chunk["id"] for chunk in chunks[: b + settings.DOC_BULK_SIZE]]
-        chunk_ids_str = " ".join(chunk_ids)
-        try:
-            TaskService.update_chunk_ids(task_id, chunk_ids_str)
-        except DoesNotExist:
-            logging.warning(f"do_handle_task update_chunk_ids failed since task {task_id} is unknown.")
+        for b in range(0, len(chunks), settings.DOC_BULK_SIZE):
             doc_store_result = await thread_pool_exec(
-                settings.docStoreConn.delete,
-                {"id": chunk_ids},
+                settings.docStoreConn.insert,
+                chunks[b : b + settings.DOC_BULK_SIZE],
                 search.index_name(task_tenant_id),
                 task_dataset_id,
             )
-            tasks = []
-            for chunk_id in chunk_ids:
-                tasks.append(asyncio.create_task(delete_image(task_dataset_id, chunk_id)))
+            task_canceled = has_canceled(task_id)
+            if task_canceled:
+                progress_callback(-1, msg="Task has been canceled.")
+                return False
+            if b % 128 == 0:
+                progress_callback(prog=0.8 + 0.1 * (b + 1) / len(chunks), msg="")
+            if doc_store_result:
+                error_message = f"Insert chunk error: {doc_store_result}, please check log file and Elasticsearch/Infinity status!"
+                progress_callback(-1, msg=error_message)
+                raise Exception(error_message)
+            chunk_id_recorder.add([chunk["id"] for chunk in chunks[b : b + settings.DOC_BULK_SIZE]])
             try:
-                await asyncio.gather(*tasks, return_exceptions=False)
-            except Exception as e:
-                logging.error(f"delete_image failed: {e}")
-                for t in tasks:
-                    t.cancel()
-                await asyncio.gather(*tasks, return_exceptions=True)
-                raise
-            progress_callback(-1, msg=f"Chunk updates failed since task {task_id} is unknown.")
-            return False
-    return True
+                if owns_recorder and b + settings.DOC_BULK_SIZE >= len(chunks):
+                    await chunk_id_recorder.flush()
+                else:
+                    await chunk_id_recorder.checkpoint()
+            except DoesNotExist:
+                logging.warning(f"do_handle_task update_chunk_ids failed since task {task_id} is unknown.")
+                chunk_ids = chunk_id_recorder.ids
+                doc_store_result = await thread_pool_exec(
+                    settings.docStoreConn.delete,
+                    {"id": chunk_ids},
+                    search.index_name(task_tenant_id),
+                    task_dataset_id,
+                )
+                tasks = []
+                for chunk_id in chunk_ids:
+                    tasks.append(asyncio.create_task(delete_image(task_dataset_id, chunk_id)))
+                try:
+                    await asyncio.gather(*tasks, return_exceptions=False)
+                except Exception as e:
+                    logging.error(f"delete_image failed: {e}")
+                    for t in tasks:
+                        t.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    raise
+                progress_callback(-1, msg=f"Chunk updates failed since task {task_id} is unknown.")
+                return False
+        completed = True
+        return True
+    finally:
+        if not completed:
+            # Canceled or failed: the checkpoint in flight must not outlive the call.
+            await chunk_id_recorder.wait()
+
+
+async def stream_chunks(task, embedding_model, progress_callback, chunk_id_recorder, keep_chunks=False):
+    """
+    Streaming variant of build_chunks -> embedding -> insert_chunks.
+
+    Chunk groups of STREAM_GROUP_SIZE flow through bounded queues, so image upload,
+    LLM enrichment, embedding and doc-store insertion of different groups run
+    concurrently, and a group's images and vectors are released once it is indexed.
+
+    Returns:
+        (chunks, chunk_count, token_count), or None if the task failed or was canceled.
+        `chunks` only holds the inserted chunks when `keep_chunks` is set (e.g. for TOC extraction).
+    """
+    if task["size"] > settings.DOC_MAXIMUM_SIZE:
+        set_progress(task["id"], prog=-1, msg="File size exceeds( <= %dMb )" % (int(settings.DOC_MAXIMUM_SIZE / 1024 / 1024)))
+        return None
+
+    def quiet_callback(prog=None, msg=""):
+        # Per-group stage messages would flood the task log; only failures are forwarded.
+        if prog is not None and prog < 0:
+            progress_callback(prog=prog, msg=msg)
+
+    cks = await chunk_document(task, progress_callback)
+    total = len(cks)
+    if not total:
+        return [], 0, 0
+    progress_callback(msg="Generate {} chunks, streaming them to the index".format(total))
+
+    kept, mother_ids = [], set()
+    stats = {"token_count": 0, "indexed": 0, "failed": False}
+
+    async def upload(group):
+        return await upload_chunk_images(task, group)
+
+    async def enrich(docs):
+        return await enrich_chunks(task, docs, quiet_callback)
+
+    title_vec = None
+
+    async def embed(docs):
+        nonlocal title_vec
+        if not docs:
+            return docs
+        # Every group shares the document title, encode it once.
+        if title_vec is None:
+            title_vec, token_count = await embed_title(docs, embedding_model)
+            stats["token_count"] += token_count
+        token_count, _ = await embedding(docs, embedding_model, task["parser_config"], quiet_callback, title_vec=title_vec)
+        stats["token_count"] += token_count
+        return docs
+
+    async def insert(docs):
+        if not docs:
+            return None
+        if has_canceled(task["id"]):
+            progress_callback(-1, msg="Task has been canceled.")
+            stats["failed"] = True
+            raise TaskCanceledException(f"Task {task['id']} was cancelled")
+        if not await insert_chunks(task["id"], task["tenant_id"], task["kb_id"], docs, quiet_callback, chunk_id_recorder=chunk_id_recorder, mother_ids=mother_ids):
+            stats["failed"] = True
+            raise TaskCanceledException("Streaming insert stopped")
+        stats["indexed"] += len(docs)
+        progress_callback(prog=0.8 + 0.1 * stats["indexed"] / total, msg="")
+        if keep_chunks:
+            kept.extend(docs)
+        return None
+
+    async def source(q_out):
+        for b in range(0, total, STREAM_GROUP_SIZE):
+            group = cks[b : b + STREAM_GROUP_SIZE]
+            # Drop our references so each group is freed once the last stage is done with it.
+            cks[b : b + STREAM_GROUP_SIZE] = [None] * len(group)
+            await q_out.put(group)
+        await q_out.put(None)
+
+    async def stage(fn, q_in, q_out):
+        while True:
+            item = await q_in.get()
+            if item is None:
+                break
+            res = await fn(item)
+            if q_out is not None:
+                await q_out.put(res)
+        if q_out is not None:
+            await q_out.put(None)
+
+    queues = [asyncio.Queue(maxsize=STREAM_QUEUE_SIZE) for _ in range(4)]
+    tasks = [
+        asyncio.create_task(source(queues[0])),
+        asyncio.create_task(stage(upload, queues[0], queues[1])),
+        asyncio.create_task(stage(enrich, queues[1], queues[2])),
+        asyncio.create_task(stage(embed, queues[2], queues[3])),
+        asyncio.create_task(stage(insert, queues[3], None)),
+    ]
+    try:
+        await asyncio.gather(*tasks, return_exceptions=False)
+    except Exception as e:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if stats["failed"]:
+            return None
+        if not isinstance(e, TaskCanceledException):
+            progress_callback(-1, "Streaming chunk pipeline error: {}".format(str(e)))
+        raise
+
+    return kept, len(set(chunk_id_recorder.ids)), stats["token_count"]
 
 
 @timeout(60 * 60 * 3, 1)
@@ -999,6 +1335,8 @@ async def do_handle_task(task):
     task_parser_config = task["parser_config"]
     task_start_ts = timer()
     toc_thread = None
+    streaming = False
+    raptor_stale_ids = []
     executor = concurrent.futures.ThreadPoolExecutor()
 
     # prepare the progress callback function
@@ -1066,7 +1404,7 @@ async def do_handle_task(task):
         chat_model = LLMBundle(task_tenant_id, LLMType.CHAT, llm_name=kb_task_llm_id, lang=task_language)
         # run RAPTOR
         async with kg_limiter:
-            chunks, token_count = await run_raptor_for_kb(
+            chunks, token_count, raptor_stale_ids = await run_raptor_for_kb(
                 row=task,
                 kb_parser_config=kb_parser_config,
                 chat_mdl=chat_model,
@@ -1130,6 +1468,10 @@ async def do_handle_task(task):
         progress_callback(1, "place holder")
         pass
         return
+    elif STREAMING_CHUNK_PIPELINE:
+        # Chunks are built, embedded and indexed group by group in stream_chunks below.
+        task["llm_id"] = doc_task_llm_id
+        streaming = True
     else:
         # Standard chunking methods
         task["llm_id"] = doc_task_llm_id
@@ -1157,24 +1499,41 @@ async def do_handle_task(task):
         if task["parser_id"].lower() == "naive" and task["parser_config"].get("toc_extraction", False):
             toc_thread = executor.submit(build_TOC, task, chunks, progress_callback)
 
-    chunk_count = len(set([chunk["id"] for chunk in chunks]))
+    if not streaming:
+        chunk_count = len(set([chunk["id"] for chunk in chunks]))
     start_ts = timer()
+    # Shared by the chunk and TOC inserts so the TOC chunk id is appended, not written over the others.
+    chunk_id_recorder = ChunkIdRecorder(task_id)
 
     async def _maybe_insert_chunks(_chunks):
         if has_canceled(task_id):
             progress_callback(-1, msg="Task has been canceled.")
             return False
-        insert_result = await insert_chunks(task_id, task_tenant_id, task_dataset_id, _chunks, progress_callback)
+        insert_result = await insert_chunks(task_id, task_tenant_id, task_dataset_id, _chunks, progress_callback, chunk_id_recorder=chunk_id_recorder)
         return bool(insert_result)
 
     try:
-        if not await _maybe_insert_chunks(chunks):
+        if streaming:
+            with_toc = task["parser_id"].lower() == "naive" and task["parser_config"].get("toc_extraction", False)
+            streamed = await stream_chunks(task, embedding_model, progress_callback, chunk_id_recorder, keep_chunks=with_toc)
+            if streamed is None:
+                return
+            chunks, chunk_count, token_count = streamed
+            if not chunk_count:
+                progress_callback(1.0, msg=f"No chunk built from {task_document_name}")
+                return
+            if with_toc:
+                toc_thread = executor.submit(build_TOC, task, chunks, progress_callback)
+        elif not await _maybe_insert_chunks(chunks):
             return
+        if raptor_stale_ids:
+            # Only once the new summaries and the tree chunk referencing them are indexed.
+            await thread_pool_exec(settings.docStoreConn.delete, {"id": raptor_stale_ids}, search.index_name(task_tenant_id), task_dataset_id)
         if has_canceled(task_id):
             progress_callback(-1, msg="Task has been canceled.")
             return
 
-        logging.info("Indexing doc({}), page({}-{}), chunks({}), elapsed: {:.2f}".format(task_document_name, task_from_page, task_to_page, len(chunks), timer() - start_ts))
+        logging.info("Indexing doc({}), page({}-{}), chunks({}), elapsed: {:.2f}".format(task_document_name, task_from_page, task_to_page, chunk_count, timer() - start_ts))
 
         DocumentService.increment_chunk_num(task_doc_id, task_dataset_id, token_count, chunk_count, 0)
 
@@ -1186,6 +1545,7 @@ async def do_handle_task(task):
                 if not await _maybe_insert_chunks([d]):
                     return
                 DocumentService.increment_chunk_num(task_doc_id, task_dataset_id, 0, 1, 0)
+        await chunk_id_recorder.flush()
 
         if has_canceled(task_id):
             progress_callback(-1, msg="Task has been canceled.")
@@ -1193,9 +1553,14 @@ async def do_handle_task(task):
 
         task_time_cost = timer() - task_start_ts
         progress_callback(prog=1.0, msg="Task done ({:.2f}s)".format(task_time_cost))
-        logging.info("Chunk doc({}), page({}-{}), chunks({}), token({}), elapsed:{:.2f}".format(task_document_name, task_from_page, task_to_page, len(chunks), token_count, task_time_cost))
+        logging.info("Chunk doc({}), page({}-{}), chunks({}), token({}), elapsed:{:.2f}".format(task_document_name, task_from_page, task_to_page, chunk_count, token_count, task_time_cost))
 
     finally:
+        try:
+            # No-op after flush(); on the early returns, lets the last checkpoint land first.
+            await chunk_id_recorder.wait()
+        except Exception:
+            logging.exception(f"Recording the chunk ids of task({task_id}) failed")
         if has_canceled(task_id):
             try:
                 exists = await thread_pool_exec(
@@ -1249,6 +1614,7 @@ async def handle_task():
             pass
         logging.exception(f"handle_task got exception for task {json.dumps(task)}")
     finally:
+        await thread_pool_exec(PROGRESS_REPORTER.forget, task_id)
         task_document_ids = []
         if task_type in ["graphrag", "raptor", "mindmap"]:
             task_document_ids = task["doc_ids"]
@@ -1303,6 +1669,9 @@ async def report_status():
                 "done": DONE_TASKS,
                 "failed": FAILED_TASKS,
                 "current": current,
+                "llm_cache": llm_cache.cache_stats(),
+                # Runs in this process only, the chunk workers (CHUNK_WORKERS > 0) log theirs per document.
+                "ocr": ocr_stats(),
             }
         )
 
@@ -1394,7 +1763,10 @@ async def main():
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
+    if CHUNK_WORKERS > 0:
+        get_chunk_worker_pool(CONSUMER_NAME)
     report_task = asyncio.create_task(report_status())
+    progress_task = asyncio.create_task(PROGRESS_REPORTER.run())
     tasks = []
 
     logging.info(f"RAGFlow ingestion is ready after {time.time() - start_ts}s initialization.")
@@ -1408,7 +1780,8 @@ async def main():
             t.cancel()
         await asyncio.gather(*tasks, return_exceptions=True)
         report_task.cancel()
-        await asyncio.gather(report_task, return_exceptions=True)
+        progress_task.cancel()
+        await asyncio.gather(report_task, progress_task, return_exceptions=True)
     logging.error("BUG!!! You should not reach here!!!")
 
 
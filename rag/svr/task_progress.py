@@ -0,0 +1,129 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Coalescing progress reporter of the task executor.
+
+Progress callbacks only touch memory: messages are buffered per task and the progress
+value is merged with the same rule TaskService.update_progress applies (-1 is final,
+otherwise progress never goes back). The task row is written at most once per
+PROGRESS_FLUSH_INTERVAL seconds, and right away when the task finishes or fails.
+
+The cancel flag is read from Redis at most once per CANCEL_CHECK_INTERVAL seconds per task.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from peewee import DoesNotExist
+
+from api.db.db_models import close_connection
+from api.db.services.task_service import TaskService, has_canceled
+from common.misc_utils import thread_pool_exec
+
+PROGRESS_FLUSH_INTERVAL = float(os.environ.get("PROGRESS_FLUSH_INTERVAL", 2))
+CANCEL_CHECK_INTERVAL = float(os.environ.get("CANCEL_CHECK_INTERVAL", 1))
+
+
+def merge_progress(old, new):
+    if old is None:
+        return new
+    if new is None:
+        return old
+    if old == -1 or new == -1:
+        return -1
+    return max(old, new)
+
+
+class TaskProgressReporter:
+    def __init__(self, flush_interval: float = PROGRESS_FLUSH_INTERVAL, cancel_check_interval: float = CANCEL_CHECK_INTERVAL):
+        self.flush_interval = flush_interval
+        self.cancel_check_interval = cancel_check_interval
+        self._lock = threading.Lock()
+        # Serializes the row updates so the messages of a task land in order.
+        self._flush_lock = threading.Lock()
+        # task_id -> {"msgs": [...], "progress": float | None, "since": first unflushed report}
+        self._pending = {}
+        self._last_flush = {}
+        self._canceled = {}
+
+    def canceled(self, task_id) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            flag, checked_at = self._canceled.get(task_id, (False, None))
+        if flag or (checked_at is not None and now - checked_at < self.cancel_check_interval):
+            return flag
+        flag = has_canceled(task_id)
+        with self._lock:
+            self._canceled[task_id] = (flag, now)
+        return flag
+
+    def report(self, task_id, prog=None, msg=""):
+        now = time.monotonic()
+        with self._lock:
+            pending = self._pending.setdefault(task_id, {"msgs": [], "progress": None, "since": now})
+            if msg:
+                pending["msgs"].append(msg)
+            pending["progress"] = merge_progress(pending["progress"], prog)
+            due = (prog is not None and (prog == -1 or prog >= 1)) or now - self._last_flush.get(task_id, 0) >= self.flush_interval
+        if due:
+            self.flush(task_id)
+
+    def flush(self, task_id=None):
+        """Write the buffered progress of `task_id`, or of every task when None, to the task rows."""
+        with self._flush_lock:
+            with self._lock:
+                task_ids = list(self._pending.keys()) if task_id is None else [task_id]
+                batch = [(tid, self._pending.pop(tid)) for tid in task_ids if tid in self._pending]
+                for tid, _ in batch:
+                    self._last_flush[tid] = time.monotonic()
+            for tid, pending in batch:
+                d = {"progress_msg": "\n".join(pending["msgs"])}
+                if pending["progress"] is not None:
+                    d["progress"] = pending["progress"]
+                try:
+                    TaskService.update_progress(tid, d)
+                except DoesNotExist:
+                    logging.warning(f"TaskProgressReporter.flush({tid}) got exception DoesNotExist")
+                except Exception as e:
+                    logging.exception(f"TaskProgressReporter.flush({tid}) got exception: {e}")
+            if batch:
+                close_connection()
+
+    def flush_due(self):
+        now = time.monotonic()
+        with self._lock:
+            task_ids = [tid for tid, p in self._pending.items() if now - p["since"] >= self.flush_interval]
+        for tid in task_ids:
+            self.flush(tid)
+
+    def forget(self, task_id):
+        """Flush what is left of a finished task and drop its state."""
+        self.flush(task_id)
+        with self._lock:
+            self._last_flush.pop(task_id, None)
+            self._canceled.pop(task_id, None)
+
+    async def run(self):
+        """Background loop writing the reports that no later report came to flush."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await thread_pool_exec(self.flush_due)
+            except Exception as e:
+                logging.exception(f"TaskProgressReporter.run got exception: {e}")
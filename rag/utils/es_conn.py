@@ -69,6 +69,10 @@ class ESConnection(ESConnectionBase):
                 continue
             if not v:
                 continue
+            if k == "id":
+                # The chunk id is the document _id, not a source field.
+                bool_query.filter.append(Q("ids", values=v if isinstance(v, list) else [v]))
+                continue
             if isinstance(v, list):
                 bool_query.filter.append(Q("terms", **{k: v}))
             elif isinstance(v, str) or isinstance(v, int):
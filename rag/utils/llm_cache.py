@@ -0,0 +1,154 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Redis cache of LLM results, shared by the ingestion-time LLM features (keywords,
+questions, metadata, tags, knowledge graph extraction, RAPTOR summaries...).
+
+Keys are canonical: the model name, prompt, history and generation config are
+serialized as sorted JSON and hashed, under a per-purpose namespace. A large context
+shared by many calls, like the tag set of a KB, should be hashed once with
+`context_digest` and passed in place of the object.
+
+Values are stored binary behind a one-byte header, zstd-compressed when
+LLM_CACHE_ZSTD is on and the `zstandard` package is installed. Each purpose has its
+own TTL (LLM_CACHE_TTL_<PURPOSE>, defaulting to LLM_CACHE_TTL) and its own hit/miss
+counters, see `cache_stats`.
+"""
+
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+
+import xxhash
+
+CHAT = "chat"
+KEYWORDS = "keywords"
+QUESTIONS = "questions"
+METADATA = "metadata"
+TAGS = "tags"
+GRAPH = "graph"
+RAPTOR = "raptor"
+
+LLM_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL", 24 * 3600))
+LLM_CACHE_ZSTD = os.environ.get("LLM_CACHE_ZSTD", "false").lower() in ["true", "1", "yes"]
+# Shorter values are not worth a compression frame.
+LLM_CACHE_ZSTD_MIN_SIZE = int(os.environ.get("LLM_CACHE_ZSTD_MIN_SIZE", 512))
+
+_RAW = b"\x00"
+_ZSTD = b"\x01"
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+    if LLM_CACHE_ZSTD:
+        logging.warning("LLM_CACHE_ZSTD is on but zstandard is not installed; LLM cache values are stored uncompressed.")
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats = defaultdict(lambda: {"hit": 0, "miss": 0})
+
+
+class ContextDigest(str):
+    """Digest of a context object, used in cache keys in place of the object itself."""
+
+
+def context_digest(obj) -> ContextDigest:
+    return ContextDigest("ctx:" + xxhash.xxh128(_canonical(obj).encode("utf-8")).hexdigest())
+
+
+def _canonical(obj) -> str:
+    if isinstance(obj, str):
+        return obj
+    return json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def cache_ttl(purpose: str) -> int:
+    return int(os.environ.get(f"LLM_CACHE_TTL_{purpose.upper()}", LLM_CACHE_TTL))
+
+
+def cache_key(purpose: str, llmnm, txt, history, genconf) -> str:
+    hasher = xxhash.xxh128()
+    for part in (str(llmnm), _canonical(txt), _canonical(history), _canonical(genconf)):
+        hasher.update(part.encode("utf-8"))
+        # Separator, so ("ab", "c") and ("a", "bc") don't collide.
+        hasher.update(b"\x00")
+    return f"llm:{purpose}:{hasher.hexdigest()}"
+
+
+def _compressor():
+    if not hasattr(_local, "compressor"):
+        _local.compressor = zstandard.ZstdCompressor(level=3)
+        _local.decompressor = zstandard.ZstdDecompressor()
+    return _local.compressor, _local.decompressor
+
+
+def _pack(value: str) -> bytes:
+    bin = value.encode("utf-8")
+    if LLM_CACHE_ZSTD and zstandard is not None and len(bin) >= LLM_CACHE_ZSTD_MIN_SIZE:
+        return _ZSTD + _compressor()[0].compress(bin)
+    return _RAW + bin
+
+
+def _unpack(bin: bytes) -> str | None:
+    try:
+        if bin[:1] == _RAW:
+            return bin[1:].decode("utf-8")
+        if bin[:1] == _ZSTD and zstandard is not None:
+            return _compressor()[1].decompress(bin[1:]).decode("utf-8")
+    except Exception as e:
+        logging.warning(f"Failed to decode an LLM cache value: {e}")
+    return None
+
+
+def _count(purpose: str, hit: int, miss: int):
+    with _stats_lock:
+        _stats[purpose]["hit"] += hit
+        _stats[purpose]["miss"] += miss
+
+
+def cache_stats() -> dict:
+    """Hit/miss counters of this process by purpose."""
+    with _stats_lock:
+        return {purpose: dict(counts) for purpose, counts in _stats.items()}
+
+
+def lookup_many(purpose: str, llmnm, txts: list, history, genconf) -> list:
+    """One batched lookup for all of `txts`; results are aligned with `txts`, None on a miss."""
+    from rag.utils.redis_conn import REDIS_CONN
+
+    bins = REDIS_CONN.get_many([cache_key(purpose, llmnm, txt, history, genconf) for txt in txts], binary=True)
+    res = [_unpack(bin) if bin else None for bin in bins]
+    hits = sum(1 for v in res if v)
+    _count(purpose, hits, len(res) - hits)
+    return res
+
+
+def store_many(purpose: str, llmnm, txts: list, values: list, history, genconf):
+    from rag.utils.redis_conn import REDIS_CONN
+
+    mapping = {cache_key(purpose, llmnm, txt, history, genconf): _pack(v) for txt, v in zip(txts, values) if v}
+    REDIS_CONN.set_many(mapping, cache_ttl(purpose), binary=True)
+
+
+def lookup(purpose: str, llmnm, txt, history, genconf) -> str | None:
+    return lookup_many(purpose, llmnm, [txt], history, genconf)[0]
+
+
+def store(purpose: str, llmnm, txt, value: str, history, genconf):
+    store_many(purpose, llmnm, [txt], [value], history, genconf)
@@ -0,0 +1,897 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Embedded doc engine (DOC_ENGINE=local) for single-node deployments and tests.
+
+Every index is a directory holding:
+  * rows.log   - an append-only JSON-lines log of chunk puts/deletes, replayed into
+                 in-memory columns, inverted indexes (BM25 over the `*_tks` fields)
+                 and keyword indexes (`*_kwd`, kb_id, doc_id) on open;
+  * q_<n>_vec.f32 - one memory-mapped float32 matrix per vector column, addressed
+                 by the same row slot as the log.
+
+Writers take an exclusive flock on the log and catch up with what other processes
+appended before writing, so the API server and task executors can share one store.
+"""
+
+import copy
+import fcntl
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import threading
+from collections import Counter
+
+import numpy as np
+
+from common.constants import PAGERANK_FLD, TAG_FLD
+from common.decorator import singleton
+from common.doc_store.doc_store_base import DocStoreConnection, MatchExpr, OrderByExpr, MatchTextExpr, MatchDenseExpr, FusionExpr
+from common.file_utils import get_project_base_directory
+from common.float_utils import get_float
+
+_VECTOR_FIELD = re.compile(r"^q_(\d+)_vec$")
+_QUERY_TOKEN = re.compile(r'"((?:[^"\\]|\\.)*)"(?:~\d+)?|([()])|\^(\d+(?:\.\d+)?)|((?:[^\s()"^\\]|\\.)+)')
+_QUERY_OPERATORS = {"OR", "AND", "NOT", "||", "&&"}
+BM25_K1 = 1.2
+BM25_B = 0.75
+# ES returns 10 hits when no size is given.
+DEFAULT_SIZE = 10
+
+
+def _is_text_field(field: str) -> bool:
+    return field.endswith("_tks") or field.endswith("_ltks") or field == "important_kwd"
+
+
+def _is_key_field(field: str) -> bool:
+    return field in ["kb_id", "doc_id"] or field.endswith("_kwd")
+
+
+def _as_values(v) -> list:
+    if isinstance(v, list):
+        return v
+    return [v]
+
+
+def _tokens(v) -> list[str]:
+    if isinstance(v, list):
+        return [str(t).lower() for t in v if t is not None and str(t)]
+    if isinstance(v, str):
+        return v.lower().split()
+    return []
+
+
+def parse_query(text: str) -> list[dict[str, float]]:
+    """
+    Reduce an ES query_string (as built by FulltextQueryer) to its top-level OR clauses,
+    each a {term: weight} map. Boosts multiply through groups, phrases contribute their words.
+    """
+    stack = [[]]
+
+    def close():
+        inner = stack.pop()
+        merged = {}
+        for clause in inner:
+            for t, w in clause.items():
+                merged[t] = merged.get(t, 0.0) + w
+        stack[-1].append(merged)
+
+    for m in _QUERY_TOKEN.finditer(text or ""):
+        phrase, paren, boost, term = m.groups()
+        group = stack[-1]
+        if paren == "(":
+            stack.append([])
+        elif paren == ")":
+            if len(stack) > 1:
+                close()
+        elif boost is not None:
+            if group:
+                group[-1] = {t: w * float(boost) for t, w in group[-1].items()}
+        elif phrase is not None:
+            words = _tokens(re.sub(r"\\(.)", r"\1", phrase))
+            if words:
+                group.append({w: 1.0 for w in words})
+        elif term not in _QUERY_OPERATORS:
+            term = re.sub(r"\\(.)", r"\1", term).lstrip("+-").lower()
+            if term:
+                group.append({term: 1.0})
+    while len(stack) > 1:
+        close()
+    return [c for c in stack[0] if c]
+
+
+def _minimum_should_match(option, n_clauses: int) -> int:
+    if isinstance(option, float):
+        return int(option * n_clauses)
+    if isinstance(option, str) and option.endswith("%"):
+        return int(get_float(option[:-1]) / 100 * n_clauses)
+    return int(option or 0)
+
+
+class _VectorColumn:
+    """A float32 matrix in a memory-mapped file, one row per slot."""
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self.data = None
+        self.capacity = 0
+        self.present = np.zeros(0, dtype=bool)
+        self.norms = np.zeros(0, dtype=np.float32)
+        self._stale = []
+        self.reserve(0)
+
+    def reserve(self, size: int):
+        file_rows = os.path.getsize(self.path) // (self.dim * 4) if os.path.exists(self.path) else 0
+        if file_rows < size:
+            file_rows = max(size, self.capacity * 2, 1024)
+            with open(self.path, "ab") as f:
+                f.truncate(file_rows * self.dim * 4)
+        if file_rows <= self.capacity:
+            return
+        if self.data is not None:
+            self.data.flush()
+        # Another writer may have grown the file; remapping picks its rows up as well.
+        self.data = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(file_rows, self.dim))
+        self.present = np.concatenate([self.present, np.zeros(file_rows - self.capacity, dtype=bool)])
+        self.norms = np.concatenate([self.norms, np.zeros(file_rows - self.capacity, dtype=np.float32)])
+        self.capacity = file_rows
+
+    def put(self, slot: int, vector):
+        self.reserve(slot + 1)
+        v = np.asarray(vector, dtype=np.float32)
+        self.data[slot] = v
+        self.present[slot] = True
+        self.norms[slot] = np.linalg.norm(v)
+
+    def mark(self, slot: int, present: bool):
+        """Replay of another writer's row; norms are recomputed in bulk by `refresh_norms`."""
+        self.reserve(slot + 1)
+        self.present[slot] = present
+        if present:
+            self._stale.append(slot)
+
+    def refresh_norms(self):
+        if not self._stale:
+            return
+        idx = np.unique(np.asarray(self._stale, dtype=np.int64))
+        self._stale = []
+        self.norms[idx] = np.linalg.norm(self.data[idx], axis=1)
+
+    def get(self, slot: int) -> list[float] | None:
+        if slot >= self.capacity or not self.present[slot]:
+            return None
+        return self.data[slot].tolist()
+
+    def flush(self):
+        if self.data is not None:
+            self.data.flush()
+
+    def search(self, mask: np.ndarray, query, topn: int, similarity: float) -> tuple[np.ndarray, np.ndarray]:
+        """Exact cosine top-n over the slots in `mask`."""
+        n = min(len(mask), self.capacity)
+        idx = np.nonzero(mask[:n] & self.present[:n])[0]
+        q = np.asarray(query, dtype=np.float32)
+        qn = np.linalg.norm(q)
+        if not len(idx) or not qn:
+            return idx[:0], np.zeros(0, dtype=np.float32)
+        sims = (self.data[idx] @ q) / np.maximum(self.norms[idx] * qn, 1e-12)
+        keep = sims >= similarity
+        idx, sims = idx[keep], sims[keep]
+        if topn and len(idx) > topn:
+            top = np.argpartition(-sims, topn - 1)[:topn]
+            idx, sims = idx[top], sims[top]
+        return idx, sims
+
+
+class _Table:
+    """One index: columns and indexes over row slots, persisted as rows.log plus vector files."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.log_path = os.path.join(path, "rows.log")
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.ids = []
+        self.slots = {}
+        self.free = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.columns = {}
+        self.vectors = {}
+        self.terms = {}
+        self.doc_lens = {}
+        self.len_sums = {}
+        self.keys = {}
+        self._log_offset = 0
+        self._log_ino = None
+        self._log_records = 0
+
+    """
+    Persistence
+    """
+
+    def sync(self):
+        """Replay whatever other processes appended to the log since the last call."""
+        with self.lock:
+            try:
+                st = os.stat(self.log_path)
+            except FileNotFoundError:
+                if self._log_ino is not None:
+                    self._reset()
+                return
+            if st.st_ino != self._log_ino or st.st_size < self._log_offset:
+                self._reset()
+                self._log_ino = st.st_ino
+            if st.st_size == self._log_offset:
+                return
+            with open(self.log_path, "rb") as f:
+                f.seek(self._log_offset)
+                buf = f.read()
+            end = buf.rfind(b"\n") + 1
+            for line in buf[:end].splitlines():
+                if line.strip():
+                    self._replay(json.loads(line))
+            self._log_offset += end
+            self.free = [i for i, cid in enumerate(self.ids) if cid is None]
+            for col in self.vectors.values():
+                col.refresh_norms()
+
+    def _replay(self, rec: dict):
+        self._log_records += 1
+        slot = rec["slot"]
+        self._reserve(slot + 1)
+        if self.ids[slot] is not None:
+            self._clear(slot)
+        if rec["op"] == "put":
+            if rec["id"] in self.slots:
+                self._clear(self.slots[rec["id"]])
+            self._store(slot, rec["id"], rec["row"])
+            for fld in rec.get("vecs", []):
+                self._vector(fld).mark(slot, True)
+
+    def _append(self, records: list[dict]):
+        """Caller holds the table lock and the log flock."""
+        if not records:
+            return
+        for col in self.vectors.values():
+            col.flush()
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+        with open(self.log_path, "ab") as f:
+            f.write(data)
+        self._log_offset += len(data)
+        self._log_ino = os.stat(self.log_path).st_ino
+        self._log_records += len(records)
+        if self._log_records > 2 * len(self.slots) + 1000:
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the log with one put per live row; readers notice the new inode and reload."""
+        tmp = self.log_path + ".tmp"
+        with open(tmp, "wb") as f:
+            for cid, slot in self.slots.items():
+                row = {k: col[slot] for k, col in self.columns.items() if col[slot] is not None}
+                vecs = [fld for fld, col in self.vectors.items() if slot < col.capacity and col.present[slot]]
+                f.write((json.dumps({"op": "put", "slot": slot, "id": cid, "row": row, "vecs": vecs}, ensure_ascii=False) + "\n").encode("utf-8"))
+        os.replace(tmp, self.log_path)
+        st = os.stat(self.log_path)
+        self._log_ino, self._log_offset, self._log_records = st.st_ino, st.st_size, len(self.slots)
+
+    def write_lock(self):
+        return _FileLock(os.path.join(self.path, "rows.lock"))
+
+    """
+    Row storage
+    """
+
+    def _reserve(self, size: int):
+        while len(self.ids) < size:
+            self.ids.append(None)
+            for col in self.columns.values():
+                col.append(None)
+        if len(self.alive) < size:
+            self.alive = np.concatenate([self.alive, np.zeros(max(size, 2 * len(self.alive)) - len(self.alive), dtype=bool)])
+
+    def _column(self, field: str) -> list:
+        if field not in self.columns:
+            self.columns[field] = [None] * len(self.ids)
+        return self.columns[field]
+
+    def _vector(self, field: str) -> _VectorColumn:
+        if field not in self.vectors:
+            dim = int(_VECTOR_FIELD.match(field).group(1))
+            self.vectors[field] = _VectorColumn(os.path.join(self.path, field + ".f32"), dim)
+        return self.vectors[field]
+
+    def _store(self, slot: int, chunk_id: str, row: dict):
+        self.ids[slot] = chunk_id
+        self.slots[chunk_id] = slot
+        self.alive[slot] = True
+        for k, v in row.items():
+            if v is None:
+                continue
+            self._column(k)[slot] = v
+            if _is_text_field(k):
+                tokens = _tokens(v)
+                postings = self.terms.setdefault(k, {})
+                for t, c in Counter(tokens).items():
+                    postings.setdefault(t, {})[slot] = c
+                self.doc_lens.setdefault(k, {})[slot] = len(tokens)
+                self.len_sums[k] = self.len_sums.get(k, 0) + len(tokens)
+            if _is_key_field(k):
+                index = self.keys.setdefault(k, {})
+                for x in _as_values(v):
+                    index.setdefault(str(x), set()).add(slot)
+
+    def _clear(self, slot: int):
+        for k, col in self.columns.items():
+            v = col[slot]
+            if v is None:
+                continue
+            col[slot] = None
+            if _is_text_field(k):
+                postings = self.terms[k]
+                for t in set(_tokens(v)):
+                    post = postings.get(t)
+                    if post is not None:
+                        post.pop(slot, None)
+                        if not post:
+                            del postings[t]
+                self.len_sums[k] -= self.doc_lens[k].pop(slot, 0)
+            if _is_key_field(k):
+                index = self.keys[k]
+                for x in _as_values(v):
+                    slots = index.get(str(x))
+                    if slots is not None:
+                        slots.discard(slot)
+                        if not slots:
+                            del index[str(x)]
+        for col in self.vectors.values():
+            if slot < col.capacity:
+                col.present[slot] = False
+        self.slots.pop(self.ids[slot], None)
+        self.ids[slot] = None
+        self.alive[slot] = False
+
+    def row(self, slot: int, with_vectors: bool = True) -> dict:
+        d = {k: col[slot] for k, col in self.columns.items() if col[slot] is not None}
+        if with_vectors:
+            for fld, col in self.vectors.items():
+                v = col.get(slot)
+                if v is not None:
+                    d[fld] = v
+        d["id"] = self.ids[slot]
+        return d
+
+    def put(self, doc: dict) -> dict:
+        """Insert or overwrite one chunk; returns the log record. Caller holds the write lock."""
+        chunk_id = doc["id"]
+        slot = self.slots.get(chunk_id)
+        if slot is None:
+            slot = self.free.pop() if self.free else len(self.ids)
+            self._reserve(slot + 1)
+        else:
+            self._clear(slot)
+        row, vecs = {}, []
+        for k, v in doc.items():
+            if k == "id" or v is None:
+                continue
+            if _VECTOR_FIELD.match(k):
+                self._vector(k).put(slot, v)
+                vecs.append(k)
+            else:
+                row[k] = v
+        self._store(slot, chunk_id, row)
+        return {"op": "put", "slot": slot, "id": chunk_id, "row": row, "vecs": vecs}
+
+    def remove(self, slot: int) -> dict:
+        self._clear(slot)
+        self.free.append(slot)
+        return {"op": "del", "slot": slot}
+
+    """
+    Query evaluation
+    """
+
+    def _exists(self, field: str) -> np.ndarray:
+        n = len(self.ids)
+        if field in self.vectors:
+            col = self.vectors[field]
+            mask = np.zeros(n, dtype=bool)
+            m = min(n, col.capacity)
+            mask[:m] = col.present[:m]
+            return mask
+        col = self.columns.get(field)
+        if col is None:
+            return np.zeros(n, dtype=bool)
+        return np.fromiter((v is not None for v in col), dtype=bool, count=n)
+
+    def _match_values(self, field: str, values: list) -> np.ndarray:
+        n = len(self.ids)
+        mask = np.zeros(n, dtype=bool)
+        if field == "id":
+            for v in values:
+                slot = self.slots.get(str(v))
+                if slot is not None:
+                    mask[slot] = True
+            return mask
+        if _is_key_field(field):
+            index = self.keys.get(field, {})
+            for v in values:
+                slots = index.get(str(v))
+                if slots:
+                    mask[list(slots)] = True
+            return mask
+        col = self.columns.get(field)
+        if col is None:
+            return mask
+        wanted = set(str(v) for v in values)
+        return np.fromiter((v is not None and any(str(x) in wanted for x in _as_values(v)) for v in col), dtype=bool, count=n)
+
+    def filter(self, condition: dict) -> np.ndarray:
+        """Mirror of the bool filter ESConnection builds from a condition dict."""
+        n = len(self.ids)
+        mask = self.alive[:n].copy()
+        for k, v in condition.items():
+            if k == "available_int":
+                col = self.columns.get(k) or [None] * n
+                unavailable = np.fromiter((x is not None and get_float(x) < 1 for x in col), dtype=bool, count=n)
+                mask &= unavailable if v == 0 else ~unavailable
+                continue
+            if k == "exists":
+                mask &= self._exists(v)
+                continue
+            if k == "must_not":
+                if isinstance(v, dict) and v.get("exists"):
+                    mask &= ~self._exists(v["exists"])
+                continue
+            if not v:
+                continue
+            if not isinstance(v, (list, str, int)):
+                raise Exception(
+                    f"Condition `{str(k)}={str(v)}` value type is {str(type(v))}, expected to be int, str or list.")
+            mask &= self._match_values(k, _as_values(v))
+        return mask
+
+    def bm25(self, fields: list[tuple[str, float]], clauses: list[dict[str, float]]) -> tuple[np.ndarray, np.ndarray]:
+        """Best-field BM25 score and number of matched top-level clauses of every slot."""
+        n = len(self.ids)
+        scores = np.zeros(n, dtype=np.float32)
+        weights = {}
+        for clause in clauses:
+            for t, w in clause.items():
+                weights[t] = weights.get(t, 0.0) + w
+        term_hits = {}
+        n_docs = max(int(self.alive[:n].sum()), 1)
+        for field, boost in fields:
+            postings = self.terms.get(field)
+            if not postings:
+                continue
+            lens = self.doc_lens[field]
+            avgdl = max(self.len_sums.get(field, 0) / max(len(lens), 1), 1e-6)
+            field_scores = np.zeros(n, dtype=np.float32)
+            for t, w in weights.items():
+                post = postings.get(t)
+                if not post:
+                    continue
+                slots = np.fromiter(post.keys(), dtype=np.int64, count=len(post))
+                tf = np.fromiter(post.values(), dtype=np.float32, count=len(post))
+                dl = np.fromiter((lens[s] for s in post), dtype=np.float32, count=len(post))
+                idf = math.log(1 + (n_docs - len(post) + 0.5) / (len(post) + 0.5))
+                field_scores[slots] += w * idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * dl / avgdl))
+                if t not in term_hits:
+                    term_hits[t] = np.zeros(n, dtype=bool)
+                term_hits[t][slots] = True
+            np.maximum(scores, boost * field_scores, out=scores)
+        matched = np.zeros(n, dtype=np.int32)
+        for clause in clauses:
+            hit = np.zeros(n, dtype=bool)
+            for t in clause:
+                if t in term_hits:
+                    hit |= term_hits[t]
+            matched += hit
+        return scores, matched
+
+
+class _FileLock:
+    def __init__(self, path: str):
+        self.path = path
+        self.f = None
+
+    def __enter__(self):
+        self.f = open(self.path, "a")
+        fcntl.flock(self.f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        fcntl.flock(self.f, fcntl.LOCK_UN)
+        self.f.close()
+
+
+class LocalDocStore(DocStoreConnection):
+    def __init__(self, root: str):
+        self.logger = logging.getLogger("ragflow.local_conn")
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+        self._tables = {}
+        self._lock = threading.Lock()
+        self.logger.info(f"Use local doc store {self.root} as the doc engine.")
+
+    def _table(self, index_name: str, create: bool = False) -> _Table | None:
+        path = os.path.join(self.root, re.sub(r"[^\w.-]", "_", index_name))
+        if not os.path.isdir(path):
+            if not create:
+                with self._lock:
+                    self._tables.pop(index_name, None)
+                return None
+            os.makedirs(path, exist_ok=True)
+        with self._lock:
+            tbl = self._tables.get(index_name)
+            if tbl is None:
+                tbl = self._tables[index_name] = _Table(path)
+        tbl.sync()
+        return tbl
+
+    """
+    Database operations
+    """
+
+    def db_type(self) -> str:
+        return "local"
+
+    def health(self) -> dict:
+        return {"type": "local", "status": "green" if os.access(self.root, os.W_OK) else "red", "path": self.root}
+
+    """
+    Table operations
+    """
+
+    def create_idx(self, index_name: str, dataset_id: str, vector_size: int, parser_id: str = None):
+        return self._table(index_name, create=True) is not None
+
+    def create_doc_meta_idx(self, index_name: str):
+        return self._table(index_name, create=True) is not None
+
+    def delete_idx(self, index_name: str, dataset_id: str):
+        if len(dataset_id) > 0:
+            # The index need to be alive after any kb deletion since all kb under this tenant are in one index.
+            return
+        tbl = self._table(index_name)
+        if tbl is None:
+            return
+        with tbl.lock, tbl.write_lock():
+            for col in tbl.vectors.values():
+                col.flush()
+            for fnm in os.listdir(tbl.path):
+                if fnm != "rows.lock":
+                    os.remove(os.path.join(tbl.path, fnm))
+            tbl._reset()
+        with self._lock:
+            self._tables.pop(index_name, None)
+        shutil.rmtree(tbl.path, ignore_errors=True)
+
+    def index_exist(self, index_name: str, dataset_id: str = None) -> bool:
+        return self._table(index_name) is not None
+
+    """
+    CRUD operations
+    """
+
+    def search(
+            self, select_fields: list[str],
+            highlight_fields: list[str],
+            condition: dict,
+            match_expressions: list[MatchExpr],
+            order_by: OrderByExpr,
+            offset: int,
+            limit: int,
+            index_names: str | list[str],
+            knowledgebase_ids: list[str],
+            agg_fields: list[str] | None = None,
+            rank_feature: dict | None = None
+    ):
+        if isinstance(index_names, str):
+            index_names = index_names.split(",")
+        assert isinstance(index_names, list) and len(index_names) > 0
+        assert "_id" not in condition
+        condition = dict(condition)
+        condition["kb_id"] = knowledgebase_ids
+
+        vector_similarity_weight = 0.5
+        for m in match_expressions:
+            if isinstance(m, FusionExpr) and m.method == "weighted_sum" and "weights" in m.fusion_params:
+                vector_similarity_weight = get_float(m.fusion_params["weights"].split(",")[1])
+        match_text = next((m for m in match_expressions if isinstance(m, MatchTextExpr)), None)
+        match_dense = next((m for m in match_expressions if isinstance(m, MatchDenseExpr)), None)
+        clauses = parse_query(match_text.matching_text) if match_text else []
+        text_fields = []
+        if match_text:
+            for fld in match_text.fields:
+                fld, _, boost = fld.partition("^")
+                text_fields.append((fld, get_float(boost) if boost else 1.0))
+
+        # (table, slots, text scores, dense similarities) per index
+        candidates = []
+        for index_name in index_names:
+            tbl = self._table(index_name)
+            if tbl is None:
+                continue
+            with tbl.lock:
+                mask = tbl.filter(condition)
+                n = len(mask)
+                text = np.zeros(n, dtype=np.float32)
+                dense = np.zeros(n, dtype=np.float32)
+                if match_text or match_dense:
+                    hit = np.zeros(n, dtype=bool)
+                    if match_text:
+                        text, matched = tbl.bm25(text_fields, clauses)
+                        if rank_feature:
+                            text += self._rank_features(tbl, rank_feature)
+                        msm = _minimum_should_match((match_text.extra_options or {}).get("minimum_should_match", 0.0), len(clauses))
+                        hit |= mask & (matched >= max(msm, 1))
+                    if match_dense and match_dense.vector_column_name in tbl.vectors:
+                        idx, sims = tbl.vectors[match_dense.vector_column_name].search(
+                            mask, match_dense.embedding_data, match_dense.topn,
+                            (match_dense.extra_options or {}).get("similarity", 0.0))
+                        dense[idx] = sims
+                        hit[idx] = True
+                    mask = hit
+                slots = np.nonzero(mask)[0]
+                candidates.append((index_name, tbl, slots, text[slots], dense[slots]))
+
+        text_max = max([float(t.max()) for _, _, _, t, _ in candidates if len(t)] + [0.0])
+        hits = []
+        for index_name, tbl, slots, text, dense in candidates:
+            if match_text and match_dense:
+                scores = (1 - vector_similarity_weight) * (text / text_max if text_max else text) + vector_similarity_weight * dense
+            else:
+                scores = text + dense
+            hits.extend((float(sc), index_name, tbl, int(slot)) for sc, slot in zip(scores, slots))
+        total = len(hits)
+
+        if order_by and order_by.fields:
+            for field, order in reversed(order_by.fields):
+                hits.sort(key=lambda h: self._sort_key(h[2], h[3], field, order), reverse=order == 1)
+        elif match_text or match_dense:
+            hits.sort(key=lambda h: -h[0])
+
+        aggs = {}
+        for fld in agg_fields or []:
+            cnt = Counter()
+            for _, _, tbl, slot in hits:
+                col = tbl.columns.get(fld)
+                if col is not None and col[slot] is not None:
+                    cnt.update(str(x) for x in _as_values(col[slot]))
+            aggs[f"aggs_{fld}"] = {"buckets": [{"key": k, "doc_count": c} for k, c in cnt.most_common()]}
+
+        size = limit if limit > 0 else DEFAULT_SIZE
+        with_vectors = not select_fields or "*" in select_fields or any(_VECTOR_FIELD.match(f) for f in select_fields)
+        highlight_terms = set(t for c in clauses for t in c)
+        res_hits = []
+        for score, index_name, tbl, slot in hits[offset:offset + size]:
+            with tbl.lock:
+                if tbl.ids[slot] is None:
+                    continue
+                src = tbl.row(slot, with_vectors=with_vectors)
+            d = {"_index": index_name, "_id": src.pop("id"), "_score": score, "_source": src}
+            highlight = {}
+            for fld in highlight_fields or []:
+                fragments = self._highlight(src.get(fld), highlight_terms)
+                if fragments:
+                    highlight[fld] = fragments
+            if highlight:
+                d["highlight"] = highlight
+            res_hits.append(d)
+        return {"hits": {"total": {"value": total, "relation": "eq"}, "hits": res_hits}, "aggregations": aggs}
+
+    @staticmethod
+    def _rank_features(tbl: _Table, rank_feature: dict) -> np.ndarray:
+        n = len(tbl.ids)
+        boost = np.zeros(n, dtype=np.float32)
+        for fld, sc in rank_feature.items():
+            if fld == PAGERANK_FLD:
+                col = tbl.columns.get(PAGERANK_FLD) or [None] * n
+                boost += sc * np.fromiter((get_float(v) if v is not None else 0.0 for v in col), dtype=np.float32, count=n)
+            else:
+                col = tbl.columns.get(TAG_FLD) or [None] * n
+                boost += sc * np.fromiter((get_float(v.get(fld, 0)) if isinstance(v, dict) else 0.0 for v in col), dtype=np.float32, count=n)
+        return boost
+
+    @staticmethod
+    def _sort_key(tbl: _Table, slot: int, field: str, order: int):
+        col = tbl.columns.get(field)
+        v = col[slot] if col is not None else None
+        if isinstance(v, list):
+            nums = [get_float(x) for x in v]
+            v = sum(nums) / len(nums) if nums else None
+        # Missing values sort last in both directions.
+        missing = v is None
+        if order == 1:
+            missing = not missing
+        if v is None:
+            v = 0
+        elif not isinstance(v, (int, float)):
+            v = str(v)
+        return missing, v
+
+    @staticmethod
+    def _highlight(value, terms: set) -> list[str]:
+        if not value or not terms or not isinstance(value, str):
+            return []
+        fragments = []
+        for sent in re.split(r"[.?!;\n。？！；]", value):
+            tks = sent.split()
+            if not any(t.lower() in terms for t in tks):
+                continue
+            fragments.append(" ".join(f"<em>{t}</em>" if t.lower() in terms else t for t in tks))
+        return fragments
+
+    def get(self, data_id: str, index_name: str, dataset_ids: list[str]) -> dict | None:
+        for nm in index_name.split(",") if isinstance(index_name, str) else index_name:
+            tbl = self._table(nm)
+            if tbl is None:
+                continue
+            with tbl.lock:
+                slot = tbl.slots.get(data_id)
+                if slot is not None:
+                    return tbl.row(slot)
+        return None
+
+    def insert(self, rows: list[dict], index_name: str, dataset_id: str = None) -> list[str]:
+        tbl = self._table(index_name, create=True)
+        res = []
+        with tbl.lock, tbl.write_lock():
+            tbl.sync()
+            records = []
+            for d in rows:
+                assert "_id" not in d
+                assert "id" in d
+                d_copy = copy.deepcopy(d)
+                d_copy["kb_id"] = dataset_id
+                try:
+                    records.append(tbl.put(d_copy))
+                except Exception as e:
+                    res.append(str(d["id"]) + ":" + str(e))
+            tbl._append(records)
+        return res
+
+    def update(self, condition: dict, new_value: dict, index_name: str, dataset_id: str) -> bool:
+        tbl = self._table(index_name)
+        if tbl is None:
+            return False
+        condition = dict(condition)
+        condition["kb_id"] = dataset_id
+        try:
+            with tbl.lock, tbl.write_lock():
+                tbl.sync()
+                records = []
+                for slot in np.nonzero(tbl.filter(condition))[0]:
+                    doc = tbl.row(int(slot))
+                    for k, v in new_value.items():
+                        if k == "id":
+                            continue
+                        if k == "remove":
+                            if isinstance(v, str):
+                                doc.pop(v, None)
+                            elif isinstance(v, dict):
+                                for kk, vv in v.items():
+                                    if isinstance(doc.get(kk), list) and vv in doc[kk]:
+                                        doc[kk].remove(vv)
+                            continue
+                        if k == "add":
+                            if isinstance(v, dict):
+                                for kk, vv in v.items():
+                                    doc[kk] = (doc.get(kk) or []) + [vv.strip() if isinstance(vv, str) else vv]
+                            continue
+                        if (not isinstance(k, str) or not v) and k != "available_int":
+                            continue
+                        doc[k] = copy.deepcopy(v)
+                    records.append(tbl.put(doc))
+                tbl._append(records)
+            return True
+        except Exception as e:
+            self.logger.error("LocalConnection.update got exception: " + str(e))
+            return False
+
+    def delete(self, condition: dict, index_name: str, dataset_id: str) -> int:
+        assert "_id" not in condition
+        tbl = self._table(index_name)
+        if tbl is None:
+            return 0
+        condition = dict(condition)
+        condition["kb_id"] = dataset_id
+        if "id" in condition and not condition["id"]:
+            # An empty id list means "no id filter", as in ESConnection.delete.
+            condition.pop("id")
+        with tbl.lock, tbl.write_lock():
+            tbl.sync()
+            records = [tbl.remove(int(slot)) for slot in np.nonzero(tbl.filter(condition))[0]]
+            tbl._append(records)
+        return len(records)
+
+    """
+    Helper functions for search result
+    """
+
+    def get_total(self, res):
+        return res["hits"]["total"]["value"]
+
+    def get_doc_ids(self, res):
+        return [d["_id"] for d in res["hits"]["hits"]]
+
+    def get_fields(self, res, fields: list[str]) -> dict[str, dict]:
+        res_fields = {}
+        if not fields:
+            return {}
+        for d in res["hits"]["hits"]:
+            src = dict(d["_source"], id=d["_id"], _score=d["_score"])
+            m = {n: src.get(n) for n in fields if src.get(n) is not None}
+            for n, v in m.items():
+                if isinstance(v, list):
+                    continue
+                if n == "available_int" and isinstance(v, (int, float)):
+                    continue
+                if not isinstance(v, str):
+                    m[n] = str(m[n])
+            if m:
+                res_fields[d["_id"]] = m
+        return res_fields
+
+    def get_highlight(self, res, keywords: list[str], field_name: str):
+        ans = {}
+        for d in res["hits"]["hits"]:
+            highlights = d.get("highlight")
+            if not highlights:
+                continue
+            txt = d["_source"].get(field_name) or ""
+            txt = re.sub(r"[\r\n]", " ", txt, flags=re.IGNORECASE | re.MULTILINE)
+            txt_list = []
+            for t in re.split(r"[.?!;\n]", txt):
+                for w in keywords:
+                    t = re.sub(r"(^|[ .?/'\"\(\)!,:;-])(%s)([ .?/'\"\(\)!,:;-])" % re.escape(w), r"\1<em>\2</em>\3", t,
+                               flags=re.IGNORECASE | re.MULTILINE)
+                if not re.search(r"<em>[^<>]+</em>", t, flags=re.IGNORECASE | re.MULTILINE):
+                    continue
+                txt_list.append(t)
+            ans[d["_id"]] = "...".join(txt_list) if txt_list else "...".join(list(highlights.values())[0])
+        return ans
+
+    def get_aggregation(self, res, field_name: str):
+        agg_field = "aggs_" + field_name
+        if "aggregations" not in res or agg_field not in res["aggregations"]:
+            return list()
+        buckets = res["aggregations"][agg_field]["buckets"]
+        return [(b["key"], b["doc_count"]) for b in buckets]
+
+    """
+    SQL
+    """
+
+    def sql(self, sql: str, fetch_size: int, format: str):
+        self.logger.warning("LocalConnection.sql is not supported by the local doc engine.")
+        return None
+
+
+@singleton
+class LocalConnection(LocalDocStore):
+    def __init__(self):
+        from common import settings
+
+        super().__init__(settings.LOCAL.get("path", os.path.join(get_project_base_directory(), "data", "doc_store")))
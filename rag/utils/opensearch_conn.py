@@ -163,6 +163,10 @@ class OSConnection(DocStoreConnection):
                 continue
             if not v:
                 continue
+            if k == "id":
+                # The chunk id is the document _id, not a source field.
+                bqry.filter.append(Q("ids", values=v if isinstance(v, list) else [v]))
+                continue
             if isinstance(v, list):
                 bqry.filter.append(Q("terms", **{k: v}))
             elif isinstance(v, str) or isinstance(v, int):
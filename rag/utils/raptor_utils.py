@@ -21,12 +21,19 @@ Utility functions for Raptor processing decisions.
 import logging
 from typing import Optional
 
+import xxhash
+
 # File extensions for structured data types
 EXCEL_EXTENSIONS = {".xls", ".xlsx", ".xlsm", ".xlsb"}
 CSV_EXTENSIONS = {".csv", ".tsv"}
 STRUCTURED_EXTENSIONS = EXCEL_EXTENSIONS | CSV_EXTENSIONS
 
 
+def raptor_tree_id(doc_id: str) -> str:
+    """Chunk id of the persisted RAPTOR cluster tree of a document (incremental RAPTOR)."""
+    return xxhash.xxh64(f"raptor_tree_{doc_id}".encode("utf-8")).hexdigest()
+
+
 def is_structured_file_type(file_type: Optional[str]) -> bool:
     """
     Check if a file type is structured data (Excel, CSV, etc.)
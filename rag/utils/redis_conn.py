@@ -61,6 +61,8 @@ class RedisMsg:
 class RedisDB:
     lua_delete_if_equal = None
     lua_token_bucket = None
+    lua_hash_deduct = None
+    lua_versioned_append = None
     LUA_DELETE_IF_EQUAL_SCRIPT = """
         local current_value = redis.call('get', KEYS[1])
         if current_value and current_value == ARGV[1] then
@@ -70,6 +72,26 @@ class RedisDB:
         return 0
     """
 
+    LUA_HASH_DEDUCT_SCRIPT = """
+        -- ARGV = field1, amount1, field2, amount2, ...
+        for i = 1, #ARGV, 2 do
+            local left = redis.call("HINCRBY", KEYS[1], ARGV[i], -tonumber(ARGV[i + 1]))
+            if left <= 0 then
+                redis.call("HDEL", KEYS[1], ARGV[i])
+            end
+        end
+        return 1
+    """
+
+    LUA_VERSIONED_APPEND_SCRIPT = """
+        -- KEYS[1] = version counter, KEYS[2] = change log (sorted set scored by version)
+        -- ARGV[1] = entry, ARGV[2] = number of entries to keep
+        local version = redis.call("INCR", KEYS[1])
+        redis.call("ZADD", KEYS[2], version, version .. "\t" .. ARGV[1])
+        redis.call("ZREMRANGEBYRANK", KEYS[2], 0, -tonumber(ARGV[2]) - 1)
+        return version
+    """
+
     LUA_TOKEN_BUCKET_SCRIPT = """
         -- KEYS[1] = rate limit key
         -- ARGV[1] = capacity
@@ -113,6 +135,7 @@ class RedisDB:
 
     def __init__(self):
         self.REDIS = None
+        self.REDIS_BIN = None
         self.config = REDIS
         self.__open__()
 
@@ -121,6 +144,8 @@ class RedisDB:
         client = self.REDIS
         cls.lua_delete_if_equal = client.register_script(cls.LUA_DELETE_IF_EQUAL_SCRIPT)
         cls.lua_token_bucket = client.register_script(cls.LUA_TOKEN_BUCKET_SCRIPT)
+        cls.lua_hash_deduct = client.register_script(cls.LUA_HASH_DEDUCT_SCRIPT)
+        cls.lua_versioned_append = client.register_script(cls.LUA_VERSIONED_APPEND_SCRIPT)
 
     def __open__(self):
         try:
@@ -138,6 +163,8 @@ class RedisDB:
                 conn_params["password"] = password
 
             self.REDIS = redis.StrictRedis(**conn_params)
+            # Binary payloads (e.g. packed embeddings) must not be utf-8 decoded.
+            self.REDIS_BIN = redis.StrictRedis(**{**conn_params, "decode_responses": False})
 
             self.register_scripts()
         except Exception as e:
@@ -206,6 +233,42 @@ class RedisDB:
             self.__open__()
         return False
 
+    def get_many(self, keys: list[str], binary: bool = False, batch_size: int = 512) -> list:
+        """
+        Fetch many keys with MGET, `batch_size` keys per round-trip.
+        Missing keys, and every key when Redis is unavailable, come back as None.
+        """
+        client = self.REDIS_BIN if binary else self.REDIS
+        if not keys or not client:
+            return [None] * len(keys)
+        res = []
+        try:
+            for i in range(0, len(keys), batch_size):
+                res.extend(client.mget(keys[i : i + batch_size]))
+            return res
+        except Exception as e:
+            logging.warning("RedisDB.get_many got exception: " + str(e))
+            self.__open__()
+        return [None] * len(keys)
+
+    def set_many(self, mapping: dict, exp=3600, binary: bool = False, batch_size: int = 512):
+        """Set many keys through non-transactional pipelines of `batch_size` SET commands."""
+        client = self.REDIS_BIN if binary else self.REDIS
+        if not mapping or not client:
+            return False
+        items = list(mapping.items())
+        try:
+            for i in range(0, len(items), batch_size):
+                pipe = client.pipeline(transaction=False)
+                for k, v in items[i : i + batch_size]:
+                    pipe.set(k, v, exp)
+                pipe.execute()
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.set_many got exception: " + str(e))
+            self.__open__()
+        return False
+
     def sadd(self, key: str, member: str):
         try:
             self.REDIS.sadd(key, member)
@@ -478,6 +541,35 @@ class RedisDB:
         """
         return bool(self.lua_delete_if_equal(keys=[key], args=[expected_value], client=self.REDIS))
 
+    def hash_deduct(self, key: str, amounts: dict):
+        """
+        Do following atomically:
+        Decrement each field of a hash by its amount, deleting the fields that drop to zero.
+        """
+        args = []
+        for field, amount in amounts.items():
+            args.extend([field, int(amount)])
+        if args:
+            self.lua_hash_deduct(keys=[key], args=args, client=self.REDIS)
+
+    def versioned_append(self, version_key: str, log_key: str, entry: str, keep: int) -> int:
+        """
+        Do following atomically:
+        Bump a version counter and log `entry` under the new version, keeping the last `keep` entries.
+        Returns the new version; `versioned_entries` reads the log back.
+        """
+        return int(self.lua_versioned_append(keys=[version_key, log_key], args=[entry, keep], client=self.REDIS))
+
+    def versioned_entries(self, log_key: str, after: int, upto: int) -> list[str] | None:
+        """
+        The entries logged by `versioned_append` for versions after..upto, oldest first, or None if
+        some of them were trimmed from the log (or Redis is unavailable).
+        """
+        res = self.zrangebyscore(log_key, after + 1, upto)
+        if res is None or len(res) != upto - after:
+            return None
+        return [(e.decode("utf-8") if isinstance(e, bytes) else e).split("\t", 1)[1] for e in res]
+
     def delete(self, key) -> bool:
         try:
             self.REDIS.delete(key)
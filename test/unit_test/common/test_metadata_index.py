@@ -0,0 +1,79 @@
+from common.metadata_utils import MetadataIndex, meta_filter
+
+
+def _index(docs):
+    index = MetadataIndex()
+    for doc_id, meta in docs.items():
+        index.set_document(doc_id, meta)
+    return index
+
+
+def test_flatted_expands_lists_and_skips_none():
+    index = _index({
+        "doc1": {"tags": ["foo", "bar"], "author": "alice"},
+        "doc2": {"tags": ["foo"], "author": None},
+    })
+
+    assert index.flatted() == {
+        "tags": {"foo": ["doc1", "doc2"], "bar": ["doc1"]},
+        "author": {"alice": ["doc1"]},
+    }
+
+
+def test_set_document_replaces_previous_metadata():
+    index = _index({"doc1": {"author": "alice"}, "doc2": {"author": "bob"}})
+    index.set_document("doc1", {"author": "bob", "year": "2024"})
+
+    assert index.flatted() == {"author": {"bob": ["doc2", "doc1"]}, "year": {"2024": ["doc1"]}}
+
+
+def test_remove_document_drops_empty_fields():
+    index = _index({"doc1": {"author": "alice", "year": "2024"}, "doc2": {"author": "bob"}})
+    index.remove_document("doc1")
+
+    assert len(index) == 1
+    assert index.flatted() == {"author": {"bob": ["doc2"]}}
+
+
+def test_remove_document_compacts_positions():
+    index = _index({f"doc{i}": {"n": str(i % 3)} for i in range(3000)})
+    for i in range(0, 3000, 2):
+        index.remove_document(f"doc{i}")
+    for i in range(0, 3000, 4):
+        index.remove_document(f"doc{i + 1}")
+
+    assert len(index) == 750
+    assert sorted(index.filter([{"key": "n", "op": "=", "value": "0"}])) == sorted(f"doc{i}" for i in range(3, 3000, 4) if i % 3 == 0)
+
+
+def test_filter_matches_meta_filter():
+    docs = {
+        "doc1": {"author": "alice", "year": "2021", "tags": ["a", "b"]},
+        "doc2": {"author": "bob", "year": "2023", "tags": ["b"]},
+        "doc3": {"author": "carol", "year": "2024"},
+    }
+    index = _index(docs)
+    plain = {k: dict(v) for k, v in index.flatted().items()}
+
+    for filters, logic in [
+        ([{"key": "year", "op": ">", "value": "2022"}], "and"),
+        ([{"key": "tags", "op": "=", "value": "b"}, {"key": "author", "op": "≠", "value": "bob"}], "and"),
+        ([{"key": "author", "op": "start with", "value": "car"}, {"key": "tags", "op": "=", "value": "a"}], "or"),
+        ([{"key": "missing", "op": "=", "value": "x"}], "and"),
+    ]:
+        assert sorted(index.filter(filters, logic)) == sorted(meta_filter(plain, filters, logic))
+
+
+def test_meta_filter_uses_index():
+    index = _index({"doc1": {"status": "active"}, "doc2": {"status": "done"}})
+
+    assert meta_filter(index.flatted(), [{"key": "status", "op": "in", "value": "active,pending"}]) == ["doc1"]
+
+
+def test_merge():
+    merged = MetadataIndex.merge([
+        _index({"doc1": {"author": "alice"}}),
+        _index({"doc2": {"author": "alice"}, "doc3": {"author": "bob"}}),
+    ])
+
+    assert merged.flatted() == {"author": {"alice": ["doc1", "doc2"], "bob": ["doc3"]}}
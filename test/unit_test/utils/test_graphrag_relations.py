@@ -0,0 +1,53 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Unit tests for the relation chunks set_graph writes back after deleting removed edges.
+"""
+
+import networkx as nx
+
+from rag.graphrag.utils import GraphChange, _relations_to_restore, get_from_to
+
+
+def _set_graph_relations(stored, graph, change):
+    """The (from, to) relation chunks left after set_graph's terms delete and re-inserts."""
+    nodes = sorted(set(n for edge in change.removed_edges for n in edge))
+    kept = [(f, t) for f, t in stored if not (f in nodes and t in nodes)]
+    return kept + list(_relations_to_restore(graph, change, nodes).values())
+
+
+def test_reverse_oriented_edge_is_not_duplicated():
+    graph = nx.Graph()
+    graph.add_edges_from([("c", "d"), ("a", "b"), ("b", "e")])
+    # (c, d) is stored as it was first extracted, against the from/to order of the removed edges.
+    stored = [("c", "d"), ("a", "b"), ("b", "e"), ("a", "c"), ("d", "e")]
+    change = GraphChange(removed_edges={("a", "c"), ("d", "e")})
+
+    relations = _set_graph_relations(stored, graph, change)
+
+    pairs = [get_from_to(f, t) for f, t in relations]
+    assert sorted(pairs) == sorted(get_from_to(f, t) for f, t in graph.edges)
+    assert len(pairs) == len(set(pairs))
+
+
+def test_removed_edge_still_linking_other_nodes_is_not_restored():
+    graph = nx.Graph()
+    graph.add_edges_from([("a", "c"), ("c", "e")])
+    change = GraphChange(removed_edges={("a", "c"), ("c", "e")})
+    graph.remove_edge("c", "e")
+
+    assert _relations_to_restore(graph, change, ["a", "c", "e"]) == {}
@@ -0,0 +1,50 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Unit tests for the LLM result cache keys and value encoding.
+"""
+
+from rag.utils import llm_cache
+
+
+def test_cache_key_is_canonical():
+    a = llm_cache.cache_key(llm_cache.TAGS, "m", "txt", {"b": 1, "a": [1, 2]}, {"topn": 3})
+    b = llm_cache.cache_key(llm_cache.TAGS, "m", "txt", {"a": [1, 2], "b": 1}, {"topn": 3})
+    assert a == b
+    assert a.startswith("llm:tags:")
+    assert a != llm_cache.cache_key(llm_cache.KEYWORDS, "m", "txt", {"a": [1, 2], "b": 1}, {"topn": 3})
+    assert llm_cache.cache_key(llm_cache.CHAT, "m", "ab", "c", {}) != llm_cache.cache_key(llm_cache.CHAT, "m", "a", "bc", {})
+
+
+def test_context_digest_stands_for_the_context():
+    tags = {"finance": 12, "law": 3}
+    digest = llm_cache.context_digest(tags)
+    assert digest == llm_cache.context_digest({"law": 3, "finance": 12})
+    assert digest != llm_cache.context_digest({"finance": 12})
+    assert llm_cache.cache_key(llm_cache.TAGS, "m", "txt", digest, {}) == llm_cache.cache_key(llm_cache.TAGS, "m", "txt", llm_cache.context_digest(tags), {})
+
+
+def test_pack_roundtrip():
+    value = "关键词, keyword " * 100
+    assert llm_cache._unpack(llm_cache._pack(value)) == value
+    assert llm_cache._unpack(b"\x07garbage") is None
+
+
+def test_cache_ttl_per_purpose(monkeypatch):
+    monkeypatch.setenv("LLM_CACHE_TTL_TAGS", "60")
+    assert llm_cache.cache_ttl(llm_cache.TAGS) == 60
+    assert llm_cache.cache_ttl(llm_cache.KEYWORDS) == llm_cache.LLM_CACHE_TTL
@@ -0,0 +1,120 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Unit tests for the embedded local doc engine.
+"""
+
+import pytest
+
+from common.doc_store.doc_store_base import FusionExpr, MatchDenseExpr, MatchTextExpr, OrderByExpr
+from rag.utils.local_conn import LocalDocStore, parse_query
+
+IDX = "ragflow_tenant"
+FIELDS = ["title_tks^10", "content_ltks^2"]
+
+
+def _chunk(cid, doc_id, content, vec, **kwargs):
+    return {"id": cid, "doc_id": doc_id, "docnm_kwd": f"{doc_id}.pdf", "content_ltks": content,
+            "content_with_weight": content, "q_3_vec": vec, **kwargs}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocalDocStore(str(tmp_path))
+    store.create_idx(IDX, "kb1", 3)
+    assert store.insert([
+        _chunk("c1", "d1", "apple banana", [1.0, 0.0, 0.0], page_num_int=[2]),
+        _chunk("c2", "d1", "banana cherry", [0.0, 1.0, 0.0], page_num_int=[1]),
+        _chunk("c3", "d2", "cherry durian", [0.0, 0.0, 1.0], available_int=0, page_num_int=[3]),
+    ], IDX, "kb1") == []
+    assert store.insert([_chunk("c4", "d3", "apple apple", [1.0, 0.1, 0.0])], IDX, "kb2") == []
+    return store
+
+
+def _search(store, condition, exprs, kb_ids=("kb1", "kb2"), order_by=None, limit=10, **kwargs):
+    res = store.search(["content_ltks", "doc_id"], [], condition, exprs, order_by or OrderByExpr(), 0, limit, IDX, list(kb_ids), **kwargs)
+    return res, store.get_doc_ids(res)
+
+
+def test_parse_query_boosts_and_groups():
+    clauses = parse_query('(apple^0.5 "red fruit"^0.2) OR (banana)^2')
+    assert clauses == [{"apple": 0.5, "red": 0.2, "fruit": 0.2}, {"banana": 2.0}]
+
+
+def test_filters(store):
+    _, ids = _search(store, {"doc_id": "d1"}, [])
+    assert sorted(ids) == ["c1", "c2"]
+    _, ids = _search(store, {"available_int": 0}, [])
+    assert ids == ["c3"]
+    _, ids = _search(store, {"available_int": 1}, [], kb_ids=["kb1"])
+    assert sorted(ids) == ["c1", "c2"]
+
+
+def test_text_match_respects_minimum_should_match(store):
+    match = MatchTextExpr(FIELDS, "(apple) (banana)", 100, {"minimum_should_match": 1.0})
+    res, ids = _search(store, {}, [match])
+    assert ids == ["c1"]
+    match = MatchTextExpr(FIELDS, "(apple) (banana)", 100, {"minimum_should_match": 0.3})
+    res, ids = _search(store, {}, [match])
+    assert store.get_total(res) == 3
+    assert ids[0] == "c1"
+
+
+def test_hybrid_fusion(store):
+    exprs = [
+        MatchTextExpr(FIELDS, "cherry", 100, {"minimum_should_match": 0.3}),
+        MatchDenseExpr("q_3_vec", [1.0, 0.0, 0.0], "float", "cosine", 2, {"similarity": 0.5}),
+        FusionExpr("weighted_sum", 100, {"weights": "0.05,0.95"}),
+    ]
+    res, ids = _search(store, {}, exprs)
+    assert set(ids) == {"c1", "c2", "c3", "c4"}
+    assert ids[:2] == ["c1", "c4"]
+    assert "q_3_vec" not in res["hits"]["hits"][0]["_source"]
+
+
+def test_order_by_and_aggregation(store):
+    res, ids = _search(store, {}, [], kb_ids=["kb1"], order_by=OrderByExpr().asc("page_num_int"), agg_fields=["docnm_kwd"])
+    assert ids == ["c2", "c1", "c3"]
+    assert store.get_aggregation(res, "docnm_kwd") == [("d1.pdf", 2), ("d2.pdf", 1)]
+
+
+def test_update_and_delete(store):
+    assert store.update({"id": "c1"}, {"content_ltks": "mango", "important_kwd": ["x"]}, IDX, "kb1")
+    assert store.get("c1", IDX, ["kb1"])["q_3_vec"] == [1.0, 0.0, 0.0]
+    _, ids = _search(store, {}, [MatchTextExpr(FIELDS, "mango", 100, {})])
+    assert ids == ["c1"]
+    _, ids = _search(store, {}, [MatchTextExpr(FIELDS, "apple", 100, {})])
+    assert ids == ["c4"]
+
+    assert store.delete({"doc_id": "d1"}, IDX, "kb1") == 2
+    assert store.get("c1", IDX, ["kb1"]) is None
+
+
+def test_reopen_and_shared_writers(store, tmp_path):
+    store.delete({"id": ["c2"]}, IDX, "kb1")
+    other = LocalDocStore(str(tmp_path))
+    assert other.get("c2", IDX, ["kb1"]) is None
+    assert other.get("c1", IDX, ["kb1"])["content_ltks"] == "apple banana"
+
+    # Rows written by one instance are visible to the other, and freed slots are reused.
+    other.insert([_chunk("c5", "d4", "elderberry", [0.0, 1.0, 0.0])], IDX, "kb1")
+    exprs = [MatchDenseExpr("q_3_vec", [0.0, 1.0, 0.0], "float", "cosine", 1, {"similarity": 0.9})]
+    _, ids = _search(store, {}, exprs)
+    assert ids == ["c5"]
+
+    store.delete_idx(IDX, "")
+    assert not other.index_exist(IDX)
@@ -0,0 +1,126 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Unit tests for the incremental update of a persisted RAPTOR cluster tree.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from rag.raptor import RAPTOR_TREE_VERSION, RecursiveAbstractiveProcessing4TreeOrganizedRetrieval as Raptor, raptor_leaf_key
+
+
+def _leaf(text, vec):
+    return text, np.array(vec, dtype=np.float64)
+
+
+@pytest.fixture
+def raptor(monkeypatch):
+    raptor = Raptor(64, None, SimpleNamespace(llm_name="embd"), "{cluster_content}", 256, 0.1)
+    raptor.summarized = []
+
+    async def summarize(texts, task_id=""):
+        raptor.summarized.append(list(texts))
+        return "sum(" + "|".join(texts) + ")", np.array([1.0, 1.0])
+
+    monkeypatch.setattr(raptor, "_summarize", summarize)
+    return raptor
+
+
+def _tree(raptor):
+    """Two layer-0 clusters {a, b} and {c, d} near the x and y axis under one root."""
+    a, b, c, d = (raptor_leaf_key(t) for t in "abcd")
+    return {
+        "version": RAPTOR_TREE_VERSION,
+        "config": raptor._tree_config(0, 2),
+        "leaves": {a: "c0", b: "c0", c: "c1", d: "c1"},
+        "clusters": [
+            {"id": "c0", "layer": 0, "members": [a, b], "summary": "S0", "centroid": [1.0, 0.0]},
+            {"id": "c1", "layer": 0, "members": [c, d], "summary": "S1", "centroid": [0.0, 1.0]},
+            {"id": "c2", "layer": 1, "members": ["c0", "c1"], "summary": "S2"},
+        ],
+    }
+
+
+def _chunks(*texts):
+    vecs = {"a": [1, 0], "b": [0.9, 0.1], "c": [0, 1], "d": [0.1, 0.9], "e": [0.8, 0.2], "f": [0.2, 0.8]}
+    return [_leaf(t, vecs[t]) for t in texts]
+
+
+def test_new_leaf_goes_to_the_nearest_cluster_and_dirties_its_ancestors(raptor):
+    summaries, tree, stale = asyncio.run(raptor.update(_chunks("a", "b", "c", "d", "e"), _tree(raptor), 0))
+
+    clusters = {c["id"]: c for c in tree["clusters"]}
+    assert tree["leaves"][raptor_leaf_key("e")] == "c0"
+    assert clusters["c0"]["members"][-1] == raptor_leaf_key("e")
+    # c0 and its parent are summarized again, the untouched c1 is not.
+    assert raptor.summarized == [["a", "b", "e"], ["sum(a|b|e)", "S1"]]
+    assert [s for s, _ in summaries] == ["sum(a|b|e)", "sum(sum(a|b|e)|S1)"]
+    assert clusters["c1"]["summary"] == "S1"
+    assert sorted(stale) == ["S0", "S2"]
+
+
+def test_emptied_cluster_is_dropped(raptor):
+    _, tree, _ = asyncio.run(raptor.update(_chunks("a", "b", "c", "d", "e", "f"), _tree(raptor), 0))
+    assert raptor.summarized[:2] == [["a", "b", "e"], ["c", "d", "f"]]
+
+    raptor.summarized = []
+    _, tree, stale = asyncio.run(raptor.update(_chunks("a", "b", "e"), tree, 0))
+
+    clusters = {c["id"]: c for c in tree["clusters"]}
+    assert "c1" not in clusters
+    assert clusters["c2"]["members"] == ["c0"]
+    assert set(tree["leaves"]) == {raptor_leaf_key(t) for t in "abe"}
+    # Only the root is left to summarize again: c0 kept all its leaves.
+    assert raptor.summarized == [["sum(a|b|e)"]]
+    assert sorted(stale) == ["sum(c|d|f)", "sum(sum(a|b|e)|sum(c|d|f))"]
+
+
+@pytest.mark.parametrize(
+    "texts,rebuilt",
+    [
+        (("a", "b", "c", "d", "e", "f"), False),
+        (("a", "b", "c", "e", "f"), True),
+    ],
+)
+def test_rebuild_ratio(raptor, monkeypatch, texts, rebuilt):
+    built = []
+
+    async def build_tree(leaves, config, random_state, callback=None, task_id=""):
+        built.append(list(leaves))
+        return [], {"version": RAPTOR_TREE_VERSION, "config": config, "leaves": {k: "c0" for k in leaves}, "clusters": []}
+
+    monkeypatch.setattr(raptor, "_build_tree", build_tree)
+    asyncio.run(raptor.update(_chunks(*texts), _tree(raptor), 0))
+    # 2 new leaves over 4 kept ones is within the 0.5 ratio, 2 over 3 is not.
+    assert bool(built) == rebuilt
+
+
+def test_changed_config_rebuilds(raptor, monkeypatch):
+    built = []
+
+    async def build_tree(leaves, config, random_state, callback=None, task_id=""):
+        built.append(config)
+        return [], {"version": RAPTOR_TREE_VERSION, "config": config, "leaves": {}, "clusters": []}
+
+    monkeypatch.setattr(raptor, "_build_tree", build_tree)
+    _, _, stale = asyncio.run(raptor.update(_chunks("a", "b", "c", "d"), _tree(raptor), 1))
+    assert built == [raptor._tree_config(1, 2)]
+    assert sorted(stale) == ["S0", "S1", "S2"]
@@ -0,0 +1,90 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Unit tests for the coalescing progress reporter of the task executor.
+"""
+
+import pytest
+
+from rag.svr import task_progress
+from rag.svr.task_progress import TaskProgressReporter, merge_progress
+
+
+class _Recorder:
+    def __init__(self):
+        self.updates = []
+        self.cancel_checks = 0
+        self.cancel = False
+
+    def update_progress(self, task_id, info):
+        self.updates.append((task_id, info))
+
+    def has_canceled(self, task_id):
+        self.cancel_checks += 1
+        return self.cancel
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    recorder = _Recorder()
+    monkeypatch.setattr(task_progress, "TaskService", recorder)
+    monkeypatch.setattr(task_progress, "has_canceled", recorder.has_canceled)
+    monkeypatch.setattr(task_progress, "close_connection", lambda: None)
+    return recorder
+
+
+def test_merge_progress_is_monotonic():
+    assert merge_progress(None, 0.3) == 0.3
+    assert merge_progress(0.5, 0.3) == 0.5
+    assert merge_progress(0.5, None) == 0.5
+    assert merge_progress(0.5, -1) == -1
+    assert merge_progress(-1, 0.9) == -1
+
+
+def test_reports_are_coalesced(recorder):
+    reporter = TaskProgressReporter(flush_interval=3600)
+    reporter.report("t1", 0.1, "first")
+    assert recorder.updates == [("t1", {"progress_msg": "first", "progress": 0.1})]
+
+    reporter.report("t1", 0.4, "second")
+    reporter.report("t1", 0.2, "third")
+    reporter.report("t1", None, "")
+    assert len(recorder.updates) == 1
+
+    reporter.report("t1", 1.0, "done")
+    assert recorder.updates[-1] == ("t1", {"progress_msg": "second\nthird\ndone", "progress": 1.0})
+
+
+def test_forget_flushes_the_rest(recorder):
+    reporter = TaskProgressReporter(flush_interval=3600)
+    reporter.report("t1", 0.1, "first")
+    reporter.report("t1", None, "tail")
+    reporter.forget("t1")
+    assert recorder.updates[-1] == ("t1", {"progress_msg": "tail"})
+
+
+def test_cancel_flag_is_cached(recorder):
+    reporter = TaskProgressReporter(cancel_check_interval=3600)
+    assert not reporter.canceled("t1")
+    assert not reporter.canceled("t1")
+    assert recorder.cancel_checks == 1
+
+    reporter = TaskProgressReporter(cancel_check_interval=0)
+    recorder.cancel = True
+    assert reporter.canceled("t1")
+    recorder.cancel = False
+    assert reporter.canceled("t1")